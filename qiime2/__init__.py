@@ -10,6 +10,7 @@ from qiime2.sdk import Artifact, Visualization
 from qiime2.metadata import (Metadata, MetadataColumn,
                              CategoricalMetadataColumn, NumericMetadataColumn)
 from qiime2.plugin import Citations
+from qiime2.core.path import _sweep_orphans_from_environ
 from ._version import get_versions
 
 __version__ = get_versions()['version']
@@ -22,6 +23,10 @@ __release__ = '.'.join(__version__.split('.')[:2])
 __citations__ = tuple(Citations.load('citations.bib', package='qiime2'))
 __website__ = 'https://qiime2.org'
 
+# Clean up after crashed processes, if asked to (see QIIME2_SWEEP_ORPHANS).
+_sweep_orphans_from_environ()
+del _sweep_orphans_from_environ
+
 __all__ = ['Artifact', 'Visualization', 'Metadata', 'MetadataColumn',
            'CategoricalMetadataColumn', 'NumericMetadataColumn']
 
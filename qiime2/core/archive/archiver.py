@@ -13,11 +13,24 @@ import zipfile
 import importlib
 import os
 import io
+import threading
+import weakref
+import concurrent.futures
+import functools
+import shutil
+import tempfile
+import zlib
+import struct
+import random
 
 import qiime2
 import qiime2.core.cite as cite
 
-from qiime2.core.util import md5sum_directory, from_checksum_format
+from qiime2.core.archive import lineage
+from qiime2.core.archive.cache import ArchiveCache
+
+from qiime2.core.util import (checksum_directory, from_checksum_format,
+                              get_worker_count, iter_relpaths, transfer_file)
 
 _VERSION_TEMPLATE = """\
 QIIME 2
@@ -33,6 +46,169 @@ ChecksumDiff = collections.namedtuple(
     'ChecksumDiff', ['added', 'removed', 'changed'])
 
 
+# Members are deflated in blocks of this size, concurrently, like pigz does.
+_DEFLATE_BLOCK_SIZE = 4 * 1024 * 1024
+# Each block is primed with the end of the block before it (the size of the
+# deflate window), so splitting a member barely costs any compression.
+_DEFLATE_DICT_SIZE = 32 * 1024
+_CHUNK_SIZE = 1024 * 1024
+_DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+
+
+def _deflate_block(abspath, offset, compresslevel, last):
+    """Deflate one block of a file.
+
+    Returns the block and its raw deflate stream. Only the last block of a
+    file ends the stream, the others end on a byte boundary (a sync flush),
+    so the streams of every block concatenate into the member's data.
+
+    """
+    if compresslevel is None:
+        compresslevel = zlib.Z_DEFAULT_COMPRESSION
+
+    start = max(0, offset - _DEFLATE_DICT_SIZE)
+    with open(abspath, 'rb') as fh:
+        fh.seek(start)
+        zdict = fh.read(offset - start)
+        data = fh.read(_DEFLATE_BLOCK_SIZE)
+
+    # Negative window bits produce a raw deflate stream, as zip expects.
+    if zdict:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15,
+                                      zdict=zdict)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return data, compressed
+
+
+def _iter_block_offsets(abspath):
+    size = os.path.getsize(abspath)
+    count = max(1, -(-size // _DEFLATE_BLOCK_SIZE))
+    for index in range(count):
+        yield index * _DEFLATE_BLOCK_SIZE, index == count - 1
+
+
+# Files smaller than this are not worth probing.
+_PROBE_MIN_SIZE = 4 * 1024
+_PROBE_SIZE = 64 * 1024
+_PROBE_RATIO = 0.95
+
+
+def _is_incompressible(abspath):
+    """Guess whether a file is compressed already from its first block."""
+    if os.path.getsize(abspath) < _PROBE_MIN_SIZE:
+        return False
+    with open(abspath, 'rb') as fh:
+        block = fh.read(_PROBE_SIZE)
+    return len(zlib.compress(block, 1)) >= _PROBE_RATIO * len(block)
+
+
+class _DeflatedMember:
+    """A member of a zip opened for writing, whose blocks are deflated
+    elsewhere (see `_deflate_block`) and written in order.
+
+    `zipfile` has no public API for this, so this mirrors what
+    `ZipFile.open(..., mode='w')` does, minus the compression. The CRC and
+    sizes are only known at the end, so the local header is rewritten then,
+    or followed by a data descriptor when writing to an unseekable stream.
+
+    """
+    def __init__(self, zf, abspath, arcname):
+        self._zf = zf
+        self._zinfo = zipfile.ZipInfo.from_file(abspath, arcname)
+        self._zinfo.compress_type = zipfile.ZIP_DEFLATED
+        self._zip64 = self._zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        self._started = False
+
+    def _start(self):
+        zf, zinfo = self._zf, self._zinfo
+        zinfo.CRC = 0
+        zinfo.compress_size = 0
+        zinfo.file_size = 0
+        zinfo.flag_bits = 0x00 if zf._seekable else 0x08
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(self._zip64))
+        self._started = True
+
+    def write(self, data, compressed):
+        if not self._started:
+            self._start()
+        zinfo = self._zinfo
+        zinfo.CRC = zlib.crc32(data, zinfo.CRC)
+        zinfo.file_size += len(data)
+        zinfo.compress_size += len(compressed)
+        self._zf.fp.write(compressed)
+
+    def close(self):
+        zf, zinfo = self._zf, self._zinfo
+        if not self._zip64 and max(zinfo.file_size,
+                                   zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            raise RuntimeError("%s grew while it was being written."
+                               % zinfo.filename)
+
+        if zinfo.flag_bits & 0x08:
+            fmt = '<LLQQ' if self._zip64 else '<LLLL'
+            zf.fp.write(struct.pack(fmt, _DATA_DESCRIPTOR_SIGNATURE,
+                                    zinfo.CRC, zinfo.compress_size,
+                                    zinfo.file_size))
+        else:
+            end = zf.fp.tell()
+            zf.fp.seek(zinfo.header_offset)
+            zf.fp.write(zinfo.FileHeader(self._zip64))
+            zf.fp.seek(end)
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()
+
+
+class _StoredMember(io.RawIOBase):
+    """Seekable, read-only window onto an uncompressed member of a zip."""
+
+    def __init__(self, fh, offset, size):
+        self._fh = fh
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("Negative seek position %d." % offset)
+        self._position = offset
+        return self._position
+
+    def readinto(self, buffer):
+        remaining = self._size - self._position
+        if remaining <= 0:
+            return 0
+
+        view = memoryview(buffer)[:remaining]
+        self._fh.seek(self._offset + self._position)
+        read = self._fh.readinto(view)
+        self._position += read
+        return read
+
+    def close(self):
+        self._fh.close()
+        super().close()
+
+
 class _Archive:
     """Abstraction layer over the archive filesystem.
 
@@ -96,6 +272,10 @@ class _Archive:
         return ArchiveRecord(root_dir, version_fp, uuid, version,
                              framework_version)
 
+    # Whether `mount` serves the members where they are stored, instead of
+    # extracting them.
+    SERVED_IN_PLACE = False
+
     @classmethod
     def save(cls, source, destination):
         raise NotImplementedError
@@ -107,7 +287,7 @@ class _Archive:
         self.version, self.framework_version = self._get_versions()
 
     def _get_uuid(self):
-        if not self.path.exists():
+        if isinstance(self.path, pathlib.Path) and not self.path.exists():
             raise TypeError("%s does not exist or is not a filepath."
                             % self.path)
 
@@ -146,6 +326,9 @@ class _Archive:
     def relative_iterdir(self, relpath='.'):
         raise NotImplementedError
 
+    def iter_relpaths(self):
+        raise NotImplementedError
+
     def open(self, relpath):
         raise NotImplementedError
 
@@ -155,67 +338,325 @@ class _Archive:
 
 class _ZipArchive(_Archive):
     """A specific variant of Archive which deals with ZIP64 files."""
+    # Formats which are compressed already, deflating them again costs a lot
+    # of CPU for next to no space.
+    INCOMPRESSIBLE_SUFFIXES = (
+        '.gz', '.bz2', '.xz', '.zst', '.zip', '.qza', '.qzv', '.bam',
+        '.png', '.jpg', '.jpeg', '.gif', '.webp')
 
     @classmethod
     def is_archive_type(cls, path):
-        return zipfile.is_zipfile(str(path))
+        if not hasattr(path, 'read'):
+            path = str(path)
+        return zipfile.is_zipfile(path)
 
     @classmethod
-    def save(cls, source, destination):
-        with zipfile.ZipFile(str(destination), mode='w',
+    def save(cls, source, destination, compresslevel=None, workers=None,
+             store_suffixes=None, detect_incompressible=True):
+        """Write the archive found in `source` to `destination`.
+
+        `destination` may be a filepath or a writable binary file object.
+        The file object does not need to be seekable (e.g. a pipe or a
+        socket), in which case members whose size isn't known up front are
+        followed by a data descriptor, so the archive is written in a
+        single pass.
+
+        Members are deflated at `compresslevel` (zlib's default when not
+        provided), except for those which are already compressed: files
+        whose name ends with one of `store_suffixes` (by default
+        `INCOMPRESSIBLE_SUFFIXES`) and, if `detect_incompressible`, files
+        whose first block doesn't shrink when deflated. Those are stored
+        uncompressed, which the zip records per member so that they can be
+        read in place later (see `open_member`). When there is more than one
+        worker (see `qiime2.core.util.get_worker_count`), members are
+        deflated concurrently and then appended to the zip in order.
+
+        """
+        workers = get_worker_count(workers)
+        if store_suffixes is None:
+            store_suffixes = cls.INCOMPRESSIBLE_SUFFIXES
+        store_suffixes = tuple(suffix.lower() for suffix in store_suffixes)
+
+        if not hasattr(destination, 'write'):
+            destination = str(destination)
+
+        with zipfile.ZipFile(destination, mode='w',
                              compression=zipfile.ZIP_DEFLATED,
-                             allowZip64=True) as zf:
-            for root, dirs, files in os.walk(str(source)):
-                # Prune hidden directories from traversal. Strategy modified
-                # from http://stackoverflow.com/a/13454267/3776794
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                             allowZip64=True,
+                             compresslevel=compresslevel) as zf:
+            members = []
+            for abspath, arcname in cls._iter_save_members(source):
+                if (arcname.lower().endswith(store_suffixes)
+                        or (detect_incompressible
+                            and _is_incompressible(abspath))):
+                    compress_type = zipfile.ZIP_STORED
+                else:
+                    compress_type = zipfile.ZIP_DEFLATED
+                members.append((abspath, arcname, compress_type))
+
+            if workers <= 1:
+                for abspath, arcname, compress_type in members:
+                    zf.write(abspath, arcname=arcname,
+                             compress_type=compress_type)
+            else:
+                cls._save_concurrently(zf, members, compresslevel, workers)
+
+    @classmethod
+    def _iter_save_members(cls, source):
+        for root, dirs, files in os.walk(str(source)):
+            # Prune hidden directories from traversal. Strategy modified
+            # from http://stackoverflow.com/a/13454267/3776794
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
 
-                for file in files:
-                    if file.startswith('.'):
-                        continue
+            for file in files:
+                if file.startswith('.'):
+                    continue
+
+                abspath = pathlib.Path(root) / file
+                relpath = abspath.relative_to(source)
+
+                yield str(abspath), cls._as_zip_path(relpath)
+
+    @classmethod
+    def _save_concurrently(cls, zf, members, compresslevel, workers):
+        # Members are deflated a block at a time (see `_deflate_block`), and
+        # only `window` blocks are in flight, so memory use is bounded no
+        # matter how large the members are and nothing is spooled to disk.
+        window = 2 * workers
+        pending = collections.deque()
+
+        def append_next():
+            block, write = pending.popleft()
+            if block is None:
+                write()
+            else:
+                write(*block.result())
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for abspath, arcname, compress_type in members:
+                if compress_type == zipfile.ZIP_STORED:
+                    # Nothing to gain from a thread when there is nothing to
+                    # deflate, so this can be written in place.
+                    pending.append((None, functools.partial(
+                        zf.write, abspath, arcname=arcname,
+                        compress_type=zipfile.ZIP_STORED)))
+                else:
+                    member = _DeflatedMember(zf, abspath, arcname)
+                    for offset, last in _iter_block_offsets(abspath):
+                        pending.append((executor.submit(
+                            _deflate_block, abspath, offset, compresslevel,
+                            last), member.write))
+                        while len(pending) > window:
+                            append_next()
+                    pending.append((None, member.close))
+
+                while len(pending) > window:
+                    append_next()
+
+            while pending:
+                append_next()
 
-                    abspath = pathlib.Path(root) / file
-                    relpath = abspath.relative_to(source)
+    def __init__(self, path):
+        self._zipfile = None
+        self._members = None
+        self._tree = None
+        super().__init__(path)
 
-                    zf.write(str(abspath), arcname=cls._as_zip_path(relpath))
+    @property
+    def _is_shared(self):
+        # A file object can't be reopened, so every reader has to go through
+        # the one ZipFile wrapping it.
+        return hasattr(self.path, 'read')
+
+    def _open_raw(self):
+        if isinstance(self.path, bytes):
+            return io.BytesIO(self.path)
+        return open(str(self.path), 'rb')
+
+    def _open_zipfile(self):
+        # Independent handle for use from a worker thread, unless shared.
+        if self._is_shared:
+            return zipfile.ZipFile(self.path, mode='r')
+        elif isinstance(self.path, bytes):
+            return zipfile.ZipFile(self._open_raw(), mode='r')
+        return zipfile.ZipFile(str(self.path), mode='r')
+
+    def _get_zipfile(self):
+        # The central directory is parsed exactly once per archive, every
+        # lookup afterwards goes through the index built here.
+        if self._zipfile is None:
+            zf = self._open_zipfile()
+            weakref.finalize(self, zf.close)
+
+            members = collections.OrderedDict()
+            tree = collections.defaultdict(collections.OrderedDict)
+            for info in zf.infolist():
+                members[info.filename] = info
+                parts = info.filename.rstrip('/').split('/')
+                for idx, part in enumerate(parts):
+                    tree['/'.join(parts[:idx])][part] = None
+
+            self._members = members
+            self._tree = tree
+            self._zipfile = zf
+        return self._zipfile
+
+    def _iter_members(self, relpath='', recursive=True):
+        """Yield the ZipInfo of every member found at `relpath`.
+
+        `relpath` is relative to the archive root and may name a single file
+        or a directory. When `recursive` is False, only the members directly
+        inside of `relpath` are yielded.
+
+        """
+        self._get_zipfile()
+        prefix = self._as_zip_path(pathlib.PurePosixPath(str(self.uuid),
+                                                         relpath))
+        for name, info in self._members.items():
+            if name == prefix:
+                member = ''
+            elif name.startswith(prefix + '/'):
+                member = name[len(prefix) + 1:]
+            else:
+                continue
+
+            if not recursive and '/' in member.rstrip('/'):
+                continue
+            yield info
 
     def relative_iterdir(self, relpath=''):
+        self._get_zipfile()
         relpath = self._as_zip_path(relpath)
-        seen = set()
-        with zipfile.ZipFile(str(self.path), mode='r') as zf:
-            for name in zf.namelist():
-                if name.startswith(relpath):
-                    parts = pathlib.PurePosixPath(name).parts
-                    if len(parts) > 0:
-                        result = parts[0]
-                        if result not in seen:
-                            seen.add(result)
-                            yield result
+        yield from self._tree.get(relpath, ())
+
+    def iter_relpaths(self):
+        """Yield the path of every (non-hidden) file, relative to the
+        archive root, like `iter_relpaths` would once extracted.
+
+        Only the index is read, nothing is extracted.
+
+        """
+        prefix = str(self.uuid) + '/'
+        names = []
+        for info in self._iter_members():
+            name = info.filename[len(prefix):]
+            if info.is_dir() or not name:
+                continue
+            if any(part.startswith('.') for part in name.split('/')):
+                continue
+            names.append(name)
+        # The files of a directory (sorted) come before its subdirectories.
+        yield from sorted(names, key=lambda name: (name.split('/')[:-1],
+                                                   name))
 
     def open(self, relpath):
         relpath = pathlib.Path(str(self.uuid)) / relpath
-        with zipfile.ZipFile(str(self.path), mode='r') as zf:
-            # The filehandle will still work even when `zf` is "closed"
-            return io.TextIOWrapper(zf.open(self._as_zip_path(relpath)))
+        zf = self._get_zipfile()
+        return io.TextIOWrapper(zf.open(self._as_zip_path(relpath)))
 
-    def mount(self, filepath):
+    def open_member(self, relpath):
+        """Open a member (relative to the archive root) for binary reading.
+
+        Members which were stored without compression are read in place
+        from the archive, so seeking is cheap and nothing is inflated.
+
+        """
+        zf = self._get_zipfile()
+        info = zf.getinfo(self._as_zip_path(
+            pathlib.PurePosixPath(str(self.uuid), relpath)))
+
+        span = self.get_stored_span(info)
+        if span is None:
+            return zf.open(info)
+        return io.BufferedReader(_StoredMember(self._open_raw(), *span),
+                                 buffer_size=_CHUNK_SIZE)
+
+    def get_stored_span(self, info):
+        """Return the (offset, size) of a stored member's bytes.
+
+        This is None for members which are compressed, which can only be
+        read through `zipfile`, or when the archive is a file object. The
+        span may be used to `mmap` the member.
+
+        """
+        if (self._is_shared or info.compress_type != zipfile.ZIP_STORED
+                or info.flag_bits & 0x1):
+            return None
+
+        with self._open_raw() as fh:
+            fh.seek(info.header_offset)
+            header = fh.read(zipfile.sizeFileHeader)
+        if header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile("Bad magic number for member %r."
+                                     % info.filename)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        offset = (info.header_offset + zipfile.sizeFileHeader + name_length
+                  + extra_length)
+
+        return offset, info.file_size
+
+    def mount(self, filepath, lazy=False, workers=None, cache=None):
         # TODO: use FUSE/MacFUSE/Dokany bindings (many Python bindings are
         # outdated, we may need to take up maintenance/fork)
-        root = self.extract(filepath)
+        if lazy:
+            # Only the files at the top of the archive root (VERSION,
+            # metadata.yaml, etc.) are needed up front, everything else is
+            # extracted on demand by the Archiver.
+            root = self.extract(filepath, recursive=False)
+        elif cache is not None:
+            root = cache.mount(self, filepath, workers=workers)
+        else:
+            root = self.extract(filepath, workers=workers)
         return ArchiveRecord(root, root / self.VERSION_FILE,
                              self.uuid, self.version, self.framework_version)
 
-    def extract(self, filepath):
+    def extract(self, filepath, relpath='', recursive=True, workers=None):
+        """Extract the members found at `relpath` into `filepath`.
+
+        `relpath` is relative to the archive root and may name a single file
+        or a directory. When `recursive` is False, only the files directly
+        inside of `relpath` are extracted. Members are inflated across
+        `workers` threads (see `qiime2.core.util.get_worker_count`).
+
+        """
         filepath = pathlib.Path(filepath)
-        with zipfile.ZipFile(str(self.path), mode='r') as zf:
-            for name in zf.namelist():
-                if name.startswith(str(self.uuid)):
-                    # extract removes `..` components, so as long as we extract
-                    # into `filepath`, the path won't go backwards.
-                    zf.extract(name, path=str(filepath))
+        members = list(self._iter_members(relpath, recursive=recursive))
+        workers = min(get_worker_count(workers), len(members))
+
+        if workers <= 1 or self._is_shared:
+            self._extract_members(self._get_zipfile(), members, filepath)
+        else:
+            # ZipFile.extract creates missing parent directories itself, but
+            # not in a way that is safe to race, so do it ahead of time.
+            for info in members:
+                parent = pathlib.PurePosixPath(info.filename).parent
+                (filepath / parent).mkdir(parents=True, exist_ok=True)
+
+            # Balance the work by (uncompressed) size, largest first.
+            members.sort(key=lambda info: info.file_size, reverse=True)
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                futures = [
+                    executor.submit(self._extract_with_own_handle,
+                                    members[idx::workers], filepath)
+                    for idx in range(workers)]
+                for future in futures:
+                    future.result()
 
         return filepath / str(self.uuid)
 
+    def _extract_with_own_handle(self, members, filepath):
+        # zlib releases the GIL, but a single ZipFile serializes reads on its
+        # underlying file, so each worker gets a handle of its own.
+        with self._open_zipfile() as zf:
+            self._extract_members(zf, members, filepath)
+
+    @classmethod
+    def _extract_members(cls, zf, members, filepath):
+        for info in members:
+            # extract removes `..` components, so as long as we extract
+            # into `filepath`, the path won't go backwards.
+            zf.extract(info, path=str(filepath))
+
     @classmethod
     def _as_zip_path(self, path):
         path = str(pathlib.PurePosixPath(path))
@@ -227,9 +668,212 @@ class _ZipArchive(_Archive):
         return path
 
 
+class _DirectoryArchive(_Archive):
+    """A variant of Archive which is a plain, uncompressed directory.
+
+    The directory has the same layout as the inside of a zip archive, so
+    its members are served where they are stored, nothing is extracted::
+
+        <directory>/
+        !--- 770509e6-85f4-432c-9663-cdc04eb07db2
+            |--- VERSION
+            !--- <whatever format defines>
+
+    Served members are read-only: views of a loaded result are user owned,
+    so they are cloned or copied rather than moved, and nothing is ever
+    written into the directory. Members must be regular files and
+    directories, symbolic links are rejected rather than followed (they
+    could lead anywhere, including into another archive).
+
+    """
+    SERVED_IN_PLACE = True
+
+    @classmethod
+    def is_archive_type(cls, path):
+        if hasattr(path, 'read') or isinstance(path, bytes):
+            return False
+        path = pathlib.Path(path)
+        if not path.is_dir():
+            return False
+
+        roots = [p for p in path.iterdir() if not p.name.startswith('.')]
+        return (len(roots) == 1 and cls._is_uuid4(roots[0].name)
+                and (roots[0] / cls.VERSION_FILE).is_file())
+
+    @classmethod
+    def save(cls, source, destination, workers=None, **kwargs):
+        """Copy the archive found in `source` to the directory `destination`.
+
+        An existing directory archive at `destination` is replaced. Any
+        other `kwargs` (e.g. compression options) have no meaning for a
+        directory and are ignored.
+
+        """
+        if hasattr(destination, 'write'):
+            raise TypeError("A directory archive cannot be written to a file"
+                            " object.")
+        destination = pathlib.Path(destination)
+        if (destination.exists() and not cls.is_archive_type(destination)
+                and not (destination.is_dir()
+                         and not any(destination.iterdir()))):
+            raise FileExistsError("%s exists and is not a QIIME archive."
+                                  % destination)
+
+        # Copy next to the destination and swap it into place, so that a
+        # partially written archive is never visible at `destination`.
+        staging = pathlib.Path(tempfile.mkdtemp(
+            prefix='.%s.' % destination.name,
+            dir=str(destination.absolute().parent)))
+        try:
+            members = []
+            for abspath, arcname in _ZipArchive._iter_save_members(source):
+                dest = staging / 'new' / arcname
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                members.append((abspath, str(dest)))
+            cls._copy_members(members, shutil.copy2, workers)
+
+            if destination.exists():
+                os.rename(str(destination), str(staging / 'old'))
+            os.rename(str(staging / 'new'), str(destination))
+        finally:
+            shutil.rmtree(str(staging))
+
+    def _root(self, relpath=''):
+        return self.path / str(self.uuid) / relpath
+
+    def _member(self, relpath):
+        # The path of a member, refusing to follow symbolic links on the
+        # way there.
+        path = self._root()
+        self._check_not_symlink(path)
+        for part in pathlib.PurePath(relpath).parts:
+            path = path / part
+            self._check_not_symlink(path)
+        return path
+
+    @staticmethod
+    def _check_not_symlink(path):
+        if os.path.islink(str(path)):
+            raise ValueError("%s is a symbolic link. A directory archive may "
+                             "only contain regular files and directories."
+                             % path)
+
+    def _iter_files(self, relpath=''):
+        # Every file found at `relpath`, refusing symbolic links.
+        source = self._member(relpath)
+        if not source.is_dir():
+            yield source
+            return
+        for root, dirs, files in os.walk(str(source)):
+            for name in dirs + files:
+                self._check_not_symlink(os.path.join(root, name))
+            for file in files:
+                yield pathlib.Path(root) / file
+
+    def relative_iterdir(self, relpath=''):
+        try:
+            yield from sorted(os.listdir(str(self.path / relpath)))
+        except FileNotFoundError:
+            return
+
+    def iter_relpaths(self):
+        yield from iter_relpaths(str(self._root()))
+
+    def open(self, relpath):
+        return self._member(relpath).open()
+
+    def open_member(self, relpath):
+        """Open a member (relative to the archive root) for binary reading.
+
+        Members are read in place, nothing is copied.
+
+        """
+        try:
+            return self._member(relpath).open('rb')
+        except FileNotFoundError:
+            raise KeyError("There is no item named %r in the archive."
+                           % relpath)
+
+    def mount(self, filepath, lazy=False, workers=None, cache=None):
+        """Serve the members where they are stored, `filepath` is unused.
+
+        Every member is checked not to be a symbolic link, nothing is read
+        or copied.
+
+        """
+        for _ in self._iter_files():
+            pass
+        root = self._root().absolute()
+        return ArchiveRecord(root, root / self.VERSION_FILE,
+                             self.uuid, self.version, self.framework_version)
+
+    @staticmethod
+    def _transfer(src, dst):
+        # The directory belongs to the user, a hardlink would let changes
+        # made to the extracted files reach back into it (and vice versa).
+        transfer_file(src, dst,
+                      strategies=qiime2.core.path.OwnedPath
+                      .USER_OWNED_STRATEGIES)
+
+    def extract(self, filepath, relpath='', recursive=True, workers=None):
+        """Clone (or copy) the files found at `relpath` into `filepath`.
+
+        See `_ZipArchive.extract`.
+
+        """
+        filepath = pathlib.Path(filepath)
+        source = self._member(relpath)
+        dest = filepath / str(self.uuid) / relpath
+
+        if source.is_file():
+            paths = [(source, dest)]
+        elif recursive:
+            paths = [(abspath, dest / abspath.relative_to(source))
+                     for abspath in self._iter_files(relpath)]
+        else:
+            paths = []
+            for path in source.iterdir():
+                self._check_not_symlink(path)
+                if path.is_file():
+                    paths.append((path, dest / path.name))
+
+        if source.is_dir():
+            dest.mkdir(parents=True, exist_ok=True)
+        members = []
+        for abspath, destpath in paths:
+            destpath.parent.mkdir(parents=True, exist_ok=True)
+            if not destpath.exists():
+                members.append((str(abspath), str(destpath)))
+        self._copy_members(members, self._transfer, workers)
+
+        return filepath / str(self.uuid)
+
+    @classmethod
+    def _copy_members(cls, members, copy_function, workers):
+        workers = min(get_worker_count(workers), len(members))
+        if workers <= 1:
+            for src, dst in members:
+                copy_function(src, dst)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                for future in [executor.submit(copy_function, src, dst)
+                               for src, dst in members]:
+                    future.result()
+
+
+def _peek_one(archiver, filepath):
+    # Module level so that it can be sent to a process pool.
+    try:
+        return filepath, archiver.peek(filepath), None
+    except Exception as e:
+        return filepath, None, e
+
+
 class Archiver:
     CURRENT_FORMAT_VERSION = '5'
     CURRENT_ARCHIVE = _ZipArchive
+    CHECKSUM_LEVELS = ('structure', 'sample', 'full')
+    CHECKSUM_SAMPLE_SIZE = 10
     _FORMAT_REGISTRY = {
         # NOTE: add more archive formats as things change
         '0': 'qiime2.core.archive.format.v0:ArchiveFormat',
@@ -237,7 +881,8 @@ class Archiver:
         '2': 'qiime2.core.archive.format.v2:ArchiveFormat',
         '3': 'qiime2.core.archive.format.v3:ArchiveFormat',
         '4': 'qiime2.core.archive.format.v4:ArchiveFormat',
-        '5': 'qiime2.core.archive.format.v5:ArchiveFormat'
+        '5': 'qiime2.core.archive.format.v5:ArchiveFormat',
+        '6': 'qiime2.core.archive.format.v6:ArchiveFormat'
     }
 
     @classmethod
@@ -254,12 +899,31 @@ class Archiver:
 
     @classmethod
     def get_archive(cls, filepath):
+        """Open an archive from a filepath or from memory.
+
+        Besides a filepath, `filepath` may be the archive's contents as
+        `bytes`/`bytearray`/`memoryview`, or a readable, seekable binary file
+        object, which must remain open while the archive is in use.
+
+        """
+        if isinstance(filepath, (bytes, bytearray, memoryview)):
+            filepath = bytes(filepath)
+            if not zipfile.is_zipfile(io.BytesIO(filepath)):
+                raise ValueError("Buffer is not a QIIME archive.")
+            return _ZipArchive(filepath)
+        elif hasattr(filepath, 'read'):
+            if not _ZipArchive.is_archive_type(filepath):
+                raise ValueError("%r is not a QIIME archive." % filepath)
+            return _ZipArchive(filepath)
+
         filepath = pathlib.Path(filepath)
         if not filepath.exists():
             raise ValueError("%s does not exist." % filepath)
 
         if _ZipArchive.is_archive_type(filepath):
             archive = _ZipArchive(filepath)
+        elif _DirectoryArchive.is_archive_type(filepath):
+            archive = _DirectoryArchive(filepath)
         else:
             raise ValueError("%s is not a QIIME archive." % filepath)
 
@@ -267,6 +931,8 @@ class Archiver:
 
     @classmethod
     def _futuristic_archive_error(cls, filepath, archive):
+        if isinstance(filepath, (bytes, bytearray, memoryview)):
+            filepath = 'Buffer'
         raise ValueError("%s was created by 'QIIME %s'. The currently"
                          " installed framework cannot interpret archive"
                          " version %r."
@@ -287,24 +953,100 @@ class Archiver:
         return Format.load_metadata(archive)
 
     @classmethod
-    def extract(cls, filepath, dest):
+    def peek_many(cls, filepaths, workers=None, processes=False):
+        """Peek at many archives concurrently.
+
+        Yields ``(filepath, metadata, error)`` as each archive is read, in
+        order of completion, where `metadata` is what `peek` returns and
+        `error` is the exception raised by `peek`, one of which is None.
+        Archives are read across `workers` threads (see
+        `qiime2.core.util.get_worker_count`), or processes if `processes` is
+        True, which avoids contending for the GIL while parsing YAML.
+
+        """
+        workers = get_worker_count(workers)
+        if processes:
+            executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+        # Keep a bounded number of archives in flight, `filepaths` may be a
+        # lazy iterable over a very large store.
+        window = 4 * workers
+        filepaths = iter(filepaths)
+        pending = set()
+        with executor:
+            while True:
+                for filepath in filepaths:
+                    pending.add(executor.submit(_peek_one, cls, filepath))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    @classmethod
+    def peek_provenance(cls, filepath):
+        """Open the `ProvenanceGraph` of an archive without loading it.
+
+        Provenance members are read straight from the archive when they are
+        needed, the data is never read and nothing is written to the
+        filesystem. `filepath` may be anything `get_archive` accepts. Returns
+        None for archive versions without provenance.
+
+        """
+        archive = cls.get_archive(filepath)
+        Format = cls.get_format_class(archive.version)
+        if Format is None:
+            cls._futuristic_archive_error(filepath, archive)
+
+        provenance_dir = getattr(Format, 'PROVENANCE_DIR', None)
+        if provenance_dir is None:
+            return None
+        return lineage.ProvenanceGraph(
+            lambda member: archive.open_member(
+                pathlib.PurePosixPath(provenance_dir, member)),
+            archive.uuid)
+
+    @classmethod
+    def extract(cls, filepath, dest, workers=None):
         archive = cls.get_archive(filepath)
         # Format really doesn't matter, the archive knows how to extract so
         # that is sufficient, furthermore it would suck if something was wrong
         # with an archive's format and extract failed to actually extract.
-        return str(archive.extract(dest))
+        return str(archive.extract(dest, workers=workers))
 
     @classmethod
-    def load(cls, filepath):
+    def load(cls, filepath, lazy=False, workers=None, cache=None):
+        """Load an archive into a new temporary directory.
+
+        Unless the archive is loaded lazily, it is extracted through `cache`
+        (an `ArchiveCache`). If not provided, the cache configured by the
+        QIIME2_ARCHIVE_CACHE environment variable is used, if any. Pass
+        False to bypass the cache. A directory archive is neither extracted
+        nor cached, its members are served where they are stored.
+
+        """
         archive = cls.get_archive(filepath)
         Format = cls.get_format_class(archive.version)
         if Format is None:
             cls._futuristic_archive_error(filepath, archive)
 
+        if cache is None:
+            cache = ArchiveCache.from_environ()
+
         path = cls._make_temp_path()
-        rec = archive.mount(path)
+        rec = archive.mount(path, lazy=lazy, workers=workers,
+                            cache=cache or None)
+        # Members which are served in place are on disk already.
+        lazy = lazy and not archive.SERVED_IN_PLACE
 
-        return cls(path, Format(rec))
+        return cls(path, Format(rec), archive=archive if lazy else None,
+                   workers=workers)
 
     @classmethod
     def from_data(cls, type, format, data_initializer, provenance_capture):
@@ -317,9 +1059,64 @@ class Archiver:
 
         return cls(path, Format(rec))
 
-    def __init__(self, path, fmt):
+    def __init__(self, path, fmt, archive=None, workers=None):
         self.path = path
         self._fmt = fmt
+        # When loaded lazily, `archive` is the source of every member which
+        # has not been extracted into `path` yet.
+        self._archive = archive
+        self._materialized = set()
+        self._workers = workers
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The source archive may not be available to whoever unpickles this
+        # object, so finish extracting before letting go of it.
+        self.materialize()
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def materialize(self, relpath=''):
+        """Ensure `relpath` exists on disk and return its absolute path.
+
+        `relpath` is relative to the archive root and may name a single file
+        or a directory. This is a no-op unless the archive was loaded lazily,
+        in which case the corresponding members are extracted on first use.
+
+        """
+        relpath = _ZipArchive._as_zip_path(relpath)
+        with self._lock:
+            if (self._archive is not None
+                    and not self._is_materialized(relpath)):
+                self._archive.extract(self.path, relpath,
+                                      workers=self._workers)
+                self._materialized.add(relpath)
+                if relpath == '':
+                    # Everything is on disk now, the archive isn't needed.
+                    self._archive = None
+
+        return self._fmt.path / relpath
+
+    def _iter_relpaths(self):
+        with self._lock:
+            archive = self._archive
+        if archive is None:
+            return list(iter_relpaths(str(self._fmt.path)))
+        return list(archive.iter_relpaths())
+
+    def _is_materialized(self, relpath):
+        for done in self._materialized:
+            if relpath == done or relpath.startswith(done + '/'):
+                return True
+        return False
+
+    def _materialize_dir(self, path):
+        return self.materialize(path.relative_to(self._fmt.path))
 
     @property
     def uuid(self):
@@ -335,38 +1132,142 @@ class Archiver:
 
     @property
     def data_dir(self):
-        return self._fmt.data_dir
+        return self._materialize_dir(self._fmt.data_dir)
 
     @property
     def root_dir(self):
-        return self._fmt.path
+        return self.materialize()
 
     @property
     def provenance_dir(self):
-        return getattr(self._fmt, 'provenance_dir', None)
+        provenance_dir = getattr(self._fmt, 'provenance_dir', None)
+        if provenance_dir is None:
+            return None
+        return self._materialize_dir(provenance_dir)
 
     @property
     def citations(self):
+        # Accessing `provenance_dir` ensures the files backing the citations
+        # are on disk.
+        if self.provenance_dir is None:
+            return cite.Citations()
         return getattr(self._fmt, 'citations', cite.Citations())
 
-    def save(self, filepath):
-        self.CURRENT_ARCHIVE.save(self.path, filepath)
+    @property
+    def provenance(self):
+        """The `ProvenanceGraph` of the archive, or None without provenance.
+
+        Provenance is read in place, a lazily loaded archive is not
+        extracted.
 
-    def validate_checksums(self):
-        if not isinstance(self._fmt, self.get_format_class('5')):
+        """
+        provenance_dir = getattr(self._fmt, 'provenance_dir', None)
+        if provenance_dir is None:
+            return None
+        relpath = provenance_dir.relative_to(self._fmt.path)
+        return lineage.ProvenanceGraph(
+            lambda member: self.open_member(relpath / member), self.uuid)
+
+    def open_member(self, relpath):
+        """Open a file (relative to the archive root) for binary reading.
+
+        Files of a lazily loaded archive are read straight from the archive
+        until they are extracted, see `_ZipArchive.open_member`.
+
+        """
+        relpath = _ZipArchive._as_zip_path(relpath)
+        with self._lock:
+            if (self._archive is not None
+                    and not self._is_materialized(relpath)):
+                return self._archive.open_member(relpath)
+        return (self._fmt.path / relpath).open('rb')
+
+    def save(self, filepath, compresslevel=None, workers=None,
+             store_suffixes=None, detect_incompressible=True,
+             as_directory=False):
+        self.materialize()
+        archive = _DirectoryArchive if as_directory else self.CURRENT_ARCHIVE
+        # The root may be served from elsewhere than `path`, see
+        # `_DirectoryArchive`.
+        archive.save(
+            self._fmt.path.parent, filepath, compresslevel=compresslevel,
+            workers=workers, store_suffixes=store_suffixes,
+            detect_incompressible=detect_incompressible)
+
+    def validate_checksums(self, level='full', paths=None):
+        """Compare the archive's files with its recorded checksums.
+
+        `level` is one of `CHECKSUM_LEVELS`:
+
+        - ``'structure'``: only compare the list of files, nothing is hashed
+          (the checksums of unrecognized files are None).
+        - ``'sample'``: also hash a random sample of `CHECKSUM_SAMPLE_SIZE`
+          recorded files.
+        - ``'full'``: hash every file.
+
+        `paths` may restrict validation to some files or directories
+        (relative to the archive root, e.g. the files a transformer is about
+        to read). Only those are extracted from a lazily loaded archive.
+
+        """
+        if level not in self.CHECKSUM_LEVELS:
+            raise ValueError("Checksum validation level must be one of %s,"
+                             " not %r." % (', '.join(self.CHECKSUM_LEVELS),
+                                           level))
+
+        checksum_file = getattr(self._fmt, 'checksum_file', None)
+        if checksum_file is None:
+            # Archives predating version 5 don't have checksums.
             return ChecksumDiff({}, {}, {})
 
-        obs = dict(x for x in md5sum_directory(str(self.root_dir)).items()
-                   if x[0] != self._fmt.CHECKSUM_FILE)
-        exp = dict(from_checksum_format(line) for line in
-                   (self.root_dir / self._fmt.CHECKSUM_FILE).open().readlines()
-                   )
-        obs_keys = set(obs)
+        # Only the files which are hashed are extracted from a lazily loaded
+        # archive, the others are listed from its index.
+        if paths is None:
+            prefixes = None
+        else:
+            prefixes = [_ZipArchive._as_zip_path(path) for path in paths]
+        root = self._fmt.path
+
+        def is_selected(relpath):
+            if relpath == checksum_file:
+                return False
+            if prefixes is None:
+                return True
+            relpath = pathlib.PurePath(relpath).as_posix()
+            return any(prefix in ('', relpath)
+                       or relpath.startswith(prefix + '/')
+                       for prefix in prefixes)
+
+        with self.materialize(checksum_file).open() as fh:
+            exp = dict(from_checksum_format(line) for line in fh)
+        exp = {x: exp[x] for x in exp if is_selected(x)}
+        present = [x for x in self._iter_relpaths() if is_selected(x)]
+
+        obs_keys = set(present)
         exp_keys = set(exp)
+        shared = [x for x in present if x in exp_keys]
+        if level == 'structure':
+            to_hash = []
+        elif level == 'sample':
+            to_hash = random.sample(
+                shared, min(self.CHECKSUM_SAMPLE_SIZE, len(shared)))
+        else:
+            to_hash = shared
+        if level != 'structure':
+            to_hash += [x for x in present if x not in exp_keys]
+
+        if prefixes is None and level == 'full':
+            self.materialize()
+        else:
+            for relpath in to_hash:
+                self.materialize(relpath)
+        obs = checksum_directory(str(root),
+                                 algorithm=self._fmt.checksum_algorithm,
+                                 workers=self._workers, relpaths=to_hash)
 
-        added = {x: obs[x] for x in obs_keys - exp_keys}
+        added = {x: obs.get(x) for x in obs_keys - exp_keys}
         removed = {x: exp[x] for x in exp_keys - obs_keys}
-        changed = {x: (exp[x], obs[x]) for x in exp_keys & obs_keys
+        changed = {x: (exp[x], obs[x]) for x in exp_keys & set(obs)
                    if exp[x] != obs[x]}
 
         return ChecksumDiff(added=added, removed=removed, changed=changed)
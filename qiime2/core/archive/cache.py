@@ -0,0 +1,279 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2021, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import time
+import shutil
+import hashlib
+import pathlib
+import tempfile
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from qiime2.core.util import transfer_tree
+
+
+class ArchiveCache:
+    """Size-bounded, on-disk cache of extracted archives.
+
+    Entries are keyed by the archive's UUID and the MD5 of its checksum
+    file (or of its zip index for archives predating checksums), so an
+    archive which was modified in place is extracted again. Loading a
+    cached archive hardlinks the cached tree into the archive's temporary
+    directory (falling back to reflinks or copies, see `transfer_tree`).
+    Like the ancestry shared between provenance captures, cached files keep
+    their modes: the files of a result are never modified, and exported or
+    saved copies of them must not come out read-only.
+
+    Entries are evicted least recently used first once the cache is larger
+    than `max_size` bytes. The cache may be shared by concurrent processes,
+    entries are guarded by lock files which are removed along with them.
+    Eviction runs after an entry was added, and otherwise at most once every
+    `EVICT_INTERVAL` seconds (entries added by other processes).
+
+    Example filesystem::
+
+        <cache root>/
+        |--- .evict.lock
+        |--- .<uuid>-<digest>.lock
+        !--- <uuid>-<digest>/
+            |--- .size
+            !--- <uuid>/
+                !--- <extracted archive>
+
+    """
+    ROOT_ENV = 'QIIME2_ARCHIVE_CACHE'
+    SIZE_ENV = 'QIIME2_ARCHIVE_CACHE_SIZE'
+    DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+    CHECKSUM_PREFIX = 'checksums.'
+    SIZE_FILE = '.size'
+    EVICT_LOCK = '.evict.lock'
+    EVICT_INTERVAL = 60
+    TRANSFER_STRATEGIES = ('hardlink', 'reflink', 'copy')
+    # Work in progress, named `<prefix><key>.<random>`. Left behind by
+    # processes which were killed, and swept by `evict`.
+    STAGING_PREFIX = '.staging-'
+    TRASH_PREFIX = '.trash-'
+
+    _from_environ = {}
+
+    @classmethod
+    def from_environ(cls):
+        """The cache configured by QIIME2_ARCHIVE_CACHE, if any.
+
+        QIIME2_ARCHIVE_CACHE is the root directory of the cache and
+        QIIME2_ARCHIVE_CACHE_SIZE its maximum size in bytes (10 GiB if not
+        set). Returns None when QIIME2_ARCHIVE_CACHE isn't set. The cache is
+        only set up once per process for a given root and size.
+
+        """
+        root = os.environ.get(cls.ROOT_ENV)
+        if not root:
+            return None
+
+        max_size = os.environ.get(cls.SIZE_ENV)
+        if max_size is not None:
+            try:
+                max_size = int(max_size)
+            except ValueError:
+                raise ValueError("%s must be an integer number of bytes, not "
+                                 "%r." % (cls.SIZE_ENV, max_size))
+
+        cache = cls._from_environ.get((root, max_size))
+        if cache is None or not cache.root.is_dir():
+            cache = cls._from_environ[(root, max_size)] = cls(
+                root, max_size=max_size)
+        return cache
+
+    def __init__(self, root, max_size=None):
+        if fcntl is None:  # pragma: no cover
+            raise OSError("The archive cache requires POSIX file locking.")
+
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        if max_size is None:
+            max_size = self.DEFAULT_MAX_SIZE
+        self.max_size = max_size
+        self._last_evict = None
+
+    def get_key(self, archive):
+        """Identify the contents of `archive`."""
+        md5 = hashlib.md5()
+        checksum_files = [name for name in
+                          archive.relative_iterdir(str(archive.uuid))
+                          if name.startswith(self.CHECKSUM_PREFIX)]
+        if checksum_files:
+            # checksums.md5, or checksums.<algorithm> as of format 6.
+            with archive.open_member(min(checksum_files)) as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                    md5.update(chunk)
+        else:
+            # No checksums (format < 5), the zip's own CRCs will do.
+            for info in archive._iter_members():
+                md5.update(('%s %08x %d\n' % (info.filename, info.CRC,
+                                              info.file_size)).encode())
+
+        return '%s-%s' % (archive.uuid, md5.hexdigest())
+
+    def mount(self, archive, filepath, workers=None):
+        """Populate `filepath` with the archive's root, using the cache.
+
+        Returns the path to the archive's root inside of `filepath`.
+
+        """
+        key = self.get_key(archive)
+        entry = self.root / key
+        root = pathlib.Path(filepath) / str(archive.uuid)
+
+        with self._lock(self._lock_path(key)):
+            populated = not entry.exists()
+            if populated:
+                self._populate(archive, entry, workers)
+            # The mtime of an entry tracks when it was last used.
+            os.utime(str(entry))
+            transfer_tree(entry / str(archive.uuid), root,
+                          strategies=self.TRANSFER_STRATEGIES)
+
+        # Using an entry doesn't grow the cache, so there is no need to scan
+        # it every time.
+        if (populated or self._last_evict is None
+                or time.monotonic() - self._last_evict >= self.EVICT_INTERVAL):
+            self.evict()
+        return root
+
+    def _lock_path(self, key):
+        return self.root / ('.%s.lock' % key)
+
+    def _populate(self, archive, entry, workers):
+        staging = pathlib.Path(tempfile.mkdtemp(
+            prefix='%s%s.' % (self.STAGING_PREFIX, entry.name),
+            dir=str(self.root)))
+        try:
+            archive.extract(staging, workers=workers)
+
+            size = 0
+            for info in archive._iter_members():
+                size += info.file_size
+            (staging / self.SIZE_FILE).write_text(str(size))
+
+            os.rename(str(staging), str(entry))
+        finally:
+            if staging.exists():
+                shutil.rmtree(str(staging), ignore_errors=True)
+
+    def evict(self):
+        """Remove least recently used entries until within `max_size`.
+
+        Anything left behind by processes which were killed while using the
+        cache is removed as well.
+
+        """
+        self._last_evict = time.monotonic()
+        with self._lock(self.root / self.EVICT_LOCK,
+                        blocking=False) as acquired:
+            if not acquired:
+                # Somebody else is already on it.
+                return
+
+            entries = []
+            for entry in self.root.iterdir():
+                if entry.name.startswith('.'):
+                    self._sweep(entry)
+                    continue
+                if not entry.is_dir():
+                    continue
+                try:
+                    size = int((entry / self.SIZE_FILE).read_text())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except (OSError, ValueError):
+                    continue
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.max_size:
+                    break
+                with self._lock(self._lock_path(entry.name),
+                                blocking=False) as acquired:
+                    # Entries which are in use are skipped.
+                    if acquired:
+                        self._remove(entry)
+                        total -= size
+
+    def _sweep(self, path):
+        # Staging and trash directories are only in use while the lock of
+        # their entry is held, and a lock is only needed while its entry
+        # exists or is being populated.
+        name = path.name
+        if name.startswith((self.STAGING_PREFIX, self.TRASH_PREFIX)):
+            key = name.split('-', 1)[1].rpartition('.')[0]
+        elif name.endswith('.lock') and name != self.EVICT_LOCK:
+            key = name[1:-len('.lock')]
+        else:
+            return
+
+        lock = self._lock_path(key)
+        if path == lock and (self.root / key).exists():
+            return
+        with self._lock(lock, blocking=False) as acquired:
+            if not acquired:
+                return
+            if path != lock:
+                shutil.rmtree(str(path), ignore_errors=True)
+            if not (self.root / key).exists():
+                self._unlink(lock)
+
+    def _remove(self, entry):
+        # The lock of `entry` must be held.
+        trash = pathlib.Path(tempfile.mkdtemp(
+            prefix='%s%s.' % (self.TRASH_PREFIX, entry.name),
+            dir=str(self.root)))
+        # Renaming first means a partially deleted entry is never visible.
+        os.rename(str(entry), str(trash / entry.name))
+        shutil.rmtree(str(trash))
+        self._unlink(self._lock_path(entry.name))
+
+    def _unlink(self, path):
+        try:
+            os.unlink(str(path))
+        except FileNotFoundError:
+            pass
+
+    @contextlib.contextmanager
+    def _lock(self, path, blocking=True):
+        # A lock file may be unlinked (see `_remove`) while somebody is
+        # waiting on it, in which case that lock no longer guards anything
+        # and the (new) file has to be locked instead.
+        while True:
+            with open(str(path), 'a') as fh:
+                flags = fcntl.LOCK_EX
+                if not blocking:
+                    flags |= fcntl.LOCK_NB
+                try:
+                    fcntl.flock(fh.fileno(), flags)
+                except BlockingIOError:
+                    yield False
+                    return
+
+                try:
+                    current = os.stat(str(path))
+                except FileNotFoundError:
+                    current = None
+                if (current is None or current.st_ino
+                        != os.fstat(fh.fileno()).st_ino):
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                    continue
+
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                return
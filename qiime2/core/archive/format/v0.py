@@ -12,9 +12,11 @@ import uuid as _uuid
 import yaml
 
 import qiime2.sdk as sdk
+from qiime2.core.util import (YAMLDumper, YAMLSafeLoader,
+                              add_yaml_representer)
 
 # Allow OrderedDict to be serialized for YAML representation
-yaml.add_representer(collections.OrderedDict, lambda dumper, data:
+add_yaml_representer(collections.OrderedDict, lambda dumper, data:
                      dumper.represent_dict(data.items()))
 
 
@@ -24,7 +26,7 @@ class ArchiveFormat:
 
     @classmethod
     def _parse_metadata(self, fh, expected_uuid):
-        metadata = yaml.safe_load(fh)
+        metadata = yaml.load(fh, Loader=YAMLSafeLoader)
         if metadata['uuid'] != str(expected_uuid):
             raise ValueError(
                 "Archive root directory must match UUID present in archive's"
@@ -41,7 +43,8 @@ class ArchiveFormat:
         if format is not None:
             metadata['format'] = format.__name__
 
-        fh.write(yaml.dump(metadata, default_flow_style=False))
+        fh.write(yaml.dump(metadata, default_flow_style=False,
+                           Dumper=YAMLDumper))
 
     @classmethod
     def load_metadata(self, archive):
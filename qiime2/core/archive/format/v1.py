@@ -11,6 +11,8 @@ import qiime2.core.archive.format.v0 as v0
 
 class ArchiveFormat(v0.ArchiveFormat):
     PROVENANCE_DIR = 'provenance'
+    # Whether `provenance/index.json` is written, see `ProvenanceGraph`.
+    LINEAGE_INDEX = False
 
     @classmethod
     def write(cls, archive_record, type, format, data_initializer,
@@ -23,7 +25,8 @@ class ArchiveFormat(v0.ArchiveFormat):
         prov_dir.mkdir()
 
         provenance_capture.finalize(
-            prov_dir, [root / cls.METADATA_FILE, archive_record.version_fp])
+            prov_dir, [root / cls.METADATA_FILE, archive_record.version_fp],
+            uuid=archive_record.uuid if cls.LINEAGE_INDEX else None)
 
     def __init__(self, archive_record):
         super().__init__(archive_record)
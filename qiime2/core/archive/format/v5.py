@@ -6,12 +6,16 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+
 import qiime2.core.archive.format.v4 as v4
-from qiime2.core.util import md5sum_directory, to_checksum_format
+from qiime2.core.util import (checksum_directory, get_fingerprint,
+                              to_checksum_format)
 
 
 class ArchiveFormat(v4.ArchiveFormat):
     CHECKSUM_FILE = 'checksums.md5'
+    CHECKSUM_ALGORITHM = 'md5'
     # Adds `checksums.md5` to root of directory structure
 
     @classmethod
@@ -20,8 +24,52 @@ class ArchiveFormat(v4.ArchiveFormat):
         super().write(archive_record, type, format, data_initializer,
                       provenance_capture)
 
-        checksums = md5sum_directory(str(archive_record.root))
-        with (archive_record.root / cls.CHECKSUM_FILE).open('w') as fh:
+        algorithm = cls._get_write_algorithm()
+        known = None
+        if algorithm == 'md5':
+            # Files which were moved into the data directory without being
+            # rewritten keep the checksums they were given upstream.
+            known = {os.path.join(cls.DATA_DIR, relpath): known for relpath,
+                     known in provenance_capture.data_checksums.items()}
+            known.update(
+                (os.path.join(cls.PROVENANCE_DIR, relpath), entry)
+                for relpath, entry in
+                provenance_capture.ancestor_checksums.items())
+        checksums = checksum_directory(str(archive_record.root),
+                                       algorithm=algorithm, known=known)
+        if algorithm == 'md5':
+            cls._remember_ancestor_checksums(archive_record.root, checksums,
+                                             provenance_capture)
+
+        checksum_file = cls._get_checksum_file(algorithm)
+        with (archive_record.root / checksum_file).open('w') as fh:
             for item in checksums.items():
                 fh.write(to_checksum_format(*item))
                 fh.write('\n')
+
+    @classmethod
+    def _remember_ancestor_checksums(cls, root, checksums,
+                                     provenance_capture):
+        # The other outputs of the action share the same ancestry (see
+        # `ProvenanceCapture.fork`), so they can skip hashing it again.
+        prefix = os.path.join(cls.PROVENANCE_DIR,
+                              provenance_capture.ANCESTOR_DIR, '')
+        for relpath, checksum in checksums.items():
+            if relpath.startswith(prefix):
+                provenance_capture.ancestor_checksums[
+                    os.path.relpath(relpath, cls.PROVENANCE_DIR)] = (
+                        get_fingerprint(root / relpath), checksum)
+
+    @classmethod
+    def _get_write_algorithm(cls):
+        return cls.CHECKSUM_ALGORITHM
+
+    @classmethod
+    def _get_checksum_file(cls, algorithm):
+        return cls.CHECKSUM_FILE
+
+    def __init__(self, archive_record):
+        super().__init__(archive_record)
+
+        self.checksum_algorithm = self.CHECKSUM_ALGORITHM
+        self.checksum_file = self.CHECKSUM_FILE
@@ -0,0 +1,52 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2021, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import qiime2.core.archive.format.v5 as v5
+from qiime2.core.util import CHECKSUM_ALGORITHMS
+
+
+class ArchiveFormat(v5.ArchiveFormat):
+    CHECKSUM_PREFIX = 'checksums.'
+    CHECKSUM_ALGORITHM = 'blake2b-tree'
+    ALGORITHM_ENV = 'QIIME2_CHECKSUM_ALGORITHM'
+    LINEAGE_INDEX = True
+    # - Replaces `checksums.md5` with `checksums.<algorithm>`, recording the
+    #   digest algorithm in the archive (see `CHECKSUM_ALGORITHMS`). New
+    #   archives use the algorithm named by the QIIME2_CHECKSUM_ALGORITHM
+    #   environment variable, or `blake2b-tree` by default.
+    # - Adds `provenance/index.json`, the lineage of the whole provenance
+    #   DAG (see `ProvenanceGraph`), when every ancestor has one.
+
+    @classmethod
+    def _get_write_algorithm(cls):
+        algorithm = os.environ.get(cls.ALGORITHM_ENV, cls.CHECKSUM_ALGORITHM)
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ValueError("%s must be one of %s, not %r."
+                             % (cls.ALGORITHM_ENV,
+                                ', '.join(CHECKSUM_ALGORITHMS), algorithm))
+        return algorithm
+
+    @classmethod
+    def _get_checksum_file(cls, algorithm):
+        return cls.CHECKSUM_PREFIX + algorithm
+
+    def __init__(self, archive_record):
+        super().__init__(archive_record)
+
+        checksum_files = [p.name for p in self.path.iterdir()
+                          if p.name.startswith(self.CHECKSUM_PREFIX)]
+        if len(checksum_files) != 1:
+            raise ValueError("Archive must contain exactly one %s<algorithm>"
+                             " file, found: %r"
+                             % (self.CHECKSUM_PREFIX, checksum_files))
+
+        self.checksum_file, = checksum_files
+        self.checksum_algorithm = \
+            self.checksum_file[len(self.CHECKSUM_PREFIX):]
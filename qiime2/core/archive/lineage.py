@@ -0,0 +1,298 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2021, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import io
+import collections
+import json
+
+import yaml
+
+from qiime2.core.cite import Citations
+from qiime2.core.archive.provenance import (ProvenanceCapture,
+                                            ProvenanceLoader,
+                                            make_lineage_record)
+
+
+ACTION_YAML = '/'.join([ProvenanceCapture.ACTION_DIR,
+                        ProvenanceCapture.ACTION_FILE])
+
+
+def _as_ordered_dict(section):
+    # See `provenance._iter_entries`.
+    if section is None:
+        return collections.OrderedDict()
+    if isinstance(section, dict):
+        return collections.OrderedDict(section)
+    return collections.OrderedDict(
+        item for entry in section for item in entry.items())
+
+
+class ProvenanceNode:
+    """A result recorded in provenance, and the action which created it.
+
+    `type` (e.g. ``'method'`` or ``'import'``), `plugin`, `plugin_version`,
+    `action`, `output_name` and `parents` come from the lineage index when
+    the archive has one. The node's action.yaml is only parsed when it is
+    actually needed, e.g. for `parameters`.
+
+    """
+    def __init__(self, graph, uuid, record=None):
+        self._graph = graph
+        self.uuid = uuid
+        self._record = record
+        self._action_yaml = None
+
+    def __repr__(self):
+        return '<%s %s: %s>' % (type(self).__name__, self.uuid,
+                                ':'.join(str(x) for x in (
+                                    self.type, self.plugin, self.action)
+                                    if x is not None))
+
+    def open(self, relpath):
+        """Open a file of this node's provenance for binary reading.
+
+        `relpath` is relative to the node's directory, e.g.
+        ``'action/metadata.tsv'``. Raises KeyError if there is no such file.
+
+        """
+        try:
+            return self._graph._open_node_member(self.uuid, relpath)
+        except FileNotFoundError:
+            raise KeyError(relpath)
+
+    @property
+    def action_yaml(self):
+        """The parsed action.yaml of this node."""
+        if self._action_yaml is None:
+            with self.open(ACTION_YAML) as fh:
+                self._action_yaml = yaml.load(fh, Loader=ProvenanceLoader)
+        return self._action_yaml
+
+    @property
+    def citations(self):
+        """The citations recorded by this node (none before archive v4)."""
+        try:
+            fh = self.open(ProvenanceCapture.CITATION_FILE)
+        except KeyError:
+            return Citations()
+        with io.TextIOWrapper(fh, encoding='utf-8') as fh:
+            return Citations.load(fh)
+
+    @property
+    def _lineage_record(self):
+        if self._record is None:
+            environment = self.action_yaml.get('environment') or {}
+            self._record = make_lineage_record(
+                self.action_yaml['action'], environment.get('plugins') or {})
+        return self._record
+
+    @property
+    def type(self):
+        return self._lineage_record['type']
+
+    @property
+    def plugin(self):
+        return self._lineage_record['plugin']
+
+    @property
+    def plugin_version(self):
+        return self._lineage_record['plugin-version']
+
+    @property
+    def action(self):
+        return self._lineage_record['action']
+
+    @property
+    def output_name(self):
+        return self._lineage_record['output-name']
+
+    @property
+    def parents(self):
+        """UUIDs of the results this one was created from."""
+        return tuple(self._lineage_record['parents'])
+
+    @property
+    def children(self):
+        """UUIDs of the results in the graph created from this one."""
+        return self._graph.children(self.uuid)
+
+    @property
+    def inputs(self):
+        return _as_ordered_dict(self.action_yaml['action'].get('inputs'))
+
+    @property
+    def parameters(self):
+        return _as_ordered_dict(self.action_yaml['action'].get('parameters'))
+
+
+class ProvenanceGraph:
+    """The provenance of an archive, as a DAG of `ProvenanceNode` by UUID.
+
+    The graph is read lazily. Archives written with a lineage index (see
+    `ProvenanceCapture.write_index`) give the UUID, action and parents of
+    every node in a single read. Otherwise a node's action.yaml is parsed
+    the first time its parents (or other details) are needed.
+
+    Parameters
+    ----------
+    open_member : callable
+        Opens a file, given its path relative to the provenance directory,
+        for binary reading. Must raise KeyError or FileNotFoundError when
+        there is no such file.
+    uuid : str or uuid.UUID
+        UUID of the archive the provenance belongs to.
+
+    Examples
+    --------
+    Which actions a result descends from:
+
+    >>> graph = artifact.provenance  # doctest: +SKIP
+    >>> {graph[uuid].action for uuid in graph.ancestors()
+    ...  if uuid in graph}  # doctest: +SKIP
+
+    """
+    def __init__(self, open_member, uuid):
+        self._open_member = open_member
+        self.uuid = str(uuid)
+        self._nodes = {}
+        self._children = None
+        self._index = self._read_index()
+
+    def __repr__(self):
+        return '<%s of %s>' % (type(self).__name__, self.uuid)
+
+    def _read_index(self):
+        try:
+            fh = self._open_member(ProvenanceCapture.INDEX_FILE)
+        except (KeyError, FileNotFoundError):
+            return None
+        with fh:
+            index = json.loads(fh.read().decode('utf-8'))
+        if index.get('root') != self.uuid:
+            return None
+        return index['nodes']
+
+    def _open_node_member(self, uuid, relpath):
+        if uuid != self.uuid:
+            relpath = '/'.join([ProvenanceCapture.ANCESTOR_DIR, uuid,
+                                relpath])
+        return self._open_member(relpath)
+
+    @property
+    def has_index(self):
+        return self._index is not None
+
+    @property
+    def root(self):
+        """The node of the archive itself."""
+        return self[self.uuid]
+
+    def __getitem__(self, uuid):
+        uuid = str(uuid)
+        try:
+            return self._nodes[uuid]
+        except KeyError:
+            pass
+
+        if self._index is not None:
+            node = ProvenanceNode(self, uuid, self._index[uuid])
+        else:
+            try:
+                self._open_node_member(uuid, ACTION_YAML).close()
+            except (KeyError, FileNotFoundError):
+                raise KeyError(uuid)
+            node = ProvenanceNode(self, uuid)
+        self._nodes[uuid] = node
+        return node
+
+    def __contains__(self, uuid):
+        try:
+            self[uuid]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        # Only UUIDs with a node, parents without one (e.g. results without
+        # provenance) are listed by `ProvenanceNode.parents` alone.
+        if self._index is not None:
+            yield from self._index
+        else:
+            yield self.uuid
+            for uuid in self._walk(self.uuid, lambda node: node.parents):
+                if uuid in self:
+                    yield uuid
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def _walk(self, uuid, step):
+        # Breadth first, each UUID once. UUIDs without a node (e.g. results
+        # without provenance) are yielded but not followed.
+        seen = {uuid}
+        queue = collections.deque([uuid])
+        while queue:
+            current = queue.popleft()
+            if current not in self:
+                continue
+            for next_ in step(self[current]):
+                if next_ not in seen:
+                    seen.add(next_)
+                    queue.append(next_)
+                    yield next_
+
+    def ancestors(self, uuid=None):
+        """UUIDs of every result `uuid` (the archive by default) came from.
+
+        Only the action.yaml of the ancestors themselves is parsed when there
+        is no lineage index.
+
+        """
+        return set(self._walk(str(uuid or self.uuid),
+                              lambda node: node.parents))
+
+    def children(self, uuid):
+        if self._children is None:
+            children = collections.defaultdict(list)
+            for node_uuid in self:
+                for parent in self[node_uuid].parents:
+                    children[parent].append(node_uuid)
+            self._children = children
+        return tuple(self._children.get(str(uuid), ()))
+
+    def descendants(self, uuid):
+        """UUIDs of every result in the graph which came from `uuid`."""
+        return set(self._walk(str(uuid),
+                              lambda node: self.children(node.uuid)))
+
+    @property
+    def citations(self):
+        """The citations of every node, see `ProvenanceNode.citations`."""
+        # Parsing BibTeX is slow, and most nodes of a graph record the same
+        # citations, so each distinct file is only parsed once.
+        citations = Citations()
+        seen = set()
+        for uuid in self:
+            try:
+                fh = self[uuid].open(ProvenanceCapture.CITATION_FILE)
+            except KeyError:
+                continue
+            with fh:
+                content = fh.read()
+            if content not in seen:
+                seen.add(content)
+                citations.update(
+                    Citations.load(io.StringIO(content.decode('utf-8'))))
+        return citations
+
+    def imports(self, uuid=None):
+        """UUIDs of the imported results `uuid` (the archive by default)
+        ultimately came from."""
+        uuid = str(uuid or self.uuid)
+        return {x for x in self.ancestors(uuid) | {uuid}
+                if x in self and self[x].type == 'import'}
@@ -7,6 +7,8 @@
 # ----------------------------------------------------------------------------
 
 import os
+import json
+import errno
 import time
 import collections
 import collections.abc
@@ -17,7 +19,6 @@ import shutil
 import sys
 from datetime import datetime, timezone
 
-import distutils
 import yaml
 import tzlocal
 import dateutil.relativedelta as relativedelta
@@ -49,63 +50,196 @@ class OrderedKeyValue(collections.OrderedDict):
     pass
 
 
+# The tagged scalars below are quoted explicitly, as the pure-Python emitter
+# always has, so that libyaml's emitter (see `util.YAMLDumper`) writes the
+# same provenance.
+
 # Used for yaml that looks like:
 #   - key1: value1
 #   - key2: value2
-yaml.add_representer(OrderedKeyValue, lambda dumper, data:
-                     dumper.represent_list([
-                        {k: v} for k, v in data.items()]))
+util.add_yaml_representer(OrderedKeyValue, lambda dumper, data:
+                          dumper.represent_list([
+                             {k: v} for k, v in data.items()]))
 
 
 # Controlling the order of dictionaries (even if semantically irrelevant) is
 # important to making it look nice.
-yaml.add_representer(collections.OrderedDict, lambda dumper, data:
-                     dumper.represent_dict(data.items()))
+util.add_yaml_representer(collections.OrderedDict, lambda dumper, data:
+                          dumper.represent_dict(data.items()))
 
 
 # YAML libraries aren't good at writing a clean version of this, and typically
 # the fact that it is a set is irrelevant to tools that use provenance
 # so add a custom tag and treat it like a sequence. Then code doesn't need to
 # special case set vs list in their business logic when it isn't important.
-yaml.add_representer(set, lambda dumper, data:
-                     dumper.represent_sequence('!set', data))
+util.add_yaml_representer(set, lambda dumper, data:
+                          dumper.represent_sequence('!set', data))
 
 
 # LiteralString uses the | character and has literal newlines
-yaml.add_representer(LiteralString, lambda dumper, data:
-                     dumper.represent_scalar('tag:yaml.org,2002:str',
-                                             data.string, style='|'))
+util.add_yaml_representer(LiteralString, lambda dumper, data:
+                          dumper.represent_scalar('tag:yaml.org,2002:str',
+                                                  data.string, style='|'))
 
 
 # Make our timestamps pretty (unquoted).
-yaml.add_representer(datetime, lambda dumper, data:
-                     dumper.represent_scalar('tag:yaml.org,2002:timestamp',
-                                             data.isoformat()))
+util.add_yaml_representer(datetime, lambda dumper, data:
+                          dumper.represent_scalar(
+                              'tag:yaml.org,2002:timestamp',
+                              data.isoformat()))
 
 
 # Forward reference to something else in the document, namespaces are
 # delimited by colons (:).
-yaml.add_representer(ForwardRef, lambda dumper, data:
-                     dumper.represent_scalar('!ref', data.reference))
+util.add_yaml_representer(ForwardRef, lambda dumper, data:
+                          dumper.represent_scalar('!ref', data.reference,
+                                                  style="'"))
 
 
 # This tag represents an artifact without provenance, this is to support
 # archive format v0. Ideally this won't be seen in the wild in practice.
-yaml.add_representer(NoProvenance, lambda dumper, data:
-                     dumper.represent_scalar('!no-provenance', str(data.uuid)))
+util.add_yaml_representer(NoProvenance, lambda dumper, data:
+                          dumper.represent_scalar('!no-provenance',
+                                                  str(data.uuid), style="'"))
 
 
 # A reference to Metadata and MetadataColumn whose data can be found at the
 # relative path indicated as its value
-yaml.add_representer(MetadataPath, lambda dumper, data:
-                     dumper.represent_scalar('!metadata', data.path))
+util.add_yaml_representer(MetadataPath, lambda dumper, data:
+                          dumper.represent_scalar('!metadata', data.path,
+                                                  style="'"))
 
 # A color primitive.
-yaml.add_representer(ColorPrimitive, lambda dumper, data:
-                     dumper.represent_scalar('!color', data.hex))
+util.add_yaml_representer(ColorPrimitive, lambda dumper, data:
+                          dumper.represent_scalar('!color', data.hex,
+                                                  style="'"))
+
+util.add_yaml_representer(CitationKey, lambda dumper, data:
+                          dumper.represent_scalar('!cite', data.key,
+                                                  style="'"))
+
+
+class ProvenanceLoader(util.YAMLSafeLoader):
+    """Loads provenance YAML, understanding the tags written above."""
+
+
+ProvenanceLoader.add_constructor('!ref', lambda loader, node:
+                                 ForwardRef(loader.construct_scalar(node)))
+ProvenanceLoader.add_constructor('!no-provenance', lambda loader, node:
+                                 NoProvenance(loader.construct_scalar(node)))
+ProvenanceLoader.add_constructor('!metadata', lambda loader, node:
+                                 MetadataPath(loader.construct_scalar(node)))
+ProvenanceLoader.add_constructor('!color', lambda loader, node:
+                                 ColorPrimitive(loader.construct_scalar(node)))
+ProvenanceLoader.add_constructor('!cite', lambda loader, node:
+                                 CitationKey(loader.construct_scalar(node)))
+ProvenanceLoader.add_constructor('!set', lambda loader, node:
+                                 set(loader.construct_sequence(node)))
+
+
+def _iter_entries(section):
+    # Sections are mappings in memory, and lists of single entry mappings
+    # once written (see `OrderedKeyValue`).
+    if section is None:
+        return
+    if isinstance(section, collections.abc.Mapping):
+        yield from section.values()
+    else:
+        for entry in section:
+            yield from entry.values()
+
+
+def get_lineage_parents(action):
+    """The UUIDs of the artifacts an action section refers to.
+
+    These are the action's inputs, the artifacts viewed as metadata
+    parameters and, for pipelines, the artifact which was aliased.
+
+    """
+    parents = []
+
+    def add(value):
+        if isinstance(value, NoProvenance):
+            value = value.uuid
+        value = str(value)
+        if value not in parents:
+            parents.append(value)
+
+    for value in _iter_entries(action.get('inputs')):
+        if value is None:
+            continue
+        elif isinstance(value, (list, set)):
+            if isinstance(value, set):
+                value = sorted(value, key=str)
+            for item in value:
+                add(item)
+        else:
+            add(value)
+
+    for value in _iter_entries(action.get('parameters')):
+        if isinstance(value, MetadataPath) and ':' in value.path:
+            for uuid_ in value.path.split(':', 1)[0].split(','):
+                add(uuid_)
+
+    if action.get('alias-of') is not None:
+        add(action['alias-of'])
+
+    return parents
+
+
+def make_lineage_record(action, plugins):
+    """Summarize an action section for the lineage index.
+
+    `plugins` is the ``environment: plugins`` section the action refers to.
+
+    """
+    plugin = action.get('plugin')
+    if isinstance(plugin, ForwardRef):
+        plugin = plugin.reference.rsplit(':', 1)[-1]
+    version = None
+    if plugin is not None:
+        version = plugins.get(plugin, {}).get('version')
+
+    record = collections.OrderedDict()
+    record['type'] = action.get('type')
+    record['plugin'] = plugin
+    record['plugin-version'] = version
+    record['action'] = action.get('action')
+    record['output-name'] = action.get('output-name')
+    record['parents'] = get_lineage_parents(action)
+    return record
+
+
+class _EnvironmentCache:
+    """Parts of the environment section which are the same for every capture.
+
+    They are computed and serialized once per process, and again only if
+    the working set of Python packages changes.
+
+    """
+    def __init__(self):
+        self._working_set = None
+        self._entries = {}
+
+    def _invalidate(self, dist=None):
+        self._entries.clear()
+
+    def get(self, name, factory):
+        working_set = pkg_resources.working_set
+        if working_set is not self._working_set:
+            self._invalidate()
+            self._working_set = working_set
+            # Called whenever a distribution is added to the working set.
+            working_set.subscribe(self._invalidate, existing=False)
+
+        try:
+            return self._entries[name]
+        except KeyError:
+            value = self._entries[name] = factory()
+            return value
+
 
-yaml.add_representer(CitationKey, lambda dumper, data:
-                     dumper.represent_scalar('!cite', data.key))
+_environment = _EnvironmentCache()
 
 
 class ProvenanceCapture:
@@ -113,6 +247,8 @@ class ProvenanceCapture:
     ACTION_DIR = 'action'
     ACTION_FILE = 'action.yaml'
     CITATION_FILE = 'citations.bib'
+    INDEX_FILE = 'index.json'
+    SHARE_STRATEGIES = ('hardlink', 'reflink', 'copy')
 
     def __init__(self):
         self.start = time.time()
@@ -126,6 +262,26 @@ class ProvenanceCapture:
         self.transformers = collections.OrderedDict()
         self.citations = Citations()
         self._framework_citations = []
+        # Checksums of files in the data directory which are known ahead of
+        # time, as {relpath: (fingerprint, md5sum)}. See `md5sum_directory`.
+        self.data_checksums = {}
+        # Lineage records of every ancestor, keyed by UUID, which are written
+        # to the index file. None once an ancestor without an index (one
+        # written by an older framework) is added, as the index would be
+        # incomplete.
+        self._lineage = collections.OrderedDict()
+        # Provenance directories of every ancestor, keyed by UUID. They are
+        # only linked into place by `finalize`, so the outputs of an action
+        # (see `fork`) share them rather than each staging the ancestry.
+        self._ancestors = collections.OrderedDict()
+        # The artifacts owning the directories above, which must not be
+        # cleaned up before then.
+        self._ancestor_artifacts = []
+        # Checksums of the ancestry's files, as {relpath: (fingerprint,
+        # md5sum)} relative to the provenance directory. This is shared by
+        # every fork, the ancestry is hardlinked into each output so it only
+        # needs to be hashed once. See `md5sum_directory`.
+        self.ancestor_checksums = {}
 
         for idx, citation in enumerate(qiime2.__citations__):
             citation_key = self.make_citation_key('framework')
@@ -147,6 +303,13 @@ class ProvenanceCapture:
         self.action_dir = self.path / self.ACTION_DIR
         self.action_dir.mkdir()
 
+    @classmethod
+    def _share_file(cls, src, dst):
+        # Provenance files are never modified once written, so every
+        # artifact recording them can share the same file. They are only
+        # copied for real when an archive is saved.
+        util.transfer_file(src, dst, strategies=cls.SHARE_STRATEGIES)
+
     def add_ancestor(self, artifact):
         other_path = artifact._archiver.provenance_dir
         if other_path is None:
@@ -159,25 +322,45 @@ class ProvenanceCapture:
             # contain an artifact UUID that is not in the artifacts/ directory.
             return NoProvenance(artifact.uuid)
 
-        destination = self.ancestor_dir / str(artifact.uuid)
-        # If it exists, then the artifact is already in the provenance
+        # If it is known, then the artifact is already in the provenance
         # (and so are its ancestors)
-        if not destination.exists():
+        if str(artifact.uuid) not in self._ancestors:
             # Handle root node of ancestor
-            shutil.copytree(
-                str(other_path), str(destination),
-                ignore=shutil.ignore_patterns(self.ANCESTOR_DIR + '*'))
+            self._ancestors[str(artifact.uuid)] = other_path
+            self._ancestor_artifacts.append(artifact)
+            self._add_lineage(other_path / self.INDEX_FILE)
 
             # Handle ancestral nodes of ancestor
             grandcestor_path = other_path / self.ANCESTOR_DIR
             if grandcestor_path.exists():
                 for grandcestor in grandcestor_path.iterdir():
-                    destination = self.ancestor_dir / grandcestor.name
-                    if not destination.exists():
-                        shutil.copytree(str(grandcestor), str(destination))
+                    self._ancestors.setdefault(grandcestor.name, grandcestor)
 
         return str(artifact.uuid)
 
+    def write_ancestors(self):
+        # Only the ancestor's own node is needed from its root, the rest of
+        # its ancestry is recorded separately.
+        def ignore(directory, names):
+            if directory not in roots:
+                return []
+            return [name for name in names
+                    if name in (self.ANCESTOR_DIR, self.INDEX_FILE)]
+
+        roots = {str(source) for source in self._ancestors.values()}
+        for uuid_, source in self._ancestors.items():
+            shutil.copytree(str(source), str(self.ancestor_dir / uuid_),
+                            ignore=ignore, copy_function=self._share_file)
+
+    def _add_lineage(self, index_fp):
+        if self._lineage is None:
+            return
+        try:
+            with index_fp.open() as fh:
+                self._lineage.update(json.load(fh)['nodes'])
+        except FileNotFoundError:
+            self._lineage = None
+
     def make_citation_key(self, domain, package=None, identifier=None,
                           index=0):
         if domain == 'framework':
@@ -212,8 +395,9 @@ class ProvenanceCapture:
         return ForwardRef('environment:plugins:' + plugin.name)
 
     def capture_env(self):
-        return collections.OrderedDict(
-            (d.project_name, d.version) for d in pkg_resources.working_set)
+        return _environment.get('python-packages', lambda: (
+            collections.OrderedDict((d.project_name, d.version)
+                                    for d in pkg_resources.working_set)))
 
     def transformation_recorder(self, name):
         section = self.transformers[name] = []
@@ -276,7 +460,7 @@ class ProvenanceCapture:
             transformers['output'] = output
         return transformers
 
-    def make_env_section(self):
+    def _make_runtime_env(self):
         env = collections.OrderedDict()
         env['platform'] = pkg_resources.get_build_platform()
         # There is a trailing whitespace in sys.version, strip so that YAML can
@@ -285,13 +469,40 @@ class ProvenanceCapture:
                                       sys.version.split('\n')))
         env['framework'] = self.make_software_entry(
             qiime2.__version__, qiime2.__website__, self._framework_citations)
+        return env
+
+    def make_env_section(self):
+        env = self._make_runtime_env()
         env['plugins'] = self.plugins
         env['python-packages'] = self.capture_env()
 
         return env
 
+    def dump_env_section(self, **settings):
+        """YAML of ``{'environment': self.make_env_section()}``.
+
+        Only the plugins differ between captures, the rest of the section is
+        serialized once and spliced in as-is.
+
+        """
+        def dump_entries(env):
+            # Drop the leading `environment:` so entries can be concatenated.
+            return yaml.dump({'environment': env}, **settings).split(
+                '\n', 1)[1]
+
+        key = ('yaml', tuple(sorted(settings.items())))
+        head, packages = _environment.get(key, lambda: (
+            'environment:\n' + dump_entries(self._make_runtime_env()),
+            dump_entries(collections.OrderedDict(
+                [('python-packages', self.capture_env())]))))
+        plugins = dump_entries(collections.OrderedDict(
+            [('plugins', self.plugins)]))
+
+        return head + plugins + packages
+
     def write_action_yaml(self):
-        settings = dict(default_flow_style=False, indent=4)
+        settings = dict(default_flow_style=False, indent=4,
+                        Dumper=util.YAMLDumper)
         with (self.action_dir / self.ACTION_FILE).open(mode='w') as fh:
             fh.write(yaml.dump({'execution': self.make_execution_section()},
                                **settings))
@@ -304,28 +515,51 @@ class ProvenanceCapture:
                     {'transformers': self.make_transformers_section()},
                     **settings))
             fh.write('\n')
-            fh.write(yaml.dump({'environment': self.make_env_section()},
-                               **settings))
+            fh.write(self.dump_env_section(**settings))
 
     def write_citations_bib(self):
         self.citations.save(str(self.path / self.CITATION_FILE))
 
-    def finalize(self, final_path, node_members):
+    def write_index(self, uuid):
+        """Write the lineage of the artifact `uuid`, see `ProvenanceGraph`.
+
+        Nothing is written when the lineage of an ancestor is unknown.
+
+        """
+        if self._lineage is None:
+            return
+
+        nodes = self._lineage.copy()
+        nodes[str(uuid)] = make_lineage_record(self.make_action_section(),
+                                               self.plugins)
+        with (self.path / self.INDEX_FILE).open(mode='w') as fh:
+            json.dump({'root': str(uuid), 'nodes': nodes}, fh,
+                      separators=(',', ':'))
+
+    def finalize(self, final_path, node_members, uuid=None):
         self.end = time.time()
 
         for member in node_members:
             shutil.copy(str(member), str(self.path))
 
+        self.write_ancestors()
         self.write_action_yaml()
         self.write_citations_bib()
+        if uuid is not None:
+            self.write_index(uuid)
 
-        # Certain networked filesystems will experience a race
-        # condition on `rename`, so fall back to copying.
+        # Certain networked filesystems will experience a race condition on
+        # `rename`, and a rename can't cross devices (the provenance and
+        # archive temporary roots may be on different filesystems), so fall
+        # back to transferring each file.
         try:
             os.rename(self.path, final_path)
-        except FileExistsError:
-            distutils.dir_util.copy_tree(str(self.path), str(final_path))
-            distutils.dir_util.remove_tree(str(self.path))
+        except OSError as e:
+            if not isinstance(e, FileExistsError) and e.errno != errno.EXDEV:
+                raise
+            util.transfer_tree(self.path, final_path,
+                               strategies=self.SHARE_STRATEGIES)
+            self.path._destructor()
 
     def fork(self):
         forked = copy.copy(self)
@@ -333,10 +567,18 @@ class ProvenanceCapture:
         forked.plugins = forked.plugins.copy()
         forked.transformers = forked.transformers.copy()
         forked.citations = forked.citations.copy()
+        forked.data_checksums = {}
+        if forked._lineage is not None:
+            forked._lineage = forked._lineage.copy()
+        forked._ancestors = forked._ancestors.copy()
+        forked._ancestor_artifacts = forked._ancestor_artifacts.copy()
+        # `ancestor_checksums` is shared on purpose.
         # create a copy of the backing dir so factory (the hard stuff is
-        # mostly done by this point)
+        # mostly done by this point). The ancestry isn't staged yet, so this
+        # is only the files of the action itself, e.g. its metadata.
         forked._build_paths()
-        distutils.dir_util.copy_tree(str(self.path), str(forked.path))
+        util.transfer_tree(self.path, forked.path,
+                           strategies=self.SHARE_STRATEGIES)
 
         return forked
 
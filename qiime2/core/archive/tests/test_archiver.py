@@ -7,12 +7,17 @@
 # ----------------------------------------------------------------------------
 
 import os
+import shutil
 import tempfile
+import threading
 import unittest
+import unittest.mock
 import uuid
 import zipfile
 import pathlib
 
+import qiime2
+import qiime2.core.archive.archiver as archiver_module
 from qiime2.core.archive import Archiver
 from qiime2.core.archive import ImportProvenanceCapture
 from qiime2.core.archive.archiver import _ZipArchive
@@ -20,6 +25,8 @@ from qiime2.core.archive.format.util import artifact_version
 from qiime2.core.testing.format import IntSequenceDirectoryFormat
 from qiime2.core.testing.type import IntSequence1
 from qiime2.core.testing.util import ArchiveTestingMixin
+from qiime2.core import util
+from qiime2.core.util import md5sum_directory
 
 
 class TestArchiver(unittest.TestCase, ArchiveTestingMixin):
@@ -117,6 +124,185 @@ class TestArchiver(unittest.TestCase, ArchiveTestingMixin):
 
         self.assertArchiveMembers(fp, root_dir, expected)
 
+    def test_save_concurrently(self):
+        def data_initializer(data_dir):
+            for idx in range(20):
+                with (data_dir / ('%d.txt' % idx)).open('w') as fh:
+                    fh.write('%d\n' % idx * 1000)
+
+        archiver = Archiver.from_data(
+            IntSequence1, IntSequenceDirectoryFormat,
+            data_initializer=data_initializer,
+            provenance_capture=ImportProvenanceCapture())
+        serial_fp = os.path.join(self.temp_dir.name, 'serial.zip')
+        parallel_fp = os.path.join(self.temp_dir.name, 'parallel.zip')
+
+        archiver.save(serial_fp, workers=1)
+        archiver.save(parallel_fp, workers=4)
+
+        with zipfile.ZipFile(serial_fp) as serial, \
+                zipfile.ZipFile(parallel_fp) as parallel:
+            self.assertIsNone(parallel.testzip())
+            self.assertEqual(serial.namelist(), parallel.namelist())
+            for exp, obs in zip(serial.infolist(), parallel.infolist()):
+                self.assertEqual(exp.CRC, obs.CRC)
+                self.assertEqual(exp.file_size, obs.file_size)
+                self.assertEqual(exp.compress_type, obs.compress_type)
+                self.assertEqual(serial.read(exp), parallel.read(obs))
+
+        loaded = Archiver.load(parallel_fp)
+        self.assertEqual(loaded.validate_checksums(), ({}, {}, {}))
+
+    def test_save_concurrently_in_blocks(self):
+        contents = {'empty.txt': b'',
+                    'small.txt': b'1\n' * 10,
+                    'large.txt': b''.join(b'%d\n' % i for i in range(5000))}
+
+        def data_initializer(data_dir):
+            for name, content in contents.items():
+                (data_dir / name).write_bytes(content)
+
+        archiver = Archiver.from_data(
+            IntSequence1, IntSequenceDirectoryFormat,
+            data_initializer=data_initializer,
+            provenance_capture=ImportProvenanceCapture())
+        root_dir = str(archiver.uuid)
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        stream_fp = os.path.join(self.temp_dir.name, 'stream.zip')
+
+        with unittest.mock.patch.object(archiver_module,
+                                        '_DEFLATE_BLOCK_SIZE', 1000), \
+                unittest.mock.patch.object(
+                    tempfile, 'SpooledTemporaryFile',
+                    side_effect=AssertionError('nothing is spooled')):
+            archiver.save(fp, workers=3)
+
+            read_fd, write_fd = os.pipe()
+            with open(read_fd, 'rb') as reader, \
+                    open(stream_fp, 'wb') as out:
+                drain = threading.Thread(
+                    target=shutil.copyfileobj, args=(reader, out))
+                drain.start()
+                with open(write_fd, 'wb') as writer:
+                    archiver.save(writer, workers=3)
+                drain.join()
+
+        for path in (fp, stream_fp):
+            with zipfile.ZipFile(path) as zf:
+                self.assertIsNone(zf.testzip())
+                for name, content in contents.items():
+                    name = root_dir + '/data/' + name
+                    self.assertEqual(zf.read(name), content)
+                    self.assertEqual(zf.getinfo(name).compress_type,
+                                     zipfile.ZIP_DEFLATED)
+            self.assertEqual(Archiver.load(path).validate_checksums(),
+                             ({}, {}, {}))
+
+    def test_save_compression_options(self):
+        def data_initializer(data_dir):
+            for name in ('ints.txt', 'ints.txt.gz'):
+                with (data_dir / name).open('w') as fh:
+                    fh.write('1\n' * 1000)
+
+        archiver = Archiver.from_data(
+            IntSequence1, IntSequenceDirectoryFormat,
+            data_initializer=data_initializer,
+            provenance_capture=ImportProvenanceCapture())
+        root_dir = str(archiver.uuid)
+
+        for workers in (1, 2):
+            fast_fp = os.path.join(self.temp_dir.name, 'fast.zip')
+            best_fp = os.path.join(self.temp_dir.name, 'best.zip')
+            archiver.save(fast_fp, compresslevel=0, workers=workers,
+                          store_suffixes=['.GZ'])
+            archiver.save(best_fp, compresslevel=9, workers=workers,
+                          store_suffixes=())
+
+            with zipfile.ZipFile(fast_fp) as fast, \
+                    zipfile.ZipFile(best_fp) as best:
+                for name in ('data/ints.txt', 'data/ints.txt.gz'):
+                    name = root_dir + '/' + name
+                    self.assertEqual(fast.read(name), best.read(name))
+                    self.assertGreater(fast.getinfo(name).compress_size,
+                                       best.getinfo(name).compress_size)
+
+                gz = root_dir + '/data/ints.txt.gz'
+                self.assertEqual(fast.getinfo(gz).compress_type,
+                                 zipfile.ZIP_STORED)
+                self.assertEqual(best.getinfo(gz).compress_type,
+                                 zipfile.ZIP_DEFLATED)
+
+    def test_save_stores_incompressible_members(self):
+        random_bytes = os.urandom(100 * 1024)
+
+        def data_initializer(data_dir):
+            with (data_dir / 'ints.txt').open('w') as fh:
+                fh.write('1\n' * 10000)
+            with (data_dir / 'seqs.fastq.gz').open('wb') as fh:
+                fh.write(b'not actually gzipped, but named like it')
+            with (data_dir / 'random.bin').open('wb') as fh:
+                fh.write(random_bytes)
+
+        archiver = Archiver.from_data(
+            IntSequence1, IntSequenceDirectoryFormat,
+            data_initializer=data_initializer,
+            provenance_capture=ImportProvenanceCapture())
+        root_dir = str(archiver.uuid)
+
+        for workers in (1, 2):
+            fp = os.path.join(self.temp_dir.name, 'archive.zip')
+            archiver.save(fp, workers=workers)
+            with zipfile.ZipFile(fp) as zf:
+                compress_types = {
+                    name: zf.getinfo(root_dir + '/data/' + name).compress_type
+                    for name in ('ints.txt', 'seqs.fastq.gz', 'random.bin')}
+            self.assertEqual(compress_types,
+                             {'ints.txt': zipfile.ZIP_DEFLATED,
+                              'seqs.fastq.gz': zipfile.ZIP_STORED,
+                              'random.bin': zipfile.ZIP_STORED})
+
+        archiver.save(fp, detect_incompressible=False)
+        with zipfile.ZipFile(fp) as zf:
+            self.assertEqual(
+                zf.getinfo(root_dir + '/data/random.bin').compress_type,
+                zipfile.ZIP_DEFLATED)
+
+        archive = _ZipArchive(pathlib.Path(fp))
+        with archive.open_member('data/random.bin') as fh:
+            self.assertEqual(fh.read(), random_bytes)
+
+        archiver.save(fp)
+        archive = _ZipArchive(pathlib.Path(fp))
+        info = archive._get_zipfile().getinfo(root_dir + '/data/random.bin')
+        offset, size = archive.get_stored_span(info)
+        self.assertEqual(size, len(random_bytes))
+        with open(fp, 'rb') as fh:
+            fh.seek(offset)
+            self.assertEqual(fh.read(size), random_bytes)
+
+        with archive.open_member('data/random.bin') as fh:
+            self.assertEqual(fh.read(10), random_bytes[:10])
+            fh.seek(-10, os.SEEK_END)
+            self.assertEqual(fh.read(), random_bytes[-10:])
+            fh.seek(5000)
+            self.assertEqual(fh.read(10), random_bytes[5000:5010])
+            self.assertEqual(fh.tell(), 5010)
+
+    def test_load_lazy_open_member(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+        archiver = Archiver.load(fp, lazy=True)
+        root = archiver.path / str(self.archiver.uuid)
+
+        with archiver.open_member('data/ints.txt') as fh:
+            self.assertEqual(fh.read(), b'1\n2\n3\n')
+        self.assertFalse((root / 'data').exists())
+
+        archiver.data_dir
+        with archiver.open_member('data/ints.txt') as fh:
+            self.assertEqual(fh.name, str(root / 'data' / 'ints.txt'))
+            self.assertEqual(fh.read(), b'1\n2\n3\n')
+
     def test_load_archive(self):
         fp = os.path.join(self.temp_dir.name, 'archive.zip')
         self.archiver.save(fp)
@@ -130,6 +316,90 @@ class TestArchiver(unittest.TestCase, ArchiveTestingMixin):
                           for p in archiver.data_dir.iterdir()},
                          {'ints.txt'})
 
+    def test_load_lazy_archive(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+
+        archiver = Archiver.load(fp, lazy=True)
+
+        root = archiver.path / str(self.archiver.uuid)
+        self.assertTrue((root / 'VERSION').exists())
+        self.assertTrue((root / 'metadata.yaml').exists())
+        self.assertFalse((root / 'data').exists())
+        self.assertFalse((root / 'provenance').exists())
+
+        self.assertEqual(archiver.uuid, self.archiver.uuid)
+        self.assertEqual(archiver.type, IntSequence1)
+        self.assertEqual(archiver.format, IntSequenceDirectoryFormat)
+        self.assertFalse((root / 'data').exists())
+
+        self.assertEqual({str(p.relative_to(archiver.data_dir))
+                          for p in archiver.data_dir.iterdir()},
+                         {'ints.txt'})
+        self.assertFalse((root / 'provenance').exists())
+
+        self.assertTrue(archiver.provenance_dir.exists())
+
+    def test_load_lazy_materialize_single_file(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+
+        archiver = Archiver.load(fp, lazy=True)
+
+        path = archiver.materialize('provenance/action/action.yaml')
+
+        root = archiver.path / str(self.archiver.uuid)
+        self.assertEqual(path, root / 'provenance' / 'action' / 'action.yaml')
+        self.assertTrue(path.is_file())
+        self.assertEqual(set(os.listdir(str(root / 'provenance'))),
+                         {'action'})
+        self.assertFalse((root / 'data').exists())
+
+    def test_load_lazy_save(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+        archiver = Archiver.load(fp, lazy=True)
+
+        fp2 = os.path.join(self.temp_dir.name, 'archive2.zip')
+        archiver.save(fp2)
+
+        root_dir = str(self.archiver.uuid)
+        expected = {
+            'VERSION',
+            'checksums.md5',
+            'metadata.yaml',
+            'data/ints.txt',
+            'provenance/metadata.yaml',
+            'provenance/VERSION',
+            'provenance/citations.bib',
+            'provenance/action/action.yaml'
+        }
+
+        self.assertArchiveMembers(fp2, root_dir, expected)
+        diff = archiver.validate_checksums()
+        self.assertEqual(diff, ({}, {}, {}))
+
+    def test_load_parallel_extraction(self):
+        def data_initializer(data_dir):
+            for idx in range(20):
+                with (data_dir / ('%d.txt' % idx)).open('w') as fh:
+                    fh.write('%d\n' % idx * (idx + 1))
+
+        archiver = Archiver.from_data(
+            IntSequence1, IntSequenceDirectoryFormat,
+            data_initializer=data_initializer,
+            provenance_capture=ImportProvenanceCapture())
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        archiver.save(fp)
+
+        serial = Archiver.load(fp, workers=1)
+        parallel = Archiver.load(fp, workers=4)
+
+        self.assertEqual(md5sum_directory(serial.root_dir),
+                         md5sum_directory(parallel.root_dir))
+        self.assertEqual(len(os.listdir(str(parallel.data_dir))), 20)
+        self.assertEqual(parallel.validate_checksums(), ({}, {}, {}))
+
     def test_load_ignores_root_dotfiles(self):
         fp = os.path.join(self.temp_dir.name, 'archive.zip')
         self.archiver.save(fp)
@@ -318,6 +588,154 @@ class TestArchiver(unittest.TestCase, ArchiveTestingMixin):
                                     'root directory.*valid version 4 UUID'):
             _ZipArchive(zp)
 
+    def test_zip_archive_relative_iterdir(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+        archive = _ZipArchive(pathlib.Path(fp))
+        root_dir = str(self.archiver.uuid)
+
+        self.assertEqual(list(archive.relative_iterdir()), [root_dir])
+        self.assertEqual(
+            set(archive.relative_iterdir(root_dir)),
+            {'VERSION', 'checksums.md5', 'metadata.yaml', 'data',
+             'provenance'})
+        self.assertEqual(
+            set(archive.relative_iterdir(root_dir + '/provenance')),
+            {'metadata.yaml', 'VERSION', 'citations.bib', 'action'})
+        self.assertEqual(list(archive.relative_iterdir('not/a/dir')), [])
+
+    def test_save_load_directory_archive(self):
+        fp = os.path.join(self.temp_dir.name, 'archive')
+        self.archiver.save(fp, as_directory=True)
+        root_dir = str(self.archiver.uuid)
+
+        self.assertEqual(os.listdir(fp), [root_dir])
+        self.assertEqual(Archiver.peek(fp), (
+            root_dir, 'IntSequence1', 'IntSequenceDirectoryFormat'))
+
+        archiver = Archiver.load(fp)
+        self.assertEqual(archiver.uuid, self.archiver.uuid)
+        self.assertEqual(archiver.validate_checksums(), ({}, {}, {}))
+        # The stored files are served in place, nothing is extracted.
+        self.assertTrue(os.path.samefile(
+            str(archiver.data_dir / 'ints.txt'),
+            os.path.join(fp, root_dir, 'data', 'ints.txt')))
+        self.assertEqual(os.listdir(str(archiver.path)), [])
+
+        lazy = Archiver.load(fp, lazy=True)
+        self.assertTrue(os.path.samefile(
+            str(lazy.data_dir), os.path.join(fp, root_dir, 'data')))
+        with lazy.open_member('data/ints.txt') as fh:
+            self.assertEqual(fh.read(), b'1\n2\n3\n')
+
+        # Saving from a directory archive back to a zip.
+        zp = os.path.join(self.temp_dir.name, 'archive.zip')
+        archiver.save(zp)
+        self.assertEqual(Archiver.load(zp).validate_checksums(),
+                         ({}, {}, {}))
+
+    def test_load_directory_archive_does_not_mutate_source(self):
+        fp = os.path.join(self.temp_dir.name, 'archive')
+        self.archiver.save(fp, as_directory=True)
+        source = os.path.join(fp, str(self.archiver.uuid))
+        expected = md5sum_directory(source)
+
+        for lazy in (False, True):
+            artifact = qiime2.Artifact.load(fp)
+            archiver = Archiver.load(fp, lazy=lazy)
+            self.assertEqual(artifact.view(list), [1, 2, 3])
+            # Views of the stored files are read-only.
+            view = artifact.view(IntSequenceDirectoryFormat)
+            with self.assertRaisesRegex(TypeError, 'Cannot mutate'):
+                (view.path / 'ints.txt').open('a')
+            derived = qiime2.Artifact.import_data(IntSequence1, view)
+            derived.save(os.path.join(self.temp_dir.name, 'derived.qza'))
+            archiver.save(os.path.join(self.temp_dir.name, 'resaved.qza'))
+            archiver.validate_checksums()
+            del artifact, archiver, view, derived
+
+            self.assertEqual(md5sum_directory(source), expected)
+
+    def test_directory_archive_rejects_symlinks(self):
+        fp = os.path.join(self.temp_dir.name, 'archive')
+        self.archiver.save(fp, as_directory=True)
+        root = pathlib.Path(fp, str(self.archiver.uuid))
+        outside = pathlib.Path(self.temp_dir.name, 'outside')
+        outside.mkdir()
+        (outside / 'ints.txt').write_text('1\n2\n3\n')
+
+        ints = root / 'data' / 'ints.txt'
+        ints.unlink()
+        ints.symlink_to(outside / 'ints.txt')
+        for lazy in (False, True):
+            with self.assertRaisesRegex(ValueError, 'symbolic link'):
+                Archiver.load(fp, lazy=lazy)
+        archive = archiver_module._DirectoryArchive(pathlib.Path(fp))
+        with self.assertRaisesRegex(ValueError, 'symbolic link'):
+            archive.open_member('data/ints.txt')
+
+        ints.unlink()
+        shutil.copy(str(outside / 'ints.txt'), str(ints))
+        data = root / 'data'
+        shutil.rmtree(str(data))
+        data.symlink_to(outside, target_is_directory=True)
+        with self.assertRaisesRegex(ValueError, 'symbolic link'):
+            Archiver.load(fp)
+        with self.assertRaisesRegex(ValueError, 'symbolic link'):
+            archive.open_member('data/ints.txt')
+        with self.assertRaisesRegex(ValueError, 'symbolic link'):
+            Archiver.extract(fp, os.path.join(self.temp_dir.name, 'output'))
+
+    def test_extract_directory_archive(self):
+        fp = os.path.join(self.temp_dir.name, 'archive')
+        self.archiver.save(fp, as_directory=True)
+        output = os.path.join(self.temp_dir.name, 'output')
+
+        root = Archiver.extract(fp, output)
+
+        self.assertEqual(root, os.path.join(output,
+                                            str(self.archiver.uuid)))
+        self.assertEqual(md5sum_directory(root), md5sum_directory(
+            os.path.join(fp, str(self.archiver.uuid))))
+        # Extraction copies, so the extracted files can be modified safely.
+        self.assertFalse(os.path.samefile(
+            os.path.join(root, 'data', 'ints.txt'),
+            os.path.join(fp, str(self.archiver.uuid), 'data', 'ints.txt')))
+
+    def test_save_directory_archive_replaces_existing(self):
+        fp = os.path.join(self.temp_dir.name, 'archive')
+        self.archiver.save(fp, as_directory=True)
+        other = Archiver.from_data(
+            IntSequence1, IntSequenceDirectoryFormat,
+            data_initializer=lambda data_dir: (
+                data_dir / 'ints.txt').write_text('4\n'),
+            provenance_capture=ImportProvenanceCapture())
+
+        other.save(fp, as_directory=True)
+
+        self.assertEqual(os.listdir(self.temp_dir.name), ['archive'])
+        self.assertEqual(os.listdir(fp), [str(other.uuid)])
+
+        not_an_archive = os.path.join(self.temp_dir.name, 'not-an-archive')
+        os.mkdir(not_an_archive)
+        pathlib.Path(not_an_archive, 'file.txt').write_text('keep me')
+        with self.assertRaisesRegex(FileExistsError, 'not a QIIME archive'):
+            self.archiver.save(not_an_archive, as_directory=True)
+        self.assertEqual(os.listdir(not_an_archive), ['file.txt'])
+
+    def test_peek_reads_central_directory_once(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+
+        with unittest.mock.patch('zipfile.ZipFile',
+                                 side_effect=zipfile.ZipFile) as mock:
+            uuid_, type_, format_ = Archiver.peek(fp)
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(uuid_, str(self.archiver.uuid))
+        self.assertEqual(type_, 'IntSequence1')
+        self.assertEqual(format_, 'IntSequenceDirectoryFormat')
+
     def test_is_uuid4_valid(self):
         uuid_str = str(uuid.uuid4())
 
@@ -365,6 +783,148 @@ class TestArchiver(unittest.TestCase, ArchiveTestingMixin):
                                             'f47bc36040d5c7db08e4b3a457dcfbb2')
                           })
 
+    def test_checksums_levels(self):
+        with (self.archiver.root_dir / 'data' / 'ints.txt').open('w') as fh:
+            fh.write('999\n')
+        with (self.archiver.root_dir / 'tamper.txt').open('w') as fh:
+            fh.write('extra file')
+        (self.archiver.root_dir / 'VERSION').unlink()
+
+        with unittest.mock.patch('qiime2.core.util.checksum',
+                                 side_effect=util.checksum) as checksum:
+            diff = self.archiver.validate_checksums(level='structure')
+        checksum.assert_not_called()
+        self.assertEqual(diff.added, {'tamper.txt': None})
+        self.assertEqual(list(diff.removed), ['VERSION'])
+        self.assertEqual(diff.changed, {})
+
+        with unittest.mock.patch('random.sample',
+                                 side_effect=lambda population, k: [
+                                     os.path.join('data', 'ints.txt')]):
+            diff = self.archiver.validate_checksums(level='sample')
+        self.assertEqual(diff.added,
+                         {'tamper.txt': '296583001b00d2b811b5871b19e0ad28'})
+        self.assertEqual(list(diff.changed), ['data/ints.txt'])
+
+        with unittest.mock.patch.object(Archiver, 'CHECKSUM_SAMPLE_SIZE', 2):
+            with unittest.mock.patch('qiime2.core.util.checksum',
+                                     side_effect=util.checksum) as checksum:
+                self.archiver.validate_checksums(level='sample')
+        # Two sampled files and the unrecognized one.
+        self.assertEqual(checksum.call_count, 3)
+
+        self.assertEqual(self.archiver.validate_checksums(level='full'),
+                         self.archiver.validate_checksums())
+
+        with self.assertRaisesRegex(ValueError, "level.*'everything'"):
+            self.archiver.validate_checksums(level='everything')
+
+    def test_checksums_paths(self):
+        with (self.archiver.root_dir / 'data' / 'ints.txt').open('w') as fh:
+            fh.write('999\n')
+        (self.archiver.root_dir / 'provenance' / 'VERSION').unlink()
+
+        diff = self.archiver.validate_checksums(paths=['provenance/action'])
+        self.assertEqual(diff, ({}, {}, {}))
+
+        diff = self.archiver.validate_checksums(paths=['data'])
+        self.assertEqual(diff.added, {})
+        self.assertEqual(diff.removed, {})
+        self.assertEqual(list(diff.changed), ['data/ints.txt'])
+
+        diff = self.archiver.validate_checksums(
+            paths=['provenance/VERSION', 'metadata.yaml'])
+        self.assertEqual(list(diff.removed), ['provenance/VERSION'])
+        self.assertEqual(diff.changed, {})
+
+    def test_checksums_paths_lazy(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+        archiver = Archiver.load(fp, lazy=True)
+        root = archiver.path / str(archiver.uuid)
+
+        diff = archiver.validate_checksums(paths=['data/ints.txt'])
+
+        self.assertEqual(diff, ({}, {}, {}))
+        self.assertTrue((root / 'data' / 'ints.txt').exists())
+        self.assertFalse((root / 'provenance').exists())
+
+    def test_checksums_levels_lazy(self):
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        self.archiver.save(fp)
+
+        def extracted(archiver):
+            return set(util.iter_relpaths(str(archiver._fmt.path)))
+
+        archiver = Archiver.load(fp, lazy=True)
+        self.assertEqual(list(archiver._archive.iter_relpaths()),
+                         list(util.iter_relpaths(str(self.archiver.root_dir))))
+        self.assertEqual(archiver.validate_checksums(level='structure'),
+                         ({}, {}, {}))
+        # Only the checksums were extracted (and what loading needs).
+        self.assertEqual(extracted(archiver),
+                         {'VERSION', 'checksums.md5', 'metadata.yaml'})
+
+        with unittest.mock.patch.object(Archiver, 'CHECKSUM_SAMPLE_SIZE', 1), \
+                unittest.mock.patch('random.sample', side_effect=lambda
+                                    population, k: ['data/ints.txt']):
+            self.assertEqual(archiver.validate_checksums(level='sample'),
+                             ({}, {}, {}))
+        self.assertEqual(extracted(archiver),
+                         {'VERSION', 'checksums.md5', 'metadata.yaml',
+                          'data/ints.txt'})
+
+        self.assertEqual(archiver.validate_checksums(), ({}, {}, {}))
+        self.assertEqual(extracted(archiver),
+                         set(util.iter_relpaths(str(self.archiver.root_dir))))
+
+    def test_checksums_v6(self):
+        with artifact_version(6):
+            archiver = Archiver.from_data(
+                IntSequence1, IntSequenceDirectoryFormat,
+                data_initializer=lambda data_dir: (
+                    data_dir / 'ints.txt').write_text('1\n2\n3\n'),
+                provenance_capture=ImportProvenanceCapture())
+        fp = os.path.join(self.temp_dir.name, 'archive.zip')
+        archiver.save(fp)
+
+        loaded = Archiver.load(fp)
+        self.assertEqual(loaded._fmt.checksum_file, 'checksums.blake2b-tree')
+        self.assertEqual(loaded._fmt.checksum_algorithm, 'blake2b-tree')
+        self.assertEqual(loaded.validate_checksums(), ({}, {}, {}))
+
+        with (loaded.root_dir / 'data' / 'ints.txt').open('w') as fh:
+            fh.write('999\n')
+        diff = loaded.validate_checksums()
+        self.assertEqual(list(diff.changed), ['data/ints.txt'])
+        self.assertEqual(len(diff.changed['data/ints.txt'][0]), 128)
+
+    def test_checksums_v6_algorithm_from_environ(self):
+        with unittest.mock.patch.dict(
+                os.environ, {'QIIME2_CHECKSUM_ALGORITHM': 'sha256'}), \
+                artifact_version(6):
+            archiver = Archiver.from_data(
+                IntSequence1, IntSequenceDirectoryFormat,
+                data_initializer=lambda data_dir: (
+                    data_dir / 'ints.txt').write_text('1\n2\n3\n'),
+                provenance_capture=ImportProvenanceCapture())
+
+        self.assertEqual(archiver._fmt.checksum_file, 'checksums.sha256')
+        self.assertFalse((archiver.root_dir / 'checksums.md5').exists())
+        line = (archiver.root_dir / 'checksums.sha256').read_text()
+        self.assertIn('%s  data/ints.txt' % util.checksum(
+            archiver.data_dir / 'ints.txt', 'sha256'), line)
+        self.assertEqual(archiver.validate_checksums(), ({}, {}, {}))
+
+        with unittest.mock.patch.dict(
+                os.environ, {'QIIME2_CHECKSUM_ALGORITHM': 'crc7'}), \
+                artifact_version(6):
+            with self.assertRaisesRegex(ValueError, 'ALGORITHM.*crc7'):
+                Archiver.from_data(
+                    IntSequence1, IntSequenceDirectoryFormat,
+                    data_initializer=lambda data_dir: None,
+                    provenance_capture=ImportProvenanceCapture())
+
     def test_checksum_backwards_compat(self):
         self.tearDown()
         with artifact_version(4):
@@ -0,0 +1,251 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2021, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import stat
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+import zipfile
+
+import pandas as pd
+
+import qiime2
+from qiime2.plugins import dummy_plugin
+
+from qiime2.core.archive import Archiver
+from qiime2.core.archive import ImportProvenanceCapture
+from qiime2.core.archive.archiver import _ZipArchive
+from qiime2.core.archive.cache import ArchiveCache
+from qiime2.core.archive.format.util import artifact_version
+from qiime2.core.testing.format import IntSequenceDirectoryFormat
+from qiime2.core.testing.type import IntSequence1
+
+
+def make_archive(directory, name, ints=(1, 2, 3)):
+    def data_initializer(data_dir):
+        with (data_dir / 'ints.txt').open('w') as fh:
+            for i in ints:
+                fh.write('%d\n' % i)
+
+    archiver = Archiver.from_data(
+        IntSequence1, IntSequenceDirectoryFormat,
+        data_initializer=data_initializer,
+        provenance_capture=ImportProvenanceCapture())
+    fp = os.path.join(directory, name)
+    archiver.save(fp)
+    return archiver, fp
+
+
+class TestArchiveCache(unittest.TestCase):
+    def setUp(self):
+        prefix = "qiime2-test-temp-"
+        self.temp_dir = tempfile.TemporaryDirectory(prefix=prefix)
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self.cache = ArchiveCache(self.cache_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_load_reuses_extraction(self):
+        original, fp = make_archive(self.temp_dir.name, 'archive.zip')
+
+        with unittest.mock.patch.object(
+                _ZipArchive, 'extract', autospec=True,
+                side_effect=_ZipArchive.extract) as extract:
+            first = Archiver.load(fp, cache=self.cache)
+            second = Archiver.load(fp, cache=self.cache)
+
+        self.assertEqual(extract.call_count, 1)
+        for archiver in (first, second):
+            self.assertEqual(archiver.uuid, original.uuid)
+            self.assertEqual(archiver.type, IntSequence1)
+            self.assertEqual(archiver.validate_checksums(), ({}, {}, {}))
+        self.assertNotEqual(first.path, second.path)
+
+        first_fp = first.data_dir / 'ints.txt'
+        second_fp = second.data_dir / 'ints.txt'
+        self.assertTrue(os.path.samefile(str(first_fp), str(second_fp)))
+
+        entries = [p for p in os.listdir(self.cache_dir)
+                   if not p.startswith('.')]
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].startswith(str(original.uuid)))
+
+    def test_cached_archive_outlives_eviction(self):
+        _, fp = make_archive(self.temp_dir.name, 'archive.zip')
+        cache = ArchiveCache(self.cache_dir, max_size=0)
+
+        archiver = Archiver.load(fp, cache=cache)
+
+        self.assertEqual([p for p in os.listdir(self.cache_dir)
+                          if not p.startswith('.')], [])
+        with (archiver.data_dir / 'ints.txt').open() as fh:
+            self.assertEqual(fh.read(), '1\n2\n3\n')
+
+    def test_evict_leaves_nothing_behind(self):
+        _, fp = make_archive(self.temp_dir.name, 'archive.zip')
+        cache = ArchiveCache(self.cache_dir, max_size=0)
+
+        Archiver.load(fp, cache=cache)
+
+        self.assertEqual(os.listdir(self.cache_dir), ['.evict.lock'])
+
+    def test_evict_sweeps_stale_paths(self):
+        root = pathlib.Path(self.cache_dir)
+        stale = [root / '.staging-stale-key.abc123',
+                 root / '.trash-stale-key.def456']
+        for path in stale:
+            (path / 'stale-key').mkdir(parents=True)
+            (path / 'stale-key' / 'file.txt').write_text('left behind')
+        (root / '.stale-key.lock').touch()
+        (root / '.killed-key.lock').touch()
+        busy = root / '.staging-busy-key.ghi789'
+        busy.mkdir()
+
+        with self.cache._lock(root / '.busy-key.lock'):
+            self.cache.evict()
+            self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                             ['.busy-key.lock', '.evict.lock',
+                              '.staging-busy-key.ghi789'])
+
+        self.cache.evict()
+        self.assertEqual(os.listdir(self.cache_dir), ['.evict.lock'])
+
+    def test_evict_keeps_locks_of_entries(self):
+        _, fp = make_archive(self.temp_dir.name, 'archive.zip')
+
+        Archiver.load(fp, cache=self.cache)
+        self.cache.evict()
+
+        key = self.cache.get_key(Archiver.get_archive(fp))
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(['.evict.lock', '.%s.lock' % key, key]))
+
+    def test_evict_is_rate_limited(self):
+        _, fp1 = make_archive(self.temp_dir.name, 'a.zip')
+        _, fp2 = make_archive(self.temp_dir.name, 'b.zip')
+
+        with unittest.mock.patch.object(
+                ArchiveCache, 'evict', autospec=True,
+                side_effect=ArchiveCache.evict) as evict:
+            Archiver.load(fp1, cache=self.cache)
+            Archiver.load(fp1, cache=self.cache)
+            self.assertEqual(evict.call_count, 1)
+
+            # The cache grew.
+            Archiver.load(fp2, cache=self.cache)
+            self.assertEqual(evict.call_count, 2)
+
+            self.cache._last_evict -= self.cache.EVICT_INTERVAL
+            Archiver.load(fp1, cache=self.cache)
+            self.assertEqual(evict.call_count, 3)
+
+    def test_cached_files_keep_their_modes(self):
+        _, fp = make_archive(self.temp_dir.name, 'archive.zip')
+        export_dir = os.path.join(self.temp_dir.name, 'export')
+        saved_fp = os.path.join(self.temp_dir.name, 'saved.qza')
+        derived_fp = os.path.join(self.temp_dir.name, 'derived.qza')
+
+        with unittest.mock.patch.dict(
+                os.environ, {'QIIME2_ARCHIVE_CACHE': self.cache_dir}):
+            qiime2.Artifact.load(fp)
+            # Loaded again, from the cache.
+            artifact = qiime2.Artifact.load(fp)
+            artifact.export_data(export_dir)
+            artifact.save(saved_fp)
+            derived, = dummy_plugin.actions.identity_with_metadata(
+                artifact, qiime2.Metadata(pd.DataFrame(
+                    {'a': ['1']}, index=pd.Index(['0'], name='id'))))
+            derived.save(derived_fp)
+
+        self.assertTrue(os.access(os.path.join(export_dir, 'ints.txt'),
+                                  os.W_OK))
+        for path in (saved_fp, derived_fp):
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    mode = info.external_attr >> 16
+                    self.assertTrue(mode & stat.S_IWUSR,
+                                    '%s: %o' % (info.filename, mode))
+
+    def test_evict_least_recently_used(self):
+        archivers = []
+        for name in ('a.zip', 'b.zip', 'c.zip'):
+            archiver, fp = make_archive(self.temp_dir.name, name)
+            archivers.append((archiver, fp))
+            Archiver.load(fp, cache=self.cache)
+
+        sizes = []
+        for age, (archiver, _) in enumerate(archivers):
+            entry, = pathlib.Path(self.cache_dir).glob('%s-*' % archiver.uuid)
+            sizes.append(int((entry / '.size').read_text()))
+            # Make the order of use unambiguous.
+            os.utime(str(entry), (1000 + age, 1000 + age))
+
+        # Use the first archive again, so that the second is the oldest.
+        Archiver.load(archivers[0][1], cache=self.cache)
+
+        self.cache.max_size = sum(sizes) - 1
+        self.cache.evict()
+
+        remaining = {entry.split('-', 5)[0] for entry in
+                     os.listdir(self.cache_dir) if not entry.startswith('.')}
+        self.assertEqual(remaining, {str(archivers[0][0].uuid)[:8],
+                                     str(archivers[2][0].uuid)[:8]})
+
+    def test_key_depends_on_contents(self):
+        _, fp1 = make_archive(self.temp_dir.name, 'a.zip', ints=(1, 2))
+        _, fp2 = make_archive(self.temp_dir.name, 'b.zip', ints=(1, 2))
+
+        key1 = self.cache.get_key(Archiver.get_archive(fp1))
+        key2 = self.cache.get_key(Archiver.get_archive(fp2))
+
+        self.assertNotEqual(key1, key2)
+        self.assertEqual(key1, self.cache.get_key(Archiver.get_archive(fp1)))
+
+    def test_key_without_checksums(self):
+        with artifact_version(4):
+            original, fp = make_archive(self.temp_dir.name, 'archive.zip')
+
+        key = self.cache.get_key(Archiver.get_archive(fp))
+        self.assertTrue(key.startswith(str(original.uuid)))
+
+        archiver = Archiver.load(fp, cache=self.cache)
+        self.assertEqual(archiver.uuid, original.uuid)
+
+    def test_from_environ(self):
+        with unittest.mock.patch.dict(os.environ, clear=True):
+            self.assertIsNone(ArchiveCache.from_environ())
+
+        with unittest.mock.patch.dict(
+                os.environ, {'QIIME2_ARCHIVE_CACHE': self.cache_dir,
+                             'QIIME2_ARCHIVE_CACHE_SIZE': '1048576'}):
+            cache = ArchiveCache.from_environ()
+            self.assertEqual(cache.root, pathlib.Path(self.cache_dir))
+            self.assertEqual(cache.max_size, 1048576)
+            # Set up once, rather than on every load.
+            self.assertIs(ArchiveCache.from_environ(), cache)
+
+            _, fp = make_archive(self.temp_dir.name, 'archive.zip')
+            with unittest.mock.patch.object(
+                    ArchiveCache, '__init__',
+                    side_effect=AssertionError('cache set up again')):
+                Archiver.load(fp)
+            self.assertTrue(any(not p.startswith('.') for p in
+                                os.listdir(self.cache_dir)))
+
+        with unittest.mock.patch.dict(
+                os.environ, {'QIIME2_ARCHIVE_CACHE': self.cache_dir,
+                             'QIIME2_ARCHIVE_CACHE_SIZE': 'big'}):
+            with self.assertRaisesRegex(ValueError, 'CACHE_SIZE.*big'):
+                ArchiveCache.from_environ()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2021, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import json
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import pandas as pd
+
+import qiime2
+from qiime2.plugins import dummy_plugin
+from qiime2.core.testing.type import FourInts, IntSequence1, Mapping
+from qiime2.core.archive import Archiver, ImportProvenanceCapture
+from qiime2.core.archive.archiver import _ZipArchive
+from qiime2.core.archive.format.util import artifact_version
+from qiime2.core.archive.lineage import ProvenanceGraph
+
+
+class TestProvenanceGraph(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        # The lineage index is only written from format 6.
+        version = artifact_version(6)
+        version.__enter__()
+        self.addCleanup(version.__exit__, None, None, None)
+
+        self.ints = qiime2.Artifact.import_data(IntSequence1, [1, 2, 3])
+        self.mapping = qiime2.Artifact.import_data(Mapping, {'foo': '42'})
+        md = self.mapping.view(qiime2.Metadata)
+        self.left, self.right = dummy_plugin.actions.split_ints(self.ints)
+        self.result = dummy_plugin.actions.identity_with_metadata(
+            self.left, md).out
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def graph_without_index(self, artifact):
+        p_dir = artifact._archiver.provenance_dir
+
+        def open_member(relpath):
+            if relpath == 'index.json':
+                raise FileNotFoundError(relpath)
+            return (p_dir / relpath).open('rb')
+
+        return ProvenanceGraph(open_member, artifact.uuid)
+
+    def test_index_written(self):
+        p_dir = self.result._archiver.provenance_dir
+        with (p_dir / 'index.json').open() as fh:
+            index = json.load(fh)
+
+        self.assertEqual(index['root'], str(self.result.uuid))
+        self.assertEqual(
+            set(index['nodes']),
+            {str(x.uuid) for x in (self.ints, self.mapping, self.left,
+                                   self.result)})
+        # Only the archive's own index is kept
+        self.assertFalse(
+            (p_dir / 'artifacts' / str(self.left.uuid) / 'index.json')
+            .exists())
+
+    def test_no_index_before_v6(self):
+        with artifact_version(5):
+            result = dummy_plugin.actions.identity_with_metadata(
+                self.left, self.mapping.view(qiime2.Metadata)).out
+
+        self.assertFalse(
+            (result._archiver.provenance_dir / 'index.json').exists())
+        graph = result.provenance
+        self.assertFalse(graph.has_index)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.imports(),
+                         {str(self.ints.uuid), str(self.mapping.uuid)})
+
+    def test_nodes(self):
+        graph = self.result.provenance
+
+        self.assertTrue(graph.has_index)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.root.uuid, str(self.result.uuid))
+        self.assertEqual(graph.root.type, 'method')
+        self.assertEqual(graph.root.plugin, 'dummy-plugin')
+        self.assertEqual(graph.root.plugin_version, '0.0.0-dev')
+        self.assertEqual(graph.root.action, 'identity_with_metadata')
+        self.assertEqual(graph.root.output_name, 'out')
+        self.assertEqual(graph.root.parents,
+                         (str(self.left.uuid), str(self.mapping.uuid)))
+
+        left = graph[self.left.uuid]
+        self.assertEqual(left.action, 'split_ints')
+        self.assertEqual(left.output_name, 'left')
+        self.assertEqual(left.parents, (str(self.ints.uuid),))
+        self.assertEqual(left.inputs, {'ints': str(self.ints.uuid)})
+
+        ints = graph[self.ints.uuid]
+        self.assertEqual(ints.type, 'import')
+        self.assertIsNone(ints.plugin)
+        self.assertIsNone(ints.output_name)
+        self.assertEqual(ints.parents, ())
+        self.assertEqual(ints.action_yaml['action'], {'type': 'import'})
+
+        self.assertNotIn(self.right.uuid, graph)
+        with self.assertRaises(KeyError):
+            graph[self.right.uuid]
+
+    def test_traversal(self):
+        graph = self.result.provenance
+
+        self.assertEqual(
+            graph.ancestors(),
+            {str(x.uuid) for x in (self.ints, self.mapping, self.left)})
+        self.assertEqual(graph.ancestors(self.left.uuid),
+                         {str(self.ints.uuid)})
+        self.assertEqual(graph.imports(),
+                         {str(self.ints.uuid), str(self.mapping.uuid)})
+        self.assertEqual(graph.imports(self.ints.uuid),
+                         {str(self.ints.uuid)})
+        self.assertEqual(graph[self.ints.uuid].children,
+                         (str(self.left.uuid),))
+        self.assertEqual(graph.descendants(self.ints.uuid),
+                         {str(self.left.uuid), str(self.result.uuid)})
+
+    def test_index_matches_action_yaml(self):
+        indexed = self.result.provenance
+        parsed = self.graph_without_index(self.result)
+
+        self.assertFalse(parsed.has_index)
+        self.assertEqual(set(parsed), set(indexed))
+        for uuid in indexed:
+            self.assertEqual(parsed[uuid]._lineage_record,
+                             indexed[uuid]._lineage_record)
+        self.assertEqual(parsed.ancestors(), indexed.ancestors())
+        self.assertEqual(parsed.imports(), indexed.imports())
+
+    def test_parent_without_provenance(self):
+        with artifact_version(0):
+            ints = qiime2.Artifact._from_view(
+                IntSequence1, [1, 2, 3], list, ImportProvenanceCapture())
+        left, _ = dummy_plugin.actions.split_ints(ints)
+        indexed = left.provenance
+        parsed = self.graph_without_index(left)
+
+        self.assertTrue(indexed.has_index)
+        for graph in (indexed, parsed):
+            self.assertEqual(graph.root.parents, (str(ints.uuid),))
+            self.assertNotIn(ints.uuid, graph)
+            self.assertEqual(list(graph), [str(left.uuid)])
+            self.assertEqual(len(graph), 1)
+            self.assertEqual(graph.ancestors(), {str(ints.uuid)})
+
+    def test_pipeline(self):
+        r = dummy_plugin.actions.typical_pipeline(self.ints, self.mapping,
+                                                  False)
+        graph = r.out_map.provenance
+
+        self.assertEqual(graph.root.type, 'pipeline')
+        # An alias descends from its inputs and from the result it aliases
+        self.assertEqual(graph.root.parents,
+                         (str(self.ints.uuid), str(self.mapping.uuid)))
+        self.assertEqual(graph.imports(),
+                         {str(self.ints.uuid), str(self.mapping.uuid)})
+
+        r = dummy_plugin.actions.pipelines_in_pipeline(self.ints,
+                                                       self.mapping)
+        graph = r.right.provenance
+        self.assertIn(str(self.ints.uuid), graph.ancestors())
+        self.assertEqual(
+            {graph[uuid].action for uuid in graph.ancestors()
+             if uuid in graph},
+            {None, 'typical_pipeline', 'split_ints'})
+        self.assertEqual(set(graph), set(self.graph_without_index(r.right)))
+
+    def test_ancestor_without_index(self):
+        os.remove(str(self.left._archiver.provenance_dir / 'index.json'))
+        result = dummy_plugin.actions.identity_with_metadata(
+            self.left, self.mapping.view(qiime2.Metadata)).out
+
+        self.assertFalse(
+            (result._archiver.provenance_dir / 'index.json').exists())
+        graph = result.provenance
+        self.assertFalse(graph.has_index)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.imports(),
+                         {str(self.ints.uuid), str(self.mapping.uuid)})
+
+    def test_loaded(self):
+        fp = self.result.save(os.path.join(self.temp_dir.name, 'r.qza'))
+        for lazy in (False, True):
+            loaded = qiime2.Artifact.load(fp, lazy=lazy)
+            graph = loaded.provenance
+            self.assertTrue(graph.has_index)
+            self.assertEqual(graph.ancestors(),
+                             self.result.provenance.ancestors())
+            self.assertEqual(graph[self.left.uuid].parameters, {})
+
+        visualization, = dummy_plugin.actions.most_common_viz(self.ints)
+        self.assertEqual(visualization.provenance.imports(),
+                         {str(self.ints.uuid)})
+
+
+class TestPeekProvenance(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+
+        self.md = qiime2.Metadata(pd.DataFrame(
+            {'a': ['1', '2', '3']},
+            index=pd.Index(['0', '1', '2'], name='feature ID')))
+        with artifact_version(6):
+            self.ints = qiime2.Artifact.import_data(IntSequence1, [1, 2, 3])
+            self.result = dummy_plugin.actions.identity_with_metadata(
+                self.ints, self.md).out
+        self.fp = self.result.save(
+            os.path.join(self.temp_dir.name, 'result.qza'))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_peek_provenance(self):
+        open_member = _ZipArchive.open_member
+        members = []
+
+        def record(archive, relpath):
+            members.append(str(relpath))
+            return open_member(archive, relpath)
+
+        with mock.patch.object(_ZipArchive, 'open_member', record), \
+                mock.patch.object(Archiver, '_make_temp_path',
+                                  side_effect=AssertionError):
+            graph = qiime2.Artifact.peek_provenance(self.fp)
+
+            self.assertTrue(graph.has_index)
+            self.assertEqual(graph.uuid, str(self.result.uuid))
+            self.assertEqual(graph.imports(), {str(self.ints.uuid)})
+            self.assertEqual(graph.citations.keys(),
+                             self.result.citations.keys())
+            with graph.root.open('action/metadata.tsv') as fh:
+                self.assertEqual(
+                    fh.read(),
+                    (self.result._archiver.provenance_dir / 'action' /
+                     'metadata.tsv').read_bytes())
+
+        self.assertTrue(members)
+        for member in members:
+            self.assertTrue(member.startswith('provenance/'), member)
+
+    def test_missing_member(self):
+        graph = qiime2.Artifact.peek_provenance(self.fp)
+
+        with self.assertRaises(KeyError):
+            graph.root.open('action/not-a-file.tsv')
+        with self.assertRaises(KeyError):
+            graph['not-a-uuid']
+
+    def test_peek_provenance_from_buffer_and_directory(self):
+        with open(self.fp, 'rb') as fh:
+            graph = qiime2.Artifact.peek_provenance(fh.read())
+        self.assertEqual(graph.ancestors(), {str(self.ints.uuid)})
+
+        dir_fp = self.result.save(os.path.join(self.temp_dir.name, 'dir'),
+                                  as_directory=True)
+        graph = qiime2.Artifact.peek_provenance(dir_fp)
+        self.assertEqual(graph.ancestors(), {str(self.ints.uuid)})
+        self.assertEqual(graph.root.action, 'identity_with_metadata')
+
+    def test_peek_provenance_without_provenance(self):
+        fp = os.path.join(self.temp_dir.name, 'artifact_v0.qza')
+        with artifact_version(0):
+            artifact = qiime2.Artifact._from_view(
+                FourInts, [-1, 42, 0, 43], list, ImportProvenanceCapture())
+            artifact.save(fp)
+
+        self.assertIsNone(qiime2.Artifact.peek_provenance(fp))
+
+
+if __name__ == '__main__':
+    unittest.main()
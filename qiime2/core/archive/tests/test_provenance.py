@@ -6,19 +6,35 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+import uuid
+import errno
+import datetime
+import collections
 import unittest
 import re
+import tempfile
 import unittest.mock as mock
 
 import pandas as pd
+import pkg_resources
+import yaml
 
 import qiime2
 from qiime2.plugins import dummy_plugin
 from qiime2.core.testing.type import IntSequence1, Mapping
+from qiime2.core.testing.util import get_dummy_plugin
+import qiime2.core.util as util
 import qiime2.core.archive.provenance as provenance
 
 
 class TestProvenanceIntegration(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
     def test_chain_with_metadata(self):
         df = pd.DataFrame({'a': ['1', '2', '3']},
                           index=pd.Index(['0', '1', '2'], name='feature ID'))
@@ -239,6 +255,131 @@ class TestProvenanceIntegration(unittest.TestCase):
         self.assertIn('ints: %s' % ints.uuid, actual_method_yaml)
         self.assertIn('action: split_ints', actual_method_yaml)
 
+    def test_ancestors_shared(self):
+        m = qiime2.Metadata(pd.DataFrame(
+            {'a': ['1', '2', '3']},
+            index=pd.Index(['0', '1', '2'], name='feature ID')))
+
+        a = qiime2.Artifact.import_data('IntSequence1', [1, 2, 3])
+        b = dummy_plugin.actions.identity_with_metadata(a, m).out
+        c = dummy_plugin.actions.identity_with_metadata(b, m).out
+
+        a_p_dir = a._archiver.provenance_dir
+        c_ancestors = c._archiver.provenance_dir / 'artifacts'
+        for relpath in ['action/action.yaml', 'citations.bib', 'VERSION']:
+            # a's provenance is shared by b and c rather than copied
+            self.assertTrue(os.path.samefile(
+                str(a_p_dir / relpath),
+                str(c_ancestors / str(a.uuid) / relpath)))
+        self.assertTrue(os.path.samefile(
+            str(b._archiver.provenance_dir / 'action' / 'metadata.tsv'),
+            str(c_ancestors / str(b.uuid) / 'action' / 'metadata.tsv')))
+
+        c.validate()
+        c_copy = qiime2.Artifact.load(c.save(os.path.join(
+            self.temp_dir.name, 'c.qza')))
+        self.assertEqual(
+            (c_copy._archiver.provenance_dir / 'artifacts' / str(a.uuid) /
+             'action' / 'action.yaml').read_text(),
+            (a_p_dir / 'action' / 'action.yaml').read_text())
+
+    def test_forked_outputs_shared(self):
+        ints = qiime2.Artifact.import_data(IntSequence1, [1, 2, 3])
+        left, right = dummy_plugin.actions.split_ints(ints)
+
+        ancestor = os.path.join('artifacts', str(ints.uuid), 'VERSION')
+        self.assertTrue(os.path.samefile(
+            str(left._archiver.provenance_dir / ancestor),
+            str(right._archiver.provenance_dir / ancestor)))
+        self.assertNotEqual(
+            (left._archiver.provenance_dir / 'action' /
+             'action.yaml').read_text(),
+            (right._archiver.provenance_dir / 'action' /
+             'action.yaml').read_text())
+
+    def test_fork_shares_ancestry(self):
+        ints = qiime2.Artifact.import_data(IntSequence1, [1, 2, 3])
+        capture = provenance.ActionProvenanceCapture(
+            'method', 'dummy_plugin', 'split_ints')
+        capture.add_input('ints', ints)
+
+        # The ancestry is only staged when an output is written
+        forked = capture.fork('left')
+        self.assertEqual(os.listdir(str(capture.ancestor_dir)), [])
+        self.assertEqual(os.listdir(str(forked.ancestor_dir)), [])
+        self.assertIs(forked.ancestor_checksums, capture.ancestor_checksums)
+
+        with mock.patch.object(util, 'checksum',
+                               side_effect=util.checksum) as checksum:
+            left, right = dummy_plugin.actions.split_ints(ints)
+        hashed = [os.path.basename(os.path.dirname(call[0][0]))
+                  for call in checksum.call_args_list]
+        # Only the first output hashed the ancestry
+        self.assertEqual(hashed.count(str(ints.uuid)), 3)
+
+        left.validate()
+        right.validate()
+
+    def test_env_section_cached(self):
+        settings = dict(default_flow_style=False, indent=4)
+        plugin = get_dummy_plugin()
+        capture = provenance.ImportProvenanceCapture()
+        capture.reference_plugin(plugin)
+
+        self.assertEqual(
+            capture.dump_env_section(**settings),
+            yaml.dump({'environment': capture.make_env_section()},
+                      **settings))
+
+        other = provenance.ImportProvenanceCapture()
+        with mock.patch.object(provenance.pkg_resources,
+                               'get_build_platform') as get_build_platform:
+            env_yaml = other.dump_env_section(**settings)
+        get_build_platform.assert_not_called()
+        # The plugins are still specific to each capture
+        self.assertIn('\n    plugins: {}\n', env_yaml)
+        self.assertNotIn('dummy-plugin', env_yaml)
+        self.assertIn('\n        qiime2: ', env_yaml)
+
+    def test_env_section_working_set_changed(self):
+        settings = dict(default_flow_style=False, indent=4)
+        capture = provenance.ImportProvenanceCapture()
+        capture.dump_env_section(**settings)
+
+        working_set = pkg_resources.WorkingSet([])
+        with mock.patch.object(provenance.pkg_resources, 'working_set',
+                               working_set):
+            self.assertEqual(capture.capture_env(), {})
+
+            working_set.add(pkg_resources.Distribution(
+                project_name='q2-new', version='1.0', location='nowhere'))
+            env_yaml = capture.dump_env_section(**settings)
+
+        self.assertTrue(env_yaml.endswith(
+            '    python-packages:\n        q2-new: \'1.0\'\n'))
+        self.assertIn('qiime2', capture.capture_env())
+
+    @unittest.skipIf(util.YAMLDumper is yaml.Dumper,
+                     'PyYAML was built without libyaml.')
+    def test_c_dumper(self):
+        data = collections.OrderedDict([
+            ('uuid', str(uuid.uuid4())),
+            ('start', datetime.datetime(2021, 7, 24, 16, 0, 0, 1,
+                                        tzinfo=datetime.timezone.utc)),
+            ('python', provenance.LiteralString('3.8.0\n[GCC 7.3.0]')),
+            ('inputs', provenance.OrderedKeyValue([
+                ('ints', provenance.ForwardRef('environment:plugins:dummy')),
+                ('v0', provenance.NoProvenance(uuid.uuid4()))])),
+            ('metadata', provenance.MetadataPath('metadata.tsv')),
+            ('color', provenance.ColorPrimitive('#ff00ff')),
+            ('citations', [provenance.CitationKey('framework|qiime2:1|0')]),
+            ('choices', {'b', 'a'}),
+        ])
+        settings = dict(default_flow_style=False, indent=4)
+
+        self.assertEqual(yaml.dump(data, Dumper=util.YAMLDumper, **settings),
+                         yaml.dump(data, **settings))
+
     def test_unioned_primitives(self):
         r = dummy_plugin.actions.unioned_primitives(3, 2)
 
@@ -277,6 +418,24 @@ class TestProvenanceIntegration(unittest.TestCase):
         with (viz_p_dir / 'action' / 'action.yaml').open() as fh:
             self.assertIn('output-name: visualization', fh.read())
 
+    def test_prov_rename_cross_device(self):
+        rename = os.rename
+
+        def cross_device(src, dst):
+            if isinstance(src, qiime2.core.path.ProvenancePath):
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            return rename(src, dst)
+
+        with mock.patch('os.rename', side_effect=cross_device):
+            artifact = qiime2.Artifact.import_data(IntSequence1, [1, 2, 3])
+            viz, = dummy_plugin.actions.most_common_viz(artifact)
+
+        with (viz._archiver.provenance_dir / 'action' /
+              'action.yaml').open() as fh:
+            self.assertIn('output-name: visualization', fh.read())
+        self.assertEqual(viz._archiver.validate_checksums(), ({}, {}, {}))
+        self.assertEqual(viz.provenance.ancestors(), {str(artifact.uuid)})
+
 
 if __name__ == '__main__':
     unittest.main()
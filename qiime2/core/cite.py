@@ -18,6 +18,7 @@ CitationRecord = collections.namedtuple('CitationRecord', ['type', 'fields'])
 class Citations(collections.OrderedDict):
     @classmethod
     def load(cls, path, package=None):
+        # `path` may also be a file opened for reading text
         if package is not None:
             root = pkg_resources.resource_filename(package, '.')
             root = os.path.abspath(root)
@@ -27,12 +28,21 @@ class Citations(collections.OrderedDict):
         # Downstream tooling is much easier with unicode. For actual latex
         # users, use the modern biber backend instead of bibtex
         parser.customization = bp.customization.convert_to_unicode
-        with open(path) as fh:
-            try:
-                db = bp.load(fh, parser=parser)
-            except Exception as e:
-                raise ValueError("There was a problem loading the BiBTex file:"
-                                 "%r" % path) from e
+        owned = False
+        if hasattr(path, 'read'):
+            fh = path
+            path = getattr(fh, 'name', fh)
+        else:
+            fh = open(path)
+            owned = True
+        try:
+            db = bp.load(fh, parser=parser)
+        except Exception as e:
+            raise ValueError("There was a problem loading the BiBTex file:"
+                             "%r" % path) from e
+        finally:
+            if owned:
+                fh.close()
 
         entries = collections.OrderedDict()
         for entry in db.entries:
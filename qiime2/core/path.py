@@ -7,15 +7,349 @@
 # ----------------------------------------------------------------------------
 
 import os
+import json
+import uuid
+import queue
+import errno
+import atexit
+import socket
 import pathlib
 import shutil
-import distutils
 import tempfile
+import threading
+import warnings
 import weakref
 
+from qiime2.core.util import TransferReport, transfer_tree
+
 
 _ConcretePath = type(pathlib.Path())
 
+TEMP_ROOT_ENV = 'QIIME2_TMPDIR'
+TEMP_ROOT_KIND_ENVS = {
+    'archive': 'QIIME2_ARCHIVE_TMPDIR',
+    'provenance': 'QIIME2_PROVENANCE_TMPDIR',
+    'output': 'QIIME2_OUTPUT_TMPDIR',
+}
+_temp_roots = {}
+
+
+def _check_temp_kind(kind):
+    if kind is not None and kind not in TEMP_ROOT_KIND_ENVS:
+        raise ValueError("Temporary directory kind must be one of %s, not %r."
+                         % (', '.join(map(repr, TEMP_ROOT_KIND_ENVS)), kind))
+
+
+def set_temp_root(root, kind=None):
+    """Set the directory QIIME 2 creates its temporary files in.
+
+    Parameters
+    ----------
+    root : str or pathlib.Path or None
+        Directory to use. It is created if it does not exist. None removes a
+        root which was previously set.
+    kind : {'archive', 'provenance', 'output'}, optional
+        Only set the root for extracted archives, provenance staging, or
+        transformer and visualizer outputs. If not provided, the default
+        root for every kind is set.
+
+    """
+    _check_temp_kind(kind)
+    if root is None:
+        _temp_roots.pop(kind, None)
+    else:
+        _temp_roots[kind] = str(root)
+
+
+def get_temp_root(kind=None):
+    """The directory temporary files of `kind` are created in.
+
+    Roots set with `set_temp_root` take precedence over the environment.
+    A root for a specific kind (e.g. QIIME2_ARCHIVE_TMPDIR) takes
+    precedence over the default root (QIIME2_TMPDIR), which takes
+    precedence over the system's temporary directory (see
+    `tempfile.gettempdir`).
+
+    Placing a kind's root on the same filesystem as the data it will
+    receive keeps moves into it renames rather than copies.
+
+    """
+    _check_temp_kind(kind)
+    candidates = []
+    if kind is not None:
+        candidates += [_temp_roots.get(kind),
+                       os.environ.get(TEMP_ROOT_KIND_ENVS[kind])]
+    candidates += [_temp_roots.get(None), os.environ.get(TEMP_ROOT_ENV)]
+
+    for root in candidates:
+        if root:
+            os.makedirs(root, exist_ok=True)
+            return root
+    return tempfile.gettempdir()
+
+
+OWNER_SUFFIX = '.qiime2-owner'
+SWEEP_ENV = 'QIIME2_SWEEP_ORPHANS'
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _get_owner_marker(path):
+    # The marker is kept next to the path rather than inside of it, as a
+    # path's contents may be moved elsewhere (e.g. into an archive).
+    parent, name = os.path.split(str(path))
+    return os.path.join(parent, '.%s%s' % (name, OWNER_SUFFIX))
+
+
+def _get_start_time(pid):
+    # Tells a process apart from a later one which reused its PID.
+    try:
+        with open('/proc/%d/stat' % pid) as fh:
+            stat = fh.read()
+        # The process name may contain spaces, start after it.
+        return int(stat.rsplit(')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _write_owner(path):
+    pid = os.getpid()
+    owner = {'pid': pid, 'host': socket.gethostname(),
+             'start': _get_start_time(pid)}
+    with open(_get_owner_marker(path), 'w') as fh:
+        json.dump(owner, fh)
+
+
+def _is_orphaned(owner):
+    if owner.get('host') != socket.gethostname():
+        # The processes of other hosts can't be seen from here.
+        return False
+    pid = owner.get('pid')
+    if not isinstance(pid, int):
+        return False
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # Alive, just not ours.
+        pass
+    start = owner.get('start')
+    return start is not None and _get_start_time(pid) not in (None, start)
+
+
+def _get_size(path):
+    if not os.path.isdir(path) or os.path.islink(path):
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return 0
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _delete(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        _unlink(path)
+    _unlink(_get_owner_marker(path))
+
+
+class _Reaper:
+    """Deletes temporary files and directories in a background thread.
+
+    A path is first renamed out of the way, next to itself so the rename
+    never crosses filesystems, and then queued for deletion. The caller
+    deletes the path itself when the queue is full. Whatever is still
+    queued is deleted at interpreter exit.
+
+    """
+    TRASH_PREFIX = '.qiime2-trash-'
+    MAX_QUEUED = 64
+    # Seconds to wait for the queue at exit, whatever is left is removed by
+    # `sweep_orphans` later.
+    EXIT_TIMEOUT = 30
+
+    def __init__(self, max_queued=MAX_QUEUED):
+        self._max_queued = max_queued
+        self._stopped = False
+        self._registered = False
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self._max_queued)
+        self._thread = None
+
+    def reap(self, path):
+        path = str(path)
+        parent, name = os.path.split(path)
+        trash = os.path.join(parent, '%s%s-%s' % (self.TRASH_PREFIX, name,
+                                                  uuid.uuid4().hex[:8]))
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            # Moved elsewhere already, only its owner marker is left.
+            _unlink(_get_owner_marker(path))
+            return
+        except OSError:
+            # Not ours to move, delete it where it is.
+            trash = path
+        else:
+            try:
+                os.rename(_get_owner_marker(path), _get_owner_marker(trash))
+            except FileNotFoundError:
+                pass
+
+        if self._start():
+            try:
+                self._queue.put_nowait(trash)
+                return
+            except queue.Full:
+                pass
+        _delete(trash)
+
+    def drain(self, timeout=None):
+        """Wait for every queued path to be deleted.
+
+        Returns False if `timeout` (in seconds) passed first.
+
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout)
+
+    def stop(self, timeout=EXIT_TIMEOUT):
+        """Drain the queue, paths are deleted by the caller from now on."""
+        self._stopped = True
+        return self.drain(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._stopped:
+                return False
+            if self._thread is None or not self._thread.is_alive():
+                if not self._registered:
+                    atexit.register(self.stop)
+                    if hasattr(os, 'register_at_fork'):
+                        # The thread doesn't survive a fork, and the locks
+                        # might have been held by another thread.
+                        os.register_at_fork(after_in_child=self._reset)
+                    self._registered = True
+                self._thread = threading.Thread(
+                    target=self._run, name='qiime2-reaper', daemon=True)
+                self._thread.start()
+            return True
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                _delete(path)
+            except Exception as e:
+                # Keep going, the thread is the only one emptying the queue.
+                warnings.warn("Could not delete temporary path %r: %s"
+                              % (path, e), RuntimeWarning)
+            finally:
+                self._queue.task_done()
+
+
+_reaper = _Reaper()
+
+
+class SweepReport:
+    """Record of the orphans removed by `sweep_orphans`.
+
+    `removed` maps the path of each orphaned file or directory to its size
+    in bytes.
+
+    """
+    def __init__(self):
+        self.removed = {}
+
+    @property
+    def size(self):
+        return sum(self.removed.values())
+
+    def __repr__(self):
+        return '<%s %d paths, %d bytes>' % (type(self).__name__,
+                                            len(self.removed), self.size)
+
+
+def sweep_orphans(root=None, dry_run=False):
+    """Remove temporary files and directories left behind by dead processes.
+
+    Every temporary directory (and output) QIIME 2 creates is accompanied
+    by a hidden marker recording the PID and host of the process which
+    owns it. A path is only removed when its owner ran on this host and
+    is no longer running, so sweeping is safe while other processes are
+    using the same temporary directory. Paths without a marker are never
+    touched.
+
+    Parameters
+    ----------
+    root : str or pathlib.Path, optional
+        Directory to sweep. If not provided, every root returned by
+        `get_temp_root` is swept.
+    dry_run : bool, optional
+        Only report what would be removed.
+
+    Returns
+    -------
+    SweepReport
+
+    """
+    if root is None:
+        roots = {get_temp_root(kind)
+                 for kind in (None,) + tuple(TEMP_ROOT_KIND_ENVS)}
+    else:
+        roots = {str(root)}
+
+    report = SweepReport()
+    for root in sorted(roots):
+        try:
+            names = os.listdir(root)
+        except OSError:
+            continue
+
+        for name in sorted(names):
+            if not (name.startswith('.') and name.endswith(OWNER_SUFFIX)):
+                continue
+            try:
+                with open(os.path.join(root, name)) as fh:
+                    owner = json.load(fh)
+            except (OSError, ValueError):
+                # Vanished, or still being written.
+                continue
+            if not isinstance(owner, dict) or not _is_orphaned(owner):
+                continue
+
+            path = os.path.join(root, name[1:-len(OWNER_SUFFIX)])
+            report.removed[path] = _get_size(path)
+            if not dry_run:
+                _delete(path)
+    return report
+
+
+def _sweep_orphans_from_environ():
+    # Startup hook, opted into by setting QIIME2_SWEEP_ORPHANS.
+    if os.environ.get(SWEEP_ENV, '') not in ('', '0'):
+        return sweep_orphans()
+
 
 def _party_parrot(self, *args):
     raise TypeError("Cannot mutate %r." % self)
@@ -25,32 +359,53 @@ class OwnedPath(_ConcretePath):
     def __new__(cls, *args, **kwargs):
         self = super().__new__(cls, *args, **kwargs)
         self._user_owned = True
+        # Checksums of the files copied into this directory, as
+        # {relpath: (fingerprint, md5sum)}. See `_move_or_copy`.
+        self._checksums = {}
         return self
 
-    def _copy_dir_or_file(self, other):
-        if self.is_dir():
-            return distutils.dir_util.copy_tree(str(self), str(other))
-        else:
-            return shutil.copy(str(self), str(other))
+    # Hardlinking a user's file would let later changes to it reach into the
+    # archive, so user owned files are cloned or copied.
+    USER_OWNED_STRATEGIES = ('reflink', 'copy')
+    MOVE_STRATEGIES = ('hardlink', 'reflink', 'copy')
 
-    def _destruct(self):
-        if self.is_dir():
-            distutils.dir_util.remove_tree(str(self))
-        else:
-            self.unlink()
+    def _move_or_copy(self, other, checksums=None):
+        """Move (or copy, if user owned) this path to `other`.
 
-    def _move_or_copy(self, other):
+        Returns a `TransferReport` of the strategy used for each file. Files
+        which had to be copied are hashed along the way. When this path is a
+        directory `checksums` (if provided) is updated with them, and with
+        the checksums of files copied into this directory earlier, see
+        `TransferReport.checksums`.
+
+        """
+        is_dir = self.is_dir()
         if self._user_owned:
-            return self._copy_dir_or_file(other)
+            report = transfer_tree(self, other,
+                                   strategies=self.USER_OWNED_STRATEGIES)
         else:
-            # Certain networked filesystems will experience a race
-            # condition on `rename`, so fall back to copying.
             try:
-                return _ConcretePath.rename(self, other)
-            except FileExistsError:
-                copied = self._copy_dir_or_file(other)
-                self._destruct()
-                return copied
+                _ConcretePath.rename(self, other)
+            except OSError as e:
+                # Certain networked filesystems will experience a race
+                # condition on `rename`, and a rename can't cross devices,
+                # so fall back to transferring each file.
+                if (not isinstance(e, FileExistsError)
+                        and e.errno != errno.EXDEV):
+                    raise
+                report = transfer_tree(self, other,
+                                       strategies=self.MOVE_STRATEGIES)
+                _reaper.reap(self)
+            else:
+                report = TransferReport()
+                report.strategies['.'] = 'rename'
+
+        if checksums is not None and is_dir:
+            # Files which were renamed or hardlinked keep their fingerprint,
+            # so their earlier checksums still hold.
+            checksums.update(self._checksums)
+            checksums.update(report.checksums)
+        return report
 
 
 class InPath(OwnedPath):
@@ -59,6 +414,8 @@ class InPath(OwnedPath):
         self.__backing_path = path
         if hasattr(path, '_user_owned'):
             self._user_owned = path._user_owned
+        if hasattr(path, '_checksums'):
+            self._checksums = path._checksums
         return self
 
     chmod = lchmod = rename = replace = rmdir = symlink_to = touch = unlink = \
@@ -73,20 +430,17 @@ class InPath(OwnedPath):
 
 
 class OutPath(OwnedPath):
+    TEMP_KIND = 'output'
+
     @classmethod
     def _destruct(cls, path):
-        if not os.path.exists(path):
-            return
-
-        if os.path.isdir(path):
-            shutil.rmtree(path)
-        else:
-            os.unlink(path)
+        _reaper.reap(path)
 
     def __new__(cls, dir=False, **kwargs):
         """
         Create a tempfile, return pathlib.Path reference to it.
         """
+        kwargs.setdefault('dir', get_temp_root(cls.TEMP_KIND))
         if dir:
             name = tempfile.mkdtemp(**kwargs)
         else:
@@ -96,6 +450,7 @@ class OutPath(OwnedPath):
             # producing a different file descriptor, so close this one to
             # prevent a resource leak.
             os.close(fd)
+        _write_owner(name)
         obj = super().__new__(cls, name)
         obj._destructor = weakref.finalize(obj, cls._destruct, str(obj))
         return obj
@@ -107,12 +462,14 @@ class OutPath(OwnedPath):
 
 class InternalDirectory(_ConcretePath):
     DEFAULT_PREFIX = 'qiime2-'
+    TEMP_KIND = None
 
     @classmethod
     def _destruct(cls, path):
         """DO NOT USE DIRECTLY, use `_destructor()` instead"""
-        if os.path.exists(path):
-            shutil.rmtree(path)
+        # The path is gone once this returns, its contents are deleted in
+        # the background.
+        _reaper.reap(path)
 
     @classmethod
     def __new(cls, *args):
@@ -132,8 +489,9 @@ class InternalDirectory(_ConcretePath):
                 prefix = cls.DEFAULT_PREFIX
             elif not prefix.startswith(cls.DEFAULT_PREFIX):
                 prefix = cls.DEFAULT_PREFIX + prefix
-            # TODO: normalize when temp-directories are configurable
-            path = tempfile.mkdtemp(prefix=prefix)
+            path = tempfile.mkdtemp(prefix=prefix,
+                                    dir=get_temp_root(cls.TEMP_KIND))
+            _write_owner(path)
             return cls.__new(path)
 
     def __truediv__(self, path):
@@ -148,7 +506,9 @@ class InternalDirectory(_ConcretePath):
 
 class ArchivePath(InternalDirectory):
     DEFAULT_PREFIX = 'qiime2-archive-'
+    TEMP_KIND = 'archive'
 
 
 class ProvenancePath(InternalDirectory):
     DEFAULT_PREFIX = 'qiime2-provenance-'
+    TEMP_KIND = 'provenance'
@@ -7,12 +7,21 @@
 # ----------------------------------------------------------------------------
 
 import os
+import json
+import socket
 import pathlib
+import subprocess
+import sys
 import shutil
 import tempfile
+import time
+import queue
 import unittest
+import unittest.mock
 
-from qiime2.core.path import OwnedPath, OutPath
+import qiime2.core.path as qpath
+from qiime2.core.path import (OwnedPath, OutPath, ArchivePath, ProvenancePath,
+                              get_temp_root, set_temp_root, sweep_orphans)
 
 
 class TestOwnedPath(unittest.TestCase):
@@ -28,11 +37,16 @@ class TestOwnedPath(unittest.TestCase):
         # ensure that we are owned
         d._user_owned = True
 
-        d._move_or_copy(self.to_dir)
+        report = d._move_or_copy(self.to_dir)
 
         # since from_dir is owned, _move_or_copy should copy, not move
         self.assertTrue(os.path.exists(os.path.join(self.from_dir, 'foo.txt')))
         self.assertTrue(os.path.exists(os.path.join(self.to_dir, 'foo.txt')))
+        # nor should it be hardlinked, the user could change it later
+        self.assertIn(report.strategies['foo.txt'], {'reflink', 'copy'})
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.from_dir, 'foo.txt'),
+            os.path.join(self.to_dir, 'foo.txt')))
 
         shutil.rmtree(self.from_dir)
         shutil.rmtree(self.to_dir)
@@ -42,7 +56,8 @@ class TestOwnedPath(unittest.TestCase):
         # ensure that we are not owned
         d._user_owned = False
 
-        d._move_or_copy(self.to_dir)
+        report = d._move_or_copy(self.to_dir)
+        self.assertEqual(report.strategies, {'.': 'rename'})
 
         # since from_dir is not owned, _move_or_copy should move, not copy
         self.assertFalse(os.path.exists(os.path.join(self.from_dir,
@@ -59,7 +74,9 @@ class TestOwnedPath(unittest.TestCase):
         # ensure that we are not owned
         d._user_owned = False
 
-        d._move_or_copy(self.to_dir)
+        report = d._move_or_copy(self.to_dir)
+        # the files themselves can still be linked
+        self.assertEqual(report.strategies, {'foo.txt': 'hardlink'})
 
         # since from_dir is not owned, but the network fs race condition crops
         # up, _move_or_copy should copy, not move, but then we still ensure
@@ -99,5 +116,263 @@ class TestOutPath(unittest.TestCase):
         self.assertFalse(os.path.isfile(path))
 
 
+class TestTempRoot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        self.root = os.path.join(self.temp_dir.name, 'root')
+        self.scratch = os.path.join(self.temp_dir.name, 'scratch')
+
+    def tearDown(self):
+        for kind in (None, 'archive', 'provenance', 'output'):
+            set_temp_root(None, kind=kind)
+        self.temp_dir.cleanup()
+
+    def assertCreatedIn(self, path, root):
+        self.assertEqual(os.path.dirname(str(path)), root)
+
+    def test_default(self):
+        with unittest.mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(get_temp_root(), tempfile.gettempdir())
+            self.assertEqual(get_temp_root('archive'), tempfile.gettempdir())
+
+    def test_set_temp_root(self):
+        set_temp_root(self.root)
+        set_temp_root(self.scratch, kind='archive')
+
+        self.assertTrue(os.path.isdir(get_temp_root()))
+        self.assertCreatedIn(ArchivePath(), self.scratch)
+        self.assertCreatedIn(ProvenancePath(), self.root)
+        self.assertCreatedIn(OutPath(), self.root)
+        self.assertCreatedIn(OutPath(dir=True), self.root)
+
+        set_temp_root(None, kind='archive')
+        self.assertCreatedIn(ArchivePath(), self.root)
+
+    def test_environ(self):
+        environ = {'QIIME2_TMPDIR': self.root,
+                   'QIIME2_OUTPUT_TMPDIR': self.scratch}
+        with unittest.mock.patch.dict(os.environ, environ):
+            self.assertCreatedIn(ArchivePath(), self.root)
+            self.assertCreatedIn(OutPath(), self.scratch)
+
+            # Roots which were set explicitly take precedence.
+            set_temp_root(self.scratch)
+            self.assertCreatedIn(ArchivePath(), self.scratch)
+
+    def test_destructor_in_temp_root(self):
+        set_temp_root(self.root)
+        path = ArchivePath()
+        self.assertTrue(path.exists())
+
+        path._destructor()
+        self.assertFalse(path.exists())
+        self.assertTrue(os.path.isdir(self.root))
+
+    def test_invalid_kind(self):
+        with self.assertRaisesRegex(ValueError, 'kind.*not .scratch'):
+            get_temp_root('scratch')
+        with self.assertRaisesRegex(ValueError, 'kind'):
+            set_temp_root(self.root, kind='scratch')
+
+
+class TestReaper(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        self.path = os.path.join(self.temp_dir.name, 'doomed')
+        os.makedirs(os.path.join(self.path, 'nested'))
+        pathlib.Path(self.path, 'nested', 'file.txt').touch()
+        self.reaper = qpath._Reaper()
+
+    def tearDown(self):
+        self.reaper.stop()
+        self.temp_dir.cleanup()
+
+    def test_reap(self):
+        self.reaper.reap(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+        self.reaper.drain()
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_reap_file(self):
+        path = os.path.join(self.path, 'nested', 'file.txt')
+        self.reaper.reap(path)
+        self.reaper.drain()
+
+        self.assertEqual(os.listdir(os.path.join(self.path, 'nested')), [])
+
+    def test_reap_missing(self):
+        self.reaper.reap(os.path.join(self.temp_dir.name, 'missing'))
+        self.reaper.drain()
+
+    def test_reap_queue_full(self):
+        with unittest.mock.patch.object(queue.Queue, 'put_nowait',
+                                        side_effect=queue.Full):
+            self.reaper.reap(self.path)
+
+        # Deleted by the caller instead.
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_reap_stopped(self):
+        self.reaper.stop()
+        self.reaper.reap(self.path)
+
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        self.assertIsNone(self.reaper._thread)
+
+    def test_reap_delete_fails(self):
+        other = os.path.join(self.temp_dir.name, 'other')
+        os.mkdir(other)
+
+        delete = qpath._delete
+        failed = []
+
+        def fail_once(path):
+            if not failed:
+                failed.append(path)
+                raise PermissionError(path)
+            delete(path)
+
+        with unittest.mock.patch.object(qpath, '_delete', fail_once), \
+                self.assertWarnsRegex(RuntimeWarning, 'Could not delete'):
+            self.reaper.reap(self.path)
+            self.assertTrue(self.reaper.drain(timeout=10))
+            self.reaper.reap(other)
+            self.assertTrue(self.reaper.drain(timeout=10))
+
+        self.assertTrue(self.reaper._thread.is_alive())
+        # Only the path which failed is left, for `sweep_orphans`.
+        self.assertEqual(os.listdir(self.temp_dir.name),
+                         [os.path.basename(failed[0])])
+
+    def test_stop_timeout(self):
+        with unittest.mock.patch.object(qpath, '_delete',
+                                        lambda path: time.sleep(1)):
+            self.reaper.reap(self.path)
+            self.assertFalse(self.reaper.stop(timeout=0.01))
+        self.assertTrue(self.reaper.drain(timeout=10))
+
+    def test_restart_dead_thread(self):
+        self.reaper.reap(self.path)
+        self.reaper.drain()
+        thread = self.reaper._thread
+        with unittest.mock.patch.object(thread, 'is_alive',
+                                        return_value=False):
+            self.reaper._start()
+        self.assertIsNot(self.reaper._thread, thread)
+
+    def test_destructor(self):
+        set_temp_root(self.temp_dir.name)
+        self.addCleanup(set_temp_root, None)
+        path = ArchivePath()
+        (path / 'file.txt').touch()
+
+        path._destructor()
+        self.assertFalse(path.exists())
+        qpath._reaper.drain()
+        self.assertEqual(os.listdir(self.temp_dir.name), ['doomed'])
+
+
+class TestSweepOrphans(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        self.root = self.temp_dir.name
+        set_temp_root(self.root)
+
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.dead_pid = process.pid
+
+    def tearDown(self):
+        set_temp_root(None)
+        self.temp_dir.cleanup()
+
+    def make_orphan(self, name, **owner):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.join(path, 'data'))
+        pathlib.Path(path, 'data', 'file.txt').write_bytes(b'x' * 10)
+        owner = {'pid': self.dead_pid, 'host': socket.gethostname(),
+                 'start': None, **owner}
+        with open(qpath._get_owner_marker(path), 'w') as fh:
+            json.dump(owner, fh)
+        return path
+
+    def test_owner_marker(self):
+        path = ArchivePath()
+        with open(qpath._get_owner_marker(path)) as fh:
+            owner = json.load(fh)
+        self.assertEqual(owner['pid'], os.getpid())
+
+        path._destructor()
+        qpath._reaper.drain()
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_sweep(self):
+        orphan = self.make_orphan('qiime2-archive-orphan')
+        alive = ArchivePath()
+        output = OutPath()
+        unmarked = os.path.join(self.root, 'qiime2-archive-unmarked')
+        os.mkdir(unmarked)
+
+        report = sweep_orphans()
+
+        self.assertEqual(list(report.removed), [orphan])
+        self.assertGreaterEqual(report.size, 10)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(qpath._get_owner_marker(orphan)))
+        for path in alive, output, unmarked:
+            self.assertTrue(os.path.exists(str(path)))
+
+    def test_sweep_dry_run(self):
+        orphan = self.make_orphan('qiime2-archive-orphan')
+
+        report = sweep_orphans(self.root, dry_run=True)
+
+        self.assertEqual(list(report.removed), [orphan])
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_sweep_other_host(self):
+        orphan = self.make_orphan('qiime2-archive-orphan',
+                                  host='not-%s' % socket.gethostname())
+
+        self.assertEqual(sweep_orphans().removed, {})
+        self.assertTrue(os.path.exists(orphan))
+
+    @unittest.skipIf(qpath._get_start_time(os.getpid()) is None,
+                     'Process start times are unavailable.')
+    def test_sweep_reused_pid(self):
+        start = qpath._get_start_time(os.getpid())
+        reused = self.make_orphan('qiime2-reused', pid=os.getpid(),
+                                  start=start - 1)
+        current = self.make_orphan('qiime2-current', pid=os.getpid(),
+                                   start=start)
+
+        self.assertEqual(list(sweep_orphans().removed), [reused])
+        self.assertTrue(os.path.exists(current))
+
+    def test_sweep_moved_path(self):
+        # e.g. provenance which was moved into its archive
+        orphan = self.make_orphan('qiime2-provenance-orphan')
+        os.rename(orphan, orphan + '-moved')
+
+        report = sweep_orphans()
+
+        self.assertEqual(report.removed, {orphan: 0})
+        self.assertEqual(os.listdir(self.root), [
+            'qiime2-provenance-orphan-moved'])
+
+    def test_sweep_from_environ(self):
+        orphan = self.make_orphan('qiime2-archive-orphan')
+
+        with unittest.mock.patch.dict(os.environ,
+                                      {'QIIME2_SWEEP_ORPHANS': ''}):
+            self.assertIsNone(qpath._sweep_orphans_from_environ())
+        with unittest.mock.patch.dict(os.environ,
+                                      {'QIIME2_SWEEP_ORPHANS': '1'}):
+            report = qpath._sweep_orphans_from_environ()
+
+        self.assertEqual(list(report.removed), [orphan])
+
+
 if __name__ == '__main__':
     unittest.main()
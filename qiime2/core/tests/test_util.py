@@ -6,7 +6,11 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+import errno
+import hashlib
 import unittest
+import unittest.mock
 import tempfile
 import pathlib
 import collections
@@ -125,6 +129,35 @@ class TestDurationTime(unittest.TestCase):
             util.duration_time(reldelta), '1955 microseconds')
 
 
+class TestGetWorkerCount(unittest.TestCase):
+    def test_default(self):
+        with unittest.mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(util.get_worker_count(), 1)
+
+    def test_explicit(self):
+        with unittest.mock.patch.dict(os.environ,
+                                      {'QIIME2_ARCHIVE_WORKERS': '3'}):
+            self.assertEqual(util.get_worker_count(5), 5)
+
+    def test_environ(self):
+        with unittest.mock.patch.dict(os.environ,
+                                      {'QIIME2_ARCHIVE_WORKERS': '3'}):
+            self.assertEqual(util.get_worker_count(), 3)
+
+    def test_zero_is_cpu_count(self):
+        self.assertEqual(util.get_worker_count(0), os.cpu_count() or 1)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'cannot be negative'):
+            util.get_worker_count(-1)
+
+        with unittest.mock.patch.dict(os.environ,
+                                      {'QIIME2_ARCHIVE_WORKERS': 'many'}):
+            with self.assertRaisesRegex(ValueError,
+                                        'QIIME2_ARCHIVE_WORKERS.*many'):
+                util.get_worker_count()
+
+
 class TestMD5Sum(unittest.TestCase):
     # All expected results where generated via GNU coreutils md5sum
     def setUp(self):
@@ -154,6 +187,12 @@ class TestMD5Sum(unittest.TestCase):
         self.assertEqual(util.md5sum(path),
                          '27d64211ee283283ad866c18afa26611')
 
+    def test_file_spanning_many_reads(self):
+        path = self.make_file(b'verybigfile' * (1024 * 50))
+        with unittest.mock.patch.object(util, '_HASH_CHUNK_SIZE', 1000):
+            self.assertEqual(util.md5sum(path),
+                             '27d64211ee283283ad866c18afa26611')
+
     def test_can_use_string(self):
         string_path = str(self.make_file(b'Normal text\nand things\n'))
         self.assertEqual(util.md5sum(string_path),
@@ -253,6 +292,238 @@ class TestMD5SumDirectory(unittest.TestCase):
                 ('bar/foo.baz', 'dcc0975b66728be0315abae5968379cb')
             ]))
 
+    def test_known_checksums(self):
+        self.make_file(b'foo', 'foo')
+        self.make_file(b'bar', 'bar')
+        known = {name: (util.get_fingerprint(self.test_path / name),
+                        'not read again' if name == 'foo' else 'stale')
+                 for name in ('foo', 'bar')}
+        # Rewriting a file changes its fingerprint.
+        (self.test_path / 'bar').unlink()
+        self.make_file(b'bar', 'bar')
+
+        self.assertEqual(
+            util.md5sum_directory(self.test_path, known=known),
+            collections.OrderedDict([
+                ('bar', '37b51d194a7513e45b56f6524f2d51f2'),
+                ('foo', 'not read again')
+            ]))
+
+    def test_workers(self):
+        for name in ('z', 'b', 'a'):
+            nested_dir = self.test_path / name
+            nested_dir.mkdir()
+            for idx in range(10):
+                self.make_file(b'%d' % idx, nested_dir / str(idx))
+        self.make_file(b'', '.hidden')
+
+        expected = util.md5sum_directory(self.test_path, workers=1)
+        self.assertEqual(len(expected), 30)
+        self.assertEqual(list(expected)[:2], ['a/0', 'a/1'])
+
+        for workers in (2, 7, 0):
+            observed = util.md5sum_directory(self.test_path, workers=workers)
+            self.assertEqual(list(observed.items()), list(expected.items()))
+
+        with unittest.mock.patch.dict(os.environ,
+                                      {'QIIME2_ARCHIVE_WORKERS': '4'}):
+            observed = util.md5sum_directory(self.test_path)
+        self.assertEqual(list(observed.items()), list(expected.items()))
+
+
+class TestChecksum(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        self.test_path = pathlib.Path(self.test_dir.name)
+        self.data = b'verybigfile' * (1024 * 50)
+        self.path = self.test_path / 'file'
+        self.path.write_bytes(self.data)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_algorithms(self):
+        for algorithm in ('md5', 'sha256', 'blake2b'):
+            self.assertEqual(util.checksum(self.path, algorithm),
+                             hashlib.new(algorithm, self.data).hexdigest())
+
+    def test_unknown_algorithm(self):
+        with self.assertRaisesRegex(ValueError, "algorithm 'crc7'.*md5"):
+            util.checksum(self.path, 'crc7')
+        with self.assertRaisesRegex(ValueError, "algorithm 'crc7'"):
+            util.checksum_directory(self.test_path, 'crc7')
+
+    def test_blake2b_tree(self):
+        single_leaf = util.checksum(self.path, 'blake2b-tree')
+        self.assertEqual(len(single_leaf), 128)
+        self.assertNotEqual(single_leaf, util.checksum(self.path, 'blake2b'))
+
+        with unittest.mock.patch.object(util, '_TREE_LEAF_SIZE', 100000):
+            self.assertEqual(util._count_leaves(self.path), 6)
+            expected = util.checksum(self.path, 'blake2b-tree', workers=1)
+            for workers in (2, 6, 0):
+                self.assertEqual(
+                    util.checksum(self.path, 'blake2b-tree', workers=workers),
+                    expected)
+
+            (self.test_path / 'empty').write_bytes(b'')
+            self.assertEqual(
+                util.checksum_directory(self.test_path, 'blake2b-tree',
+                                        workers=4),
+                collections.OrderedDict([
+                    ('empty', util.checksum(self.test_path / 'empty',
+                                            'blake2b-tree')),
+                    ('file', expected)
+                ]))
+
+        self.assertNotEqual(expected, single_leaf)
+
+
+class TestCopyWithMD5Sum(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        self.test_path = pathlib.Path(self.test_dir.name)
+        self.src = self.test_path / 'src'
+        (self.src / 'nested').mkdir(parents=True)
+        (self.src / 'a.txt').write_bytes(b'verybigfile' * (1024 * 50))
+        (self.src / 'nested' / 'b.txt').write_bytes(b'anything at all')
+        (self.src / '.hidden').write_bytes(b'')
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_copy_with_md5sum(self):
+        dst = self.test_path / 'a.txt'
+        (self.src / 'a.txt').chmod(0o640)
+
+        with unittest.mock.patch.object(util, '_HASH_CHUNK_SIZE', 1000):
+            checksum = util.copy_with_md5sum(self.src / 'a.txt', dst)
+
+        self.assertEqual(checksum, '27d64211ee283283ad866c18afa26611')
+        self.assertEqual(dst.read_bytes(), (self.src / 'a.txt').read_bytes())
+        self.assertEqual(dst.stat().st_mode & 0o777, 0o640)
+
+    def test_copy_tree_with_md5sum(self):
+        for workers in (1, 3):
+            dst = self.test_path / ('dst-%d' % workers)
+            dst.mkdir()
+
+            copied = util.copy_tree_with_md5sum(self.src, dst,
+                                                workers=workers)
+
+            self.assertEqual(
+                {relpath: checksum for relpath, (_, checksum) in
+                 copied.items()},
+                {'a.txt': '27d64211ee283283ad866c18afa26611',
+                 os.path.join('nested', 'b.txt'):
+                     'dcc0975b66728be0315abae5968379cb',
+                 '.hidden': 'd41d8cd98f00b204e9800998ecf8427e'})
+            self.assertEqual(
+                {relpath: util.get_fingerprint(dst / relpath)
+                 for relpath in copied},
+                {relpath: fingerprint for relpath, (fingerprint, _) in
+                 copied.items()})
+            self.assertEqual(util.md5sum_directory(dst),
+                             util.md5sum_directory(self.src))
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory(prefix='qiime2-test-temp-')
+        self.test_path = pathlib.Path(self.test_dir.name)
+        self.src = self.test_path / 'src'
+        (self.src / 'nested').mkdir(parents=True)
+        (self.src / 'a.txt').write_bytes(b'verybigfile' * (1024 * 50))
+        (self.src / 'nested' / 'b.txt').write_bytes(b'anything at all')
+        self.dst = self.test_path / 'dst'
+        self.relpaths = ['a.txt', os.path.join('nested', 'b.txt')]
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def assertTransferred(self, report, strategy):
+        self.assertEqual(report.strategies,
+                         {relpath: strategy for relpath in self.relpaths})
+        self.assertEqual(util.md5sum_directory(self.dst),
+                         util.md5sum_directory(self.src))
+
+    def test_hardlink(self):
+        report = util.transfer_tree(self.src, self.dst,
+                                    strategies=('hardlink', 'copy'))
+
+        self.assertTransferred(report, 'hardlink')
+        self.assertEqual(report.checksums, {})
+        self.assertTrue(os.path.samefile(str(self.src / 'a.txt'),
+                                         str(self.dst / 'a.txt')))
+        self.assertEqual(repr(report), '<TransferReport hardlink=2>')
+
+    def test_reflink(self):
+        with unittest.mock.patch.object(util, 'reflink') as reflink:
+            report = util.transfer_tree(self.src, self.dst,
+                                        strategies=('reflink', 'copy'))
+
+        self.assertEqual(report.strategies,
+                         {relpath: 'reflink' for relpath in self.relpaths})
+        reflink.assert_any_call(str(self.src / 'a.txt'),
+                                str(self.dst / 'a.txt'))
+
+    def test_fallback_to_copy(self):
+        unsupported = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        with unittest.mock.patch.object(util, 'reflink',
+                                        side_effect=unsupported):
+            report = util.transfer_tree(self.src, self.dst,
+                                        strategies=('reflink', 'copy'),
+                                        workers=2)
+
+        self.assertTransferred(report, 'copy')
+        self.assertEqual(
+            {relpath: checksum for relpath, (_, checksum) in
+             report.checksums.items()},
+            {'a.txt': '27d64211ee283283ad866c18afa26611',
+             os.path.join('nested', 'b.txt'):
+                 'dcc0975b66728be0315abae5968379cb'})
+        self.assertEqual(report.counts, {'copy': 2})
+
+    def test_cross_device(self):
+        devices = {str(self.src): 1, str(self.dst): 2}
+        with unittest.mock.patch.object(
+                util, '_get_device', side_effect=devices.get), \
+                unittest.mock.patch('os.link') as link:
+            report = util.transfer_tree(self.src, self.dst)
+
+        self.assertTransferred(report, 'copy')
+        link.assert_not_called()
+        self.assertTrue((self.src / 'a.txt').exists())
+
+    def test_rename_file(self):
+        report = util.transfer_tree(self.src / 'a.txt', self.dst)
+
+        self.assertEqual(report.strategies, {'.': 'rename'})
+        self.assertFalse((self.src / 'a.txt').exists())
+        self.assertTrue(self.dst.is_file())
+
+    def test_copy_file(self):
+        report = util.transfer_tree(self.src / 'a.txt', self.dst,
+                                    strategies=('copy',))
+
+        self.assertEqual(report.strategies, {'.': 'copy'})
+        self.assertEqual(report.checksums, {'.': (
+            util.get_fingerprint(self.dst),
+            '27d64211ee283283ad866c18afa26611')})
+        self.assertTrue((self.src / 'a.txt').exists())
+
+    def test_unexpected_error(self):
+        with unittest.mock.patch.object(util, 'reflink',
+                                        side_effect=OSError(errno.EIO, 'I/O')):
+            with self.assertRaisesRegex(OSError, 'I/O'):
+                util.transfer_file(self.src / 'a.txt', self.dst,
+                                   strategies=('reflink', 'copy'))
+
+    def test_invalid_strategy(self):
+        with self.assertRaisesRegex(ValueError, 'not .teleport'):
+            util.transfer_file(self.src / 'a.txt', self.dst,
+                               strategies=('teleport',))
+
 
 class TestChecksumFormat(unittest.TestCase):
     def test_to_simple(self):
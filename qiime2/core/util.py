@@ -9,11 +9,39 @@
 import contextlib
 import warnings
 import hashlib
+import errno
 import os
-import io
+import sys
+import shutil
 import collections
+import concurrent.futures
+import functools
+import itertools
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 import decorator
+import yaml
+
+
+# libyaml's emitter and parser are much faster than the pure-Python ones,
+# use them whenever PyYAML was built with it.
+YAMLDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+YAMLSafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def add_yaml_representer(data_type, representer):
+    """Register a YAML representer with the C and pure-Python dumpers.
+
+    See `yaml.add_representer`. Registering with `yaml.Dumper` keeps plain
+    `yaml.dump` working for code outside of the framework.
+
+    """
+    for dumper in {yaml.Dumper, YAMLDumper}:
+        yaml.add_representer(data_type, representer, Dumper=dumper)
 
 
 def get_view_name(view):
@@ -105,17 +133,353 @@ def duration_time(relative_delta):
         return '0 %s' % attrs[-1]
 
 
+def get_worker_count(workers=None, environ='QIIME2_ARCHIVE_WORKERS'):
+    """Determine how many threads archive I/O should be spread across.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of worker threads. If not provided, the environment variable
+        named by `environ` is consulted, falling back to a single worker.
+        Zero means one worker per CPU.
+    environ : str, optional
+        Environment variable to consult when `workers` is not provided.
+
+    Returns
+    -------
+    int
+        The number of worker threads to use, at least 1.
+
+    """
+    if workers is None:
+        workers = os.environ.get(environ, 1)
+
+    try:
+        workers = int(workers)
+    except ValueError:
+        raise ValueError("%s must be an integer, not %r."
+                         % (environ, workers))
+
+    if workers < 0:
+        raise ValueError("The number of workers cannot be negative: %r."
+                         % workers)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    return workers
+
+
+# Large reads keep the number of (GIL-acquiring) calls per file low, hashlib
+# releases the GIL while it digests each one.
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Files hashed as a tree are split into leaves of this size, each of which may
+# be hashed by a different thread. Changing this changes the digests!
+_TREE_LEAF_SIZE = 8 * 1024 * 1024
+
+_HASH_FACTORIES = collections.OrderedDict([
+    ('md5', hashlib.md5),
+    ('sha256', hashlib.sha256),
+    ('blake2b', hashlib.blake2b),
+])
+try:
+    import blake3
+except ImportError:
+    pass
+else:
+    _HASH_FACTORIES['blake3'] = blake3.blake3
+
+CHECKSUM_ALGORITHMS = tuple(_HASH_FACTORIES) + ('blake2b-tree',)
+
+
+def _check_algorithm(algorithm):
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError("Unknown checksum algorithm %r, expected one of: %s."
+                         % (algorithm, ', '.join(CHECKSUM_ALGORITHMS)))
+
+
+def _map_concurrently(function, items, workers):
+    # Results are in the order of `items`, not of completion.
+    items = list(items)
+    workers = min(get_worker_count(workers), len(items))
+    if workers <= 1:
+        return [function(item) for item in items]
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(function, items))
+
+
+def _read_into(filepath, update, offset=0, length=None):
+    buffer = bytearray(_HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(str(filepath), mode='rb', buffering=0) as fh:
+        fh.seek(offset)
+        while length is None or length > 0:
+            window = view if length is None else view[:length]
+            size = fh.readinto(window)
+            if not size:
+                break
+            update(view[:size])
+            if length is not None:
+                length -= size
+
+
+def _blake2b_node(node_offset, node_depth, last_node):
+    # BLAKE2 tree hashing with unlimited fanout and a depth of 2: the leaves
+    # are hashed independently, the root hashes their concatenated digests.
+    return hashlib.blake2b(fanout=0, depth=2, leaf_size=_TREE_LEAF_SIZE,
+                           node_offset=node_offset, node_depth=node_depth,
+                           inner_size=hashlib.blake2b.MAX_DIGEST_SIZE,
+                           last_node=last_node)
+
+
+def _count_leaves(filepath):
+    size = os.path.getsize(str(filepath))
+    return max(1, -(-size // _TREE_LEAF_SIZE))
+
+
+def _hash_leaf(leaf):
+    filepath, index, last = leaf
+    node = _blake2b_node(index, 0, last)
+    _read_into(filepath, node.update, offset=index * _TREE_LEAF_SIZE,
+               length=_TREE_LEAF_SIZE)
+    return node.digest()
+
+
+def _hash_root(leaves):
+    root = _blake2b_node(0, 1, True)
+    for leaf in leaves:
+        root.update(leaf)
+    return root.hexdigest()
+
+
+def _iter_leaves(filepath, count):
+    for index in range(count):
+        yield filepath, index, index == count - 1
+
+
+def checksum(filepath, algorithm='md5', workers=None):
+    """Compute the hex digest of a file.
+
+    `algorithm` is one of `CHECKSUM_ALGORITHMS`. With ``'blake2b-tree'``,
+    the file is hashed as a BLAKE2b tree whose leaves (8 MiB each) are
+    hashed across `workers` threads, see `get_worker_count`. The other
+    algorithms read the file sequentially.
+
+    """
+    _check_algorithm(algorithm)
+    if algorithm == 'blake2b-tree':
+        leaves = _iter_leaves(filepath, _count_leaves(filepath))
+        return _hash_root(_map_concurrently(_hash_leaf, leaves, workers))
+
+    hash_ = _HASH_FACTORIES[algorithm]()
+    _read_into(filepath, hash_.update)
+    return hash_.hexdigest()
+
+
 def md5sum(filepath):
+    return checksum(filepath, 'md5')
+
+
+def copy_with_md5sum(src, dst):
+    """Copy the file `src` to `dst`, computing its MD5 along the way.
+
+    Each chunk is hashed as it is copied, so the file is only read once.
+    Permission bits and times are copied as well (see `shutil.copystat`).
+
+    """
     md5 = hashlib.md5()
-    with open(str(filepath), mode='rb') as fh:
-        for chunk in iter(lambda: fh.read(io.DEFAULT_BUFFER_SIZE), b""):
+    with open(str(dst), mode='wb') as fout:
+        def update(chunk):
             md5.update(chunk)
+            fout.write(chunk)
+        _read_into(src, update)
+    shutil.copystat(str(src), str(dst))
     return md5.hexdigest()
 
 
-def md5sum_directory(directory):
+def copy_tree_with_md5sum(src, dst, workers=None):
+    """Copy the directory `src` into `dst`, computing MD5s along the way.
+
+    Like `distutils.dir_util.copy_tree`, `dst` may exist already. Files are
+    copied across `workers` threads, see `get_worker_count`.
+
+    Returns a dict mapping the relative path of every file copied to a
+    ``(fingerprint, checksum)`` pair describing the copy, suitable as
+    `known` checksums for `md5sum_directory`.
+
+    """
+    return transfer_tree(src, dst, strategies=('copy',),
+                         workers=workers).checksums
+
+
+def get_fingerprint(filepath):
+    """Identify the exact bytes of a file without reading it.
+
+    A file which was renamed or hardlinked keeps its fingerprint (device,
+    inode, size and modification time), while one which was copied or
+    rewritten does not.
+
+    """
+    st = os.stat(str(filepath))
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+TRANSFER_STRATEGIES = ('rename', 'hardlink', 'reflink', 'copy')
+# _IOW(0x94, 9, int), see ioctl_ficlone(2).
+_FICLONE = 0x40049409
+# A strategy failing with one of these errors isn't available for that file,
+# so the next one is tried.
+_TRANSFER_FALLBACK_ERRNOS = frozenset([
+    errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.EOPNOTSUPP,
+    errno.ENOTTY, errno.EINVAL, errno.ENOSYS])
+
+
+class TransferReport:
+    """Record of how each file was transferred by `transfer_tree`.
+
+    `strategies` maps the relative path of each file to the strategy which
+    was used (one of `TRANSFER_STRATEGIES`). A directory which was renamed
+    as a whole, or a single file, is recorded as ``'.'``. `checksums` holds
+    the ``(fingerprint, md5)`` of the files which were copied, and so hashed
+    along the way, suitable as `known` checksums for `md5sum_directory`.
+
+    """
+    def __init__(self):
+        self.strategies = {}
+        self.checksums = {}
+
+    @property
+    def counts(self):
+        return collections.Counter(self.strategies.values())
+
+    def __repr__(self):
+        counts = self.counts
+        summary = ', '.join('%s=%d' % (strategy, counts[strategy])
+                            for strategy in TRANSFER_STRATEGIES
+                            if counts[strategy])
+        return '<%s %s>' % (type(self).__name__, summary or 'empty')
+
+
+def reflink(src, dst):
+    """Clone the file `src` to `dst`, sharing its data until either changes.
+
+    This is only supported on Linux by copy-on-write filesystems (such as
+    btrfs and XFS), an OSError is raised otherwise. Like `shutil.copy2`,
+    permission bits and times are copied as well.
+
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported", src)
+
+    src = str(src)
+    dst = str(dst)
+    with open(src, mode='rb') as fin:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fd, _FICLONE, fin.fileno())
+        except OSError:
+            os.close(fd)
+            os.unlink(dst)
+            raise
+        os.close(fd)
+    shutil.copystat(src, dst)
+
+
+def transfer_file(src, dst, strategies=TRANSFER_STRATEGIES):
+    """Transfer the file `src` to `dst` with the first strategy that works.
+
+    Returns the strategy which was used and the MD5 of the file if it was
+    copied (None otherwise).
+
+    """
+    strategies = list(strategies)
+    for strategy in strategies:
+        try:
+            if strategy == 'rename':
+                os.rename(str(src), str(dst))
+            elif strategy == 'hardlink':
+                os.link(str(src), str(dst))
+            elif strategy == 'reflink':
+                reflink(src, dst)
+            elif strategy == 'copy':
+                return strategy, copy_with_md5sum(src, dst)
+            else:
+                raise ValueError("Transfer strategy must be one of %s, not "
+                                 "%r." % (', '.join(map(repr,
+                                                        TRANSFER_STRATEGIES)),
+                                          strategy))
+        except OSError as e:
+            if (e.errno not in _TRANSFER_FALLBACK_ERRNOS
+                    or strategy == strategies[-1]):
+                raise
+        else:
+            return strategy, None
+    raise ValueError("At least one transfer strategy must be provided.")
+
+
+def _get_device(path):
+    # `path` may not exist yet, the device is decided by its parent.
+    path = os.path.abspath(str(path))
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def transfer_tree(src, dst, strategies=TRANSFER_STRATEGIES, workers=None):
+    """Transfer the directory (or file) `src` to `dst`, file by file.
+
+    Each file is transferred with the first of `strategies` that works
+    for it (see `transfer_file`). Renames, hardlinks and reflinks are only
+    attempted when `src` and `dst` are on the same device. Like
+    `distutils.dir_util.copy_tree`, `dst` may exist already. Files are
+    transferred across `workers` threads, see `get_worker_count`.
+
+    Returns a `TransferReport`.
+
+    """
+    src = str(src)
+    dst = str(dst)
+    strategies = list(strategies)
+    if _get_device(src) != _get_device(dst):
+        # Only a copy can cross devices, don't bother trying anything else.
+        strategies = [s for s in strategies if s == 'copy'] or strategies
+
+    report = TransferReport()
+    if not os.path.isdir(src):
+        strategy, md5 = transfer_file(src, dst, strategies)
+        report.strategies['.'] = strategy
+        if md5 is not None:
+            report.checksums['.'] = (get_fingerprint(dst), md5)
+        return report
+
+    relpaths = []
+    for root, dirs, files in os.walk(src, followlinks=True):
+        reldir = os.path.relpath(root, start=src)
+        os.makedirs(os.path.join(dst, reldir), exist_ok=True)
+        for file in files:
+            relpaths.append(os.path.normpath(os.path.join(reldir, file)))
+
+    def transfer(relpath):
+        target = os.path.join(dst, relpath)
+        strategy, md5 = transfer_file(os.path.join(src, relpath), target,
+                                      strategies)
+        if md5 is not None:
+            # The fingerprint is taken last, `copystat` changes the mtime.
+            report.checksums[relpath] = (get_fingerprint(target), md5)
+        return strategy
+
+    strategies_used = _map_concurrently(transfer, relpaths, workers)
+    report.strategies.update(zip(relpaths, strategies_used))
+    return report
+
+
+def iter_relpaths(directory):
+    """Yield the path of every (non-hidden) file found under `directory`.
+
+    Paths are relative to `directory`. The files of a directory (sorted)
+    come before its subdirectories (sorted).
+
+    """
     directory = str(directory)
-    sums = collections.OrderedDict()
     for root, dirs, files in os.walk(directory, topdown=True):
         dirs[:] = sorted([d for d in dirs if not d[0] == '.'])
         for file in sorted(files):
@@ -123,8 +487,73 @@ def md5sum_directory(directory):
                 continue
 
             path = os.path.join(root, file)
-            sums[os.path.relpath(path, start=directory)] = md5sum(path)
-    return sums
+            yield os.path.relpath(path, start=directory)
+
+
+def checksum_directory(directory, algorithm='md5', workers=None,
+                       known=None, relpaths=None):
+    """Compute the checksum of every (non-hidden) file found under `directory`.
+
+    Returns an OrderedDict mapping each file's path, relative to
+    `directory`, to its checksum (see `checksum`). The order is
+    deterministic: the files of a directory (sorted) come before its
+    subdirectories (sorted). Files are hashed across `workers` threads, see
+    `get_worker_count`.
+
+    `known` may map relative paths to a ``(fingerprint, checksum)`` pair
+    computed earlier with the same algorithm. A file whose fingerprint still
+    matches is not read again, its checksum is reused.
+
+    `relpaths` may name the files to hash (relative paths, as yielded by
+    `iter_relpaths`) instead of every file, in which case the result is in
+    that order.
+
+    """
+    _check_algorithm(algorithm)
+    directory = str(directory)
+    if known is None:
+        known = {}
+    if relpaths is None:
+        relpaths = iter_relpaths(directory)
+
+    checksums = collections.OrderedDict()
+    pending = []
+    for relpath in relpaths:
+        path = os.path.join(directory, relpath)
+        checksums[relpath] = None
+        if relpath in known:
+            fingerprint, checksum_ = known[relpath]
+            if get_fingerprint(path) == fingerprint:
+                checksums[relpath] = checksum_
+                continue
+        pending.append((relpath, path))
+
+    paths = [path for _, path in pending]
+    if algorithm == 'blake2b-tree':
+        # Every leaf of every file is a task of its own, so that the threads
+        # are kept busy by a single large file as well as by many small ones.
+        counts = [_count_leaves(path) for path in paths]
+        leaves = [leaf for path, count in zip(paths, counts)
+                  for leaf in _iter_leaves(path, count)]
+        digests = iter(_map_concurrently(_hash_leaf, leaves, workers))
+        computed = [_hash_root(itertools.islice(digests, count))
+                    for count in counts]
+    else:
+        computed = _map_concurrently(
+            functools.partial(checksum, algorithm=algorithm), paths, workers)
+
+    for (relpath, _), checksum_ in zip(pending, computed):
+        checksums[relpath] = checksum_
+    return checksums
+
+
+def md5sum_directory(directory, workers=None, known=None):
+    """Compute the MD5 of every (non-hidden) file found under `directory`.
+
+    See `checksum_directory`.
+
+    """
+    return checksum_directory(directory, 'md5', workers=workers, known=known)
 
 
 def to_checksum_format(filepath, checksum):
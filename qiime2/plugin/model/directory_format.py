@@ -85,7 +85,13 @@ class BoundFile:
 
         transformation = from_type.make_transformation(to_type)
         result = transformation(view)
-        result.path._move_or_copy(self.path_maker(**kwargs))
+        path = self.path_maker(**kwargs)
+        report = result.path._move_or_copy(path)
+        if '.' in report.checksums:
+            # Hashed while copying, remembered for the archive's checksums.
+            directory = self._directory_format.path
+            directory._checksums[str(path.relative_to(directory))] = \
+                report.checksums['.']
 
     def _validate_members(self, collected_paths, level):
         found_members = False
@@ -17,6 +17,7 @@ import decorator
 
 import qiime2.sdk
 import qiime2.core.type as qtype
+import qiime2.core.path
 import qiime2.core.archive as archive
 from qiime2.core.util import LateBindingAttribute, DropFirstParameter, tuplize
 
@@ -448,7 +449,9 @@ class Visualizer(Action):
         # TODO use qiime2.plugin.OutPath when it exists, and update visualizers
         # to work with OutPath instead of str. Visualization._from_data_dir
         # will also need to be updated to support OutPath instead of str.
-        with tempfile.TemporaryDirectory(prefix='qiime2-temp-') as temp_dir:
+        temp_root = qiime2.core.path.get_temp_root('output')
+        with tempfile.TemporaryDirectory(prefix='qiime2-temp-',
+                                         dir=temp_root) as temp_dir:
             ret_val = self._callable(output_dir=temp_dir, **view_args)
             if ret_val is not None:
                 raise TypeError(
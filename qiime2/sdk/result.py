@@ -6,8 +6,6 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-import os
-import shutil
 import collections
 import distutils.dir_util
 import pathlib
@@ -32,6 +30,9 @@ import qiime2.core.exceptions as exceptions
 ResultMetadata = collections.namedtuple('ResultMetadata',
                                         ['uuid', 'type', 'format'])
 
+PeekResult = collections.namedtuple('PeekResult',
+                                    ['filepath', 'metadata', 'error'])
+
 
 class Result:
     """Base class for QIIME 2 result classes (Artifact and Visualization).
@@ -53,17 +54,69 @@ class Result:
 
     @classmethod
     def peek(cls, filepath):
+        """Read the UUID, type and format of an archive without loading it.
+
+        `filepath` may also be the archive's contents (`bytes`, `bytearray`
+        or `memoryview`) or a readable, seekable binary file object, in which
+        case nothing is written to the filesystem.
+
+        """
         return ResultMetadata(*archive.Archiver.peek(filepath))
 
     @classmethod
-    def extract(cls, filepath, output_dir):
+    def peek_many(cls, filepaths, workers=None, processes=False):
+        """Peek at many archives concurrently.
+
+        Yields a `PeekResult` for each filepath as soon as it has been read
+        (so not necessarily in the order given). Its `metadata` is what
+        `peek` would return, or None if `peek` raised `error`. Only the zip's
+        central directory, VERSION and metadata.yaml are read, once per
+        archive. Archives are read across `workers` threads (see
+        `Result.load`), or processes if `processes` is True.
+
+        """
+        for filepath, metadata, error in archive.Archiver.peek_many(
+                filepaths, workers=workers, processes=processes):
+            if metadata is not None:
+                metadata = ResultMetadata(*metadata)
+            yield PeekResult(filepath, metadata, error)
+
+    @classmethod
+    def peek_provenance(cls, filepath):
+        """Read the provenance of an archive without loading it.
+
+        Returns the same `ProvenanceGraph` as `Result.provenance`, or None if
+        the archive predates provenance. Its action.yaml, citations.bib and
+        metadata files are read from the archive on demand, data is never
+        read and nothing is extracted. `filepath` may be anything `peek`
+        accepts.
+
+        """
+        return archive.Archiver.peek_provenance(filepath)
+
+    @classmethod
+    def extract(cls, filepath, output_dir, workers=None):
         """Unzip contents of Artifacts and Visualizations."""
-        return archive.Archiver.extract(filepath, output_dir)
+        return archive.Archiver.extract(filepath, output_dir, workers=workers)
 
     @classmethod
-    def load(cls, filepath):
-        """Factory for loading Artifacts and Visualizations."""
-        archiver = archive.Archiver.load(filepath)
+    def load(cls, filepath, lazy=False, workers=None):
+        """Factory for loading Artifacts and Visualizations.
+
+        `filepath` may also be the archive's contents (`bytes`, `bytearray`
+        or `memoryview`) or a readable, seekable binary file object.
+
+        When `lazy` is True, data and provenance are extracted from the
+        archive on first use instead of up front. The archive at `filepath`
+        must remain in place (or the file object open) for the lifetime of
+        the loaded result.
+
+        Extraction is spread across `workers` threads. If not provided, the
+        QIIME2_ARCHIVE_WORKERS environment variable is used, otherwise a
+        single thread. Zero means one thread per CPU.
+
+        """
+        archiver = archive.Archiver.load(filepath, lazy=lazy, workers=workers)
 
         if Artifact._is_valid_type(archiver.type):
             result = Artifact.__new__(Artifact)
@@ -100,6 +153,11 @@ class Result:
     def citations(self):
         return self._archiver.citations
 
+    @property
+    def provenance(self):
+        """The provenance graph of this result, see `ProvenanceGraph`."""
+        return self._archiver.provenance
+
     def __init__(self):
         raise NotImplementedError(
             "%(classname)s constructor is private, use `%(classname)s.load`, "
@@ -143,19 +201,42 @@ class Result:
     def _destructor(self):
         return self._archiver._destructor
 
-    def save(self, filepath):
-        if not filepath.endswith(self.extension):
+    def save(self, filepath, compresslevel=None, workers=None,
+             store_suffixes=None, detect_incompressible=True,
+             as_directory=False):
+        """Save to `filepath`, adding the result's extension if needed.
+
+        `filepath` may also be a writable binary file object, which does not
+        need to be seekable, e.g. a pipe to an upload process. The archive is
+        streamed to it in a single pass and the file object is returned.
+
+        Members are deflated at `compresslevel` (0-9, zlib's default if not
+        provided), except for files which are compressed already and are
+        stored as-is: those whose name ends with one of `store_suffixes`
+        (``.gz``, ``.png``, etc. by default) and, if `detect_incompressible`,
+        those whose first block does not shrink when deflated. Compression
+        is spread across `workers` threads, see `Result.load`.
+
+        When `as_directory` is True, the archive is instead written
+        uncompressed to the directory `filepath` (no extension is added),
+        which can be loaded again without extracting anything.
+
+        """
+        if (not hasattr(filepath, 'write') and not as_directory
+                and not filepath.endswith(self.extension)):
             filepath += self.extension
-        self._archiver.save(filepath)
+        self._archiver.save(filepath, compresslevel=compresslevel,
+                            workers=workers, store_suffixes=store_suffixes,
+                            detect_incompressible=detect_incompressible,
+                            as_directory=as_directory)
         return filepath
 
     def _alias(self, provenance_capture):
         def clone_original(into):
-            # directory is empty, this function is meant to fix that, so we
-            # can rmdir so that copytree is happy
-            into.rmdir()
-            shutil.copytree(str(self._archiver.data_dir), str(into),
-                            copy_function=os.link)  # Use hardlinks
+            # The original's data is never modified, so it can be shared
+            # using hardlinks (falling back to reflinks or copies).
+            util.transfer_tree(self._archiver.data_dir, into,
+                               strategies=('hardlink', 'reflink', 'copy'))
 
         cls = type(self)
         alias = cls.__new__(cls)
@@ -163,8 +244,23 @@ class Result:
             self.type, self.format, clone_original, provenance_capture)
         return alias
 
-    def validate(self, level=NotImplemented):
-        diff = self._archiver.validate_checksums()
+    def validate(self, level=NotImplemented, checksum_level='full',
+                 paths=None):
+        """Validate the files of the result against its recorded checksums.
+
+        `checksum_level` is ``'structure'`` (only compare the list of files),
+        ``'sample'`` (also hash a random sample of the files) or ``'full'``
+        (hash every file). `paths` may restrict validation to some files or
+        directories, relative to the root of the archive (e.g.
+        ``['data/ints.txt']``).
+
+        Raises
+        ------
+        ValidationError
+            If files were added, removed or changed.
+        """
+        diff = self._archiver.validate_checksums(level=checksum_level,
+                                                 paths=paths)
         if diff.changed or diff.added or diff.removed:
             error = ""
 
@@ -227,6 +323,8 @@ class Artifact(Result):
         md5sums = None
         if is_format:
             path = pathlib.Path(view)
+            # The archive's own checksums come from the copies of the data,
+            # which are hashed while they are made (see `_from_view`).
             if path.is_file():
                 md5sums = {path.name: util.md5sum(path)}
             elif path.is_dir():
@@ -266,10 +364,15 @@ class Artifact(Result):
                                                        recorder=recorder)
         result = transformation(view, validate_level)
 
+        def data_initializer(data_dir):
+            # Data which has to be copied is hashed along the way.
+            result.path._move_or_copy(
+                data_dir, checksums=provenance_capture.data_checksums)
+
         artifact = cls.__new__(cls)
         artifact._archiver = archive.Archiver.from_data(
             type, output_dir_fmt,
-            data_initializer=result.path._move_or_copy,
+            data_initializer=data_initializer,
             provenance_capture=provenance_capture)
         return artifact
 
@@ -308,15 +411,18 @@ class Artifact(Result):
         to_type = transform.ModelType.from_view_type(qiime2.Metadata)
         return from_type.has_transformation(to_type)
 
-    def validate(self, level='max'):
+    def validate(self, level='max', checksum_level='full', paths=None):
         """ Validates the data contents of an artifact
 
+        The artifact's files are first validated against their checksums,
+        see `Result.validate` for `checksum_level` and `paths`.
+
         Raises
         ------
         ValidationError
             If the artifact is invalid at the specified level of validation.
         """
-        super().validate()
+        super().validate(checksum_level=checksum_level, paths=paths)
 
         self.format.validate(self.view(self.format), level)
 
@@ -330,10 +436,10 @@ class Visualization(Result):
 
     @classmethod
     def _from_data_dir(cls, data_dir, provenance_capture):
-        # shutil.copytree doesn't allow the destination directory to exist.
+        # The data is hashed while it is copied, so that it is only read once.
         def data_initializer(destination):
-            return distutils.dir_util.copy_tree(
-                str(data_dir), str(destination))
+            provenance_capture.data_checksums.update(
+                util.copy_tree_with_md5sum(data_dir, destination))
 
         viz = cls.__new__(cls)
         viz._archiver = archive.Archiver.from_data(
@@ -361,4 +467,6 @@ class Visualization(Result):
 
     def _repr_html_(self):
         from qiime2.jupyter import make_html
-        return make_html(str(self._archiver.path))
+        # The notebook server reads straight from the extracted (or served)
+        # archive.
+        return make_html(str(self._archiver.root_dir.parent))
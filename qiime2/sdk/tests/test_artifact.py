@@ -10,6 +10,7 @@ import collections
 import os
 import tempfile
 import unittest
+import unittest.mock
 import uuid
 import pathlib
 import pkg_resources
@@ -23,6 +24,7 @@ from qiime2.sdk import Artifact
 from qiime2.sdk.result import ResultMetadata
 from qiime2.plugin.model import ValidationError
 import qiime2.core.archive as archive
+import qiime2.core.util as util
 
 from qiime2.core.testing.format import IntSequenceFormat
 from qiime2.core.testing.type import IntSequence1, FourInts, Mapping, SingleInt
@@ -444,6 +446,107 @@ class TestArtifact(unittest.TestCase, ArchiveTestingMixin):
         self.assertIsInstance(artifact.uuid, uuid.UUID)
         self.assertEqual(artifact.view(list), [42, 41, 43, 40])
 
+    def count_binary_reads(self, import_data):
+        # Counts how many times each file was read, by hashing or copying it
+        # (format validation reads files as text). Opening a file without
+        # reading it (e.g. to attempt a reflink) doesn't count.
+        reads = collections.Counter()
+        real_open = open
+
+        class CountingReader:
+            def __init__(self, fh, path):
+                self._fh = fh
+                self._path = path
+                self._counted = False
+
+            def __getattr__(self, name):
+                return getattr(self._fh, name)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return self._fh.__exit__(*exc_info)
+
+            def _count(self, size):
+                if size and not self._counted:
+                    self._counted = True
+                    reads[self._path] += 1
+
+            def read(self, *args):
+                data = self._fh.read(*args)
+                self._count(len(data))
+                return data
+
+            def readinto(self, buffer):
+                size = self._fh.readinto(buffer)
+                self._count(size)
+                return size
+
+        def counting_open(file, mode='r', *args, **kwargs):
+            fh = real_open(file, mode, *args, **kwargs)
+            if mode == 'rb':
+                return CountingReader(fh, os.path.realpath(str(file)))
+            return fh
+
+        with unittest.mock.patch('builtins.open', side_effect=counting_open):
+            artifact = import_data()
+        return artifact, reads
+
+    def assertChecksumsMatchManifest(self, artifact):
+        action = artifact.provenance.root.action_yaml['action']
+        manifest = {os.path.join('data', entry['name']): entry['md5sum']
+                    for entry in action['manifest']}
+        with (artifact._archiver.root_dir / 'checksums.md5').open() as fh:
+            checksums = dict(util.from_checksum_format(line)
+                             for line in fh.read().splitlines())
+        self.assertEqual({relpath: checksum for relpath, checksum in
+                          checksums.items() if relpath.startswith('data')},
+                         manifest)
+
+    def test_import_data_reads_data_once(self):
+        data_dir = os.path.join(self.test_dir.name, 'test')
+        os.mkdir(data_dir)
+        for idx, name in enumerate(['file1.txt', 'file2.txt']):
+            with open(os.path.join(data_dir, name), 'w') as fh:
+                fh.write('%d\n' % idx)
+        os.mkdir(os.path.join(data_dir, 'nested'))
+        for idx, name in enumerate(['file3.txt', 'file4.txt']):
+            with open(os.path.join(data_dir, 'nested', name), 'w') as fh:
+                fh.write('%d\n' % idx)
+
+        artifact, reads = self.count_binary_reads(
+            lambda: Artifact.import_data(FourInts, data_dir))
+
+        # The imported files are hashed once for the manifest, and once more
+        # while being copied into the archive, whose copies aren't read.
+        data_dir = os.path.realpath(data_dir)
+        self.assertEqual(
+            {fp: count for fp, count in reads.items()
+             if fp.startswith(data_dir)},
+            {os.path.join(data_dir, 'file1.txt'): 2,
+             os.path.join(data_dir, 'file2.txt'): 2,
+             os.path.join(data_dir, 'nested', 'file3.txt'): 2,
+             os.path.join(data_dir, 'nested', 'file4.txt'): 2})
+        archive_data = os.path.realpath(str(artifact._archiver.data_dir))
+        self.assertFalse(any(fp.startswith(archive_data) for fp in reads))
+        self.assertChecksumsMatchManifest(artifact)
+        artifact.validate(level='max')
+
+    def test_import_data_reads_single_file_once(self):
+        fp = os.path.join(self.test_dir.name, 'ints.txt')
+        with open(fp, 'w') as fh:
+            fh.write('1\n2\n3\n')
+
+        artifact, reads = self.count_binary_reads(
+            lambda: Artifact.import_data(IntSequence1, fp))
+
+        self.assertEqual(reads[os.path.realpath(fp)], 2)
+        archive_data = os.path.realpath(str(artifact._archiver.data_dir))
+        self.assertFalse(any(fp.startswith(archive_data) for fp in reads))
+        self.assertChecksumsMatchManifest(artifact)
+        artifact.validate(level='max')
+
     def test_eq_identity(self):
         artifact = Artifact.import_data(FourInts, [-1, 42, 0, 43])
 
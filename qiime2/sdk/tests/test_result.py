@@ -6,9 +6,13 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import io
 import os
+import shutil
 import tempfile
+import threading
 import unittest
+import unittest.mock
 import pathlib
 
 import qiime2.core.type
@@ -64,6 +68,43 @@ class TestResult(unittest.TestCase, ArchiveTestingMixin):
         self.assertEqual(artifact.uuid, saved_artifact.uuid)
         self.assertEqual(artifact.view(list), [-1, 42, 0, 43])
 
+    def test_load_artifact_lazy(self):
+        saved_artifact = Artifact.import_data(FourInts, [-1, 42, 0, 43])
+        fp = os.path.join(self.test_dir.name, 'artifact.qza')
+        saved_artifact.save(fp)
+
+        artifact = Result.load(fp, lazy=True)
+
+        self.assertIsInstance(artifact, Artifact)
+        self.assertEqual(artifact.type, FourInts)
+        self.assertEqual(artifact.uuid, saved_artifact.uuid)
+        self.assertEqual(artifact.view(list), [-1, 42, 0, 43])
+        artifact.validate()
+
+    def test_load_artifact_from_memory(self):
+        saved_artifact = Artifact.import_data(FourInts, [-1, 42, 0, 43])
+        buffer = io.BytesIO()
+        saved_artifact.save(buffer)
+        data = buffer.getvalue()
+
+        for source in (data, bytearray(data), memoryview(data),
+                       io.BytesIO(data)):
+            for lazy in (False, True):
+                artifact = Result.load(source, lazy=lazy, workers=2)
+
+                self.assertIsInstance(artifact, Artifact)
+                self.assertEqual(artifact.uuid, saved_artifact.uuid)
+                self.assertEqual(artifact.view(list), [-1, 42, 0, 43])
+                artifact.validate()
+
+    def test_load_invalid_buffer(self):
+        with self.assertRaisesRegex(ValueError,
+                                    'Buffer is not a QIIME archive'):
+            Result.load(b'not a zip file')
+
+        with self.assertRaisesRegex(ValueError, 'is not a QIIME archive'):
+            Result.load(io.BytesIO(b'not a zip file'))
+
     def test_load_visualization(self):
         saved_visualization = Visualization._from_data_dir(
              self.data_dir, self.make_provenance_capture())
@@ -141,6 +182,21 @@ class TestResult(unittest.TestCase, ArchiveTestingMixin):
         self.assertEqual(metadata.uuid, str(artifact.uuid))
         self.assertEqual(metadata.format, 'FourIntsDirectoryFormat')
 
+    def test_peek_artifact_from_memory(self):
+        artifact = Artifact.import_data(FourInts, [0, 0, 42, 1000])
+        buffer = io.BytesIO()
+        artifact.save(buffer)
+
+        with unittest.mock.patch('tempfile.mkdtemp') as mkdtemp:
+            metadata = Result.peek(buffer.getvalue())
+            self.assertEqual(Result.peek(buffer), metadata)
+        mkdtemp.assert_not_called()
+
+        self.assertIsInstance(metadata, ResultMetadata)
+        self.assertEqual(metadata.type, 'FourInts')
+        self.assertEqual(metadata.uuid, str(artifact.uuid))
+        self.assertEqual(metadata.format, 'FourIntsDirectoryFormat')
+
     def test_peek_visualization(self):
         visualization = Visualization._from_data_dir(
              self.data_dir, self.make_provenance_capture())
@@ -154,6 +210,40 @@ class TestResult(unittest.TestCase, ArchiveTestingMixin):
         self.assertEqual(metadata.uuid, str(visualization.uuid))
         self.assertIsNone(metadata.format)
 
+    def test_peek_many(self):
+        artifact = Artifact.import_data(FourInts, [0, 0, 42, 1000])
+        artifact_fp = artifact.save(
+            os.path.join(self.test_dir.name, 'artifact.qza'))
+        visualization = Visualization._from_data_dir(
+            self.data_dir, self.make_provenance_capture())
+        visualization_fp = visualization.save(
+            os.path.join(self.test_dir.name, 'visualization.qzv'))
+        missing_fp = os.path.join(self.test_dir.name, 'missing.qza')
+        invalid_fp = os.path.join(self.test_dir.name, 'invalid.qza')
+        with open(invalid_fp, 'w') as fh:
+            fh.write('not a zip file')
+
+        filepaths = [artifact_fp, visualization_fp, missing_fp, invalid_fp]
+        for processes in (False, True):
+            results = {r.filepath: r for r in Result.peek_many(
+                iter(filepaths), workers=2, processes=processes)}
+
+            self.assertEqual(set(results), set(filepaths))
+            self.assertEqual(
+                results[artifact_fp].metadata,
+                ResultMetadata(str(artifact.uuid), 'FourInts',
+                               'FourIntsDirectoryFormat'))
+            self.assertIsNone(results[artifact_fp].error)
+            self.assertEqual(
+                results[visualization_fp].metadata,
+                ResultMetadata(str(visualization.uuid), 'Visualization',
+                               None))
+            self.assertIsNone(results[visualization_fp].error)
+
+            for fp in (missing_fp, invalid_fp):
+                self.assertIsNone(results[fp].metadata)
+                self.assertIsInstance(results[fp].error, ValueError)
+
     def test_save_artifact_auto_extension(self):
         artifact = Artifact.import_data(FourInts, [0, 0, 42, 1000])
 
@@ -178,6 +268,54 @@ class TestResult(unittest.TestCase, ArchiveTestingMixin):
 
         self.assertEqual(obs_filename, 'artifact.qza')
 
+    def test_save_load_artifact_as_directory(self):
+        artifact = Artifact.import_data(FourInts, [-1, 42, 0, 43])
+        fp = os.path.join(self.test_dir.name, 'artifact')
+
+        obs_fp = artifact.save(fp, as_directory=True)
+
+        self.assertEqual(obs_fp, fp)
+        self.assertTrue(os.path.isdir(fp))
+        self.assertEqual(Artifact.peek(fp).uuid, str(artifact.uuid))
+        loaded = Artifact.load(fp)
+        self.assertEqual(loaded.uuid, artifact.uuid)
+        self.assertEqual(loaded.view(list), [-1, 42, 0, 43])
+        loaded.validate(level='max')
+
+    def test_save_artifact_to_file_object(self):
+        artifact = Artifact.import_data(FourInts, [-1, 42, 0, 43])
+        fp = os.path.join(self.test_dir.name, 'artifact.qza')
+
+        with open(fp, 'wb') as fh:
+            obs = artifact.save(fh)
+            self.assertIs(obs, fh)
+
+        loaded = Artifact.load(fp)
+        self.assertEqual(loaded.uuid, artifact.uuid)
+        self.assertEqual(loaded.view(list), [-1, 42, 0, 43])
+        loaded.validate()
+
+    def test_save_artifact_to_unseekable_stream(self):
+        artifact = Artifact.import_data(FourInts, [-1, 42, 0, 43])
+        fp = os.path.join(self.test_dir.name, 'artifact.qza')
+
+        for workers in (1, 2):
+            read_fd, write_fd = os.pipe()
+            with open(read_fd, 'rb') as reader, open(fp, 'wb') as out:
+                # Drain the pipe concurrently so that the writer never blocks
+                drain = threading.Thread(
+                    target=shutil.copyfileobj, args=(reader, out))
+                drain.start()
+                with open(write_fd, 'wb') as writer:
+                    self.assertFalse(writer.seekable())
+                    artifact.save(writer, workers=workers)
+                drain.join()
+
+            loaded = Artifact.load(fp)
+            self.assertEqual(loaded.uuid, artifact.uuid)
+            self.assertEqual(loaded.view(list), [-1, 42, 0, 43])
+            loaded.validate()
+
     def test_save_visualization_auto_extension(self):
         visualization = Visualization._from_data_dir(
              self.data_dir, self.make_provenance_capture())
@@ -236,6 +374,20 @@ class TestResult(unittest.TestCase, ArchiveTestingMixin):
                                     r'extra\.file'):
             artifact.validate()
 
+    def test_validate_artifact_checksum_levels(self):
+        artifact = Artifact.import_data('IntSequence1', [1, 2, 3, 4])
+        data_fp = artifact._archiver.data_dir / 'ints.txt'
+        data_fp.write_text('1\n2\n3\n5\n')
+
+        artifact.validate(checksum_level='structure')
+        artifact.validate(paths=['provenance'])
+        with self.assertRaisesRegex(exceptions.ValidationError,
+                                    r'Changed files:\n.*data/ints\.txt'):
+            artifact.validate(checksum_level='full', paths=['data'])
+        with self.assertRaisesRegex(exceptions.ValidationError,
+                                    r'data/ints\.txt'):
+            artifact.validate(checksum_level='sample')
+
     def test_validate_vizualization_good(self):
         visualization = Visualization._from_data_dir(
              self.data_dir, self.make_provenance_capture())
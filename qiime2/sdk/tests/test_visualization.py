@@ -9,6 +9,7 @@
 import os
 import tempfile
 import unittest
+import unittest.mock
 import uuid
 import collections
 import pathlib
@@ -17,6 +18,7 @@ import qiime2.core.type
 from qiime2.sdk import Visualization
 from qiime2.sdk.result import ResultMetadata
 import qiime2.core.archive as archive
+import qiime2.core.util as util
 
 from qiime2.core.testing.visualizer import (
     mapping_viz, most_common_viz, multi_html_viz)
@@ -68,6 +70,20 @@ class TestVisualization(unittest.TestCase, ArchiveTestingMixin):
         self.assertEqual(visualization.type, qiime2.core.type.Visualization)
         self.assertIsInstance(visualization.uuid, uuid.UUID)
 
+    def test_from_data_dir_hashes_while_copying(self):
+        with unittest.mock.patch('qiime2.core.util.checksum',
+                                 side_effect=util.checksum) as checksum:
+            visualization = Visualization._from_data_dir(
+                self.data_dir, self.make_provenance_capture())
+
+        root_dir = visualization._archiver.root_dir
+        hashed = {os.path.relpath(str(call.args[0]), str(root_dir))
+                  for call in checksum.call_args_list}
+        self.assertNotIn('data/index.html', hashed)
+        self.assertNotIn('data/css/style.css', hashed)
+        self.assertEqual(visualization._archiver.validate_checksums(),
+                         ({}, {}, {}))
+
     def test_from_data_dir_and_save(self):
         fp = os.path.join(self.test_dir.name, 'visualization.qzv')
         visualization = Visualization._from_data_dir(